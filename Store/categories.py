@@ -0,0 +1,48 @@
+# Категории товаров - общие для всех слоев: StoreLogic и расчет цен работают
+# с членами ProductCategory, БД хранит их коды (products.category_id,
+# database.categories), таблицы скидок и снимок StoreLogic индексируются теми
+# же кодами. Модуль не зависит ни от logic, ни от database.
+from enum import Enum
+
+
+class ProductCategory(Enum):
+    ELECTRONICS = "Электроника"
+    CLOTHING = "Одежда"
+    FOOD = "Продукты"
+    BOOKS = "Книги"
+    OTHER = "Другое"
+
+
+# Коды категорий. Коды записаны в БД и снимках - менять их нельзя, новая
+# категория получает следующий свободный код
+CATEGORY_CODES = {
+    ProductCategory.ELECTRONICS: 1,
+    ProductCategory.CLOTHING: 2,
+    ProductCategory.FOOD: 3,
+    ProductCategory.BOOKS: 4,
+    ProductCategory.OTHER: 5,
+}
+CATEGORIES_BY_CODE = {code: category for category, code in CATEGORY_CODES.items()}
+# Наибольший код категории (размер таблиц, индексируемых кодом)
+MAX_CATEGORY_CODE = max(CATEGORY_CODES.values())
+
+
+def to_category(value):
+    """ProductCategory по члену перечисления, имени ('FOOD'), названию ('Продукты') или коду"""
+    if isinstance(value, ProductCategory):
+        return value
+    if isinstance(value, int) and value in CATEGORIES_BY_CODE:
+        return CATEGORIES_BY_CODE[value]
+    try:
+        return ProductCategory[value]
+    except KeyError:
+        pass
+    try:
+        return ProductCategory(value)
+    except ValueError:
+        raise ValueError(f"Неизвестная категория: {value}")
+
+
+def category_code(value) -> int:
+    """Код категории по ProductCategory, имени, названию или коду"""
+    return CATEGORY_CODES[to_category(value)]
@@ -0,0 +1,282 @@
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime, timedelta
+
+from database.archive import ARCHIVE_PATH
+from database.db_manager import DatabaseManager
+from perf.instrumentation import instrumentation
+from logic.costing import FIFO, AVERAGE
+
+# Каталог бинарного снимка StoreLogic (как в main.py)
+SNAPSHOT_PATH = 'snapshot'
+# Каталог локального журнала продаж и поставок (как в main.py)
+JOURNAL_PATH = 'journal'
+
+EXAMPLES = """примеры:
+  python cli.py report financial --days 7
+  python cli.py report sales --snapshot
+  python cli.py export-excel -o exports/store.xlsx
+  python cli.py import-products products.csv
+  python cli.py rebuild-costs --full
+  python cli.py prune-log --keep-days 14
+  python cli.py replay-journal
+  python cli.py archive --keep-days 365 --vacuum
+  python cli.py chain-report summary --store Центр=center/store.db --store Север=north/store.db
+  python cli.py --query-stats stats.json --slow-ms 20 report sales
+"""
+
+
+def read_csv(path):
+    """Прочитать CSV с заголовком в список словарей"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def write_text(text, output):
+    """Вывести текст в файл или в stdout"""
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Сохранено в {output}")
+    else:
+        print(text)
+
+
+def report_snapshot(db, args):
+    """Снимок БД для отчета, если задан --snapshot"""
+    if not args.snapshot:
+        return None
+    from database.reporting import ReportingSnapshot
+
+    return ReportingSnapshot(db)
+
+
+def cmd_report(db, args):
+    """Сформировать текстовый отчет"""
+    from database.archive import SalesArchive
+    from reports.inventory_reports import InventoryReports
+
+    reports = InventoryReports(db, report_snapshot(db, args), SalesArchive(ARCHIVE_PATH))
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=args.days)
+    if args.kind == 'sales':
+        text = reports.generate_sales_report(start_date, end_date)
+    elif args.kind == 'financial':
+        text = reports.generate_financial_report(start_date, end_date)
+    else:
+        text = reports.generate_inventory_report()
+    write_text(text, args.output)
+
+
+def cmd_export_excel(db, args):
+    """Экспорт в Excel"""
+    from reports.inventory_reports import InventoryReports
+
+    filename = InventoryReports(db, report_snapshot(db, args)).export_to_excel(args.output)
+    print(f"Данные экспортированы в {filename}")
+
+
+def cmd_import_products(db, args):
+    """Импорт товаров из CSV"""
+    count = db.import_products(read_csv(args.file))
+    print(f"Импортировано товаров: {count}")
+
+
+def cmd_import_customers(db, args):
+    """Импорт клиентов из CSV"""
+    count = db.import_customers(read_csv(args.file))
+    print(f"Импортировано клиентов: {count}")
+
+
+def cmd_rebuild_costs(db, args):
+    """Досчитать или пересчитать себестоимость продаж"""
+    processed = db.update_cost_of_goods(rebuild=args.full, method=args.method)
+    print(f"Рассчитана себестоимость продаж: {processed}")
+
+
+def cmd_rebuild_stats(db, args):
+    """Пересчитать счетчики статистики"""
+    db.rebuild_dashboard_stats()
+    stats = db.get_dashboard_stats()
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
+def cmd_snapshot(db, args):
+    """Обновить бинарный снимок StoreLogic"""
+    from logic.snapshot import restore_store_logic, save_store_logic
+
+    logic = restore_store_logic(args.path, db)
+    save_store_logic(logic, args.path, db)
+    print(f"Снимок сохранен в {args.path}")
+
+
+def cmd_prune_log(db, args):
+    """Очистить старые записи журнала изменений"""
+    deleted = db.prune_change_log(args.keep_days)
+    print(f"Удалено записей журнала: {deleted}")
+
+
+def cmd_replay_journal(db, args):
+    """Записать в БД операции из локального журнала"""
+    from database.journal import OperationJournal, JournalReplayer
+
+    journal = OperationJournal(args.path)
+    applied = JournalReplayer(journal, db, batch_size=args.batch_size).replay()
+    print(f"Записано операций: {applied}, осталось в журнале: {journal.count()}")
+
+
+def cmd_archive(db, args):
+    """Перенести старую историю продаж и поставок в годовые архивы"""
+    from database.archive import SalesArchive
+
+    before = datetime.strptime(args.before, '%Y-%m-%d') if args.before else \
+        datetime.now() - timedelta(days=args.keep_days)
+    moved = SalesArchive(args.path).archive(db, before, args.chunk_size)
+    print(f"Перенесено в архив до {before:%d.%m.%Y}: продаж {moved['sales']}, "
+          f"чеков {moved['receipts']}, поставок {moved['supplies']}")
+    for archive_file in db.get_archive_files():
+        print(f"  {archive_file.year}: {archive_file.file_name}, продаж {archive_file.sales_count} "
+              f"на {archive_file.sales_total:.2f} ₽, поставок {archive_file.supplies_count}")
+    if args.vacuum:
+        db.vacuum()
+        print("VACUUM выполнен")
+
+
+def parse_store(value):
+    """Магазин сети в виде НАЗВАНИЕ=ПУТЬ"""
+    name, sep, path = value.partition('=')
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError(f"ожидается НАЗВАНИЕ=ПУТЬ: {value}")
+    return name, path
+
+
+def cmd_chain_report(db, args):
+    """Сформировать отчет по сети магазинов"""
+    from reports.federation import StoreFederation
+
+    federation = StoreFederation(dict(args.store))
+    if args.kind == 'transfers':
+        text = federation.generate_transfer_report()
+    else:
+        end_date = datetime.now()
+        text = federation.generate_chain_report(end_date - timedelta(days=args.days), end_date)
+    write_text(text, args.output)
+
+
+def cmd_vacuum(db, args):
+    """Сжать файл БД"""
+    db.vacuum()
+    print("VACUUM выполнен")
+
+
+def build_parser():
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Пакетные операции магазина без графического интерфейса",
+        epilog=EXAMPLES,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--db', default='store.db', help="путь к файлу БД (по умолчанию store.db)")
+    parser.add_argument('--timing', action='store_true', help="вывести время выполнения")
+    parser.add_argument('--query-stats', metavar='FILE',
+                        help="собрать статистику запросов к БД и сохранить в JSON")
+    parser.add_argument('--slow-ms', type=float,
+                        help="порог медленного запроса в мс (журнал slow_queries.log; "
+                             "включает учет запросов и без --query-stats)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    report = commands.add_parser('report', help="текстовый отчет")
+    report.add_argument('kind', choices=['sales', 'inventory', 'financial'])
+    report.add_argument('--days', type=int, default=30, help="период в днях (по умолчанию 30)")
+    report.add_argument('-o', '--output', help="файл для сохранения отчета")
+    report.add_argument('--snapshot', action='store_true',
+                        help="читать снимок БД (не мешает работающим кассам)")
+    report.set_defaults(handler=cmd_report)
+
+    export = commands.add_parser('export-excel', help="экспорт данных в Excel")
+    export.add_argument('-o', '--output', default='store_report.xlsx')
+    export.add_argument('--snapshot', action='store_true',
+                        help="читать снимок БД (не мешает работающим кассам)")
+    export.set_defaults(handler=cmd_export_excel)
+
+    products = commands.add_parser('import-products',
+                                   help="импорт товаров из CSV (name,category,price,quantity,min_stock,barcode)")
+    products.add_argument('file')
+    products.set_defaults(handler=cmd_import_products)
+
+    customers = commands.add_parser('import-customers', help="импорт клиентов из CSV (name,phone,email,discount)")
+    customers.add_argument('file')
+    customers.set_defaults(handler=cmd_import_customers)
+
+    costs = commands.add_parser('rebuild-costs', help="расчет себестоимости продаж")
+    costs.add_argument('--full', action='store_true', help="пересчитать всю историю")
+    costs.add_argument('--method', choices=[FIFO, AVERAGE],
+                       help="сменить метод оценки (сохраняется; по умолчанию - текущий)")
+    costs.set_defaults(handler=cmd_rebuild_costs)
+
+    stats = commands.add_parser('rebuild-stats', help="пересчет счетчиков статистики")
+    stats.set_defaults(handler=cmd_rebuild_stats)
+
+    snapshot = commands.add_parser('snapshot', help="обновить снимок StoreLogic")
+    snapshot.add_argument('--path', default=SNAPSHOT_PATH)
+    snapshot.set_defaults(handler=cmd_snapshot)
+
+    prune = commands.add_parser('prune-log', help="очистить журнал изменений")
+    prune.add_argument('--keep-days', type=int, default=7)
+    prune.set_defaults(handler=cmd_prune_log)
+
+    replay = commands.add_parser('replay-journal', help="записать в БД операции из локального журнала")
+    replay.add_argument('--path', default=JOURNAL_PATH)
+    replay.add_argument('--batch-size', type=int, default=1000)
+    replay.set_defaults(handler=cmd_replay_journal)
+
+    archive = commands.add_parser('archive', help="перенести старую историю в годовые архивы")
+    archive.add_argument('--keep-days', type=int, default=365,
+                         help="сколько дней истории оставить в рабочей БД (по умолчанию 365)")
+    archive.add_argument('--before', metavar='ГГГГ-ММ-ДД', help="перенести всё раньше этой даты")
+    archive.add_argument('--path', default=ARCHIVE_PATH)
+    archive.add_argument('--chunk-size', type=int, default=5000, help="строк за одну транзакцию")
+    archive.add_argument('--vacuum', action='store_true', help="сжать рабочую БД после переноса")
+    archive.set_defaults(handler=cmd_archive)
+
+    chain = commands.add_parser('chain-report', help="отчет по нескольким магазинам сети")
+    chain.add_argument('kind', choices=['summary', 'transfers'])
+    chain.add_argument('--store', type=parse_store, action='append', required=True, metavar='НАЗВАНИЕ=ПУТЬ',
+                       help="БД магазина (можно указать несколько раз)")
+    chain.add_argument('--days', type=int, default=30, help="период в днях (по умолчанию 30)")
+    chain.add_argument('-o', '--output', help="файл для сохранения отчета")
+    # Магазины задаются --store; --db не открывается (и не мигрируется)
+    chain.set_defaults(handler=cmd_chain_report, open_db=False)
+
+    vacuum = commands.add_parser('vacuum', help="сжать файл БД")
+    vacuum.set_defaults(handler=cmd_vacuum)
+    return parser
+
+
+def main(argv=None):
+    """Точка входа: выполнить команду и вернуть код завершения"""
+    args = build_parser().parse_args(argv)
+    started = time.perf_counter()
+    if args.query_stats or args.slow_ms is not None:
+        instrumentation.enable(slow_ms=args.slow_ms, slow_log='slow_queries.log',
+                               export_path=args.query_stats)
+    db = DatabaseManager(args.db) if getattr(args, 'open_db', True) else None
+    try:
+        args.handler(db, args)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.timing:
+            print(f"Время выполнения: {time.perf_counter() - started:.2f} с", file=sys.stderr)
+        if args.query_stats:
+            instrumentation.export_json()
+            print(instrumentation.report(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+# Архив истории: продажи (вместе с себестоимостью), чеки и поставки старше
+# горизонта переносятся из рабочей БД в годовые файлы archive/store-<год>.db.
+# Рабочая БД остается маленькой, а итоги панели статистики не меняются:
+# перенесенные суммы учитываются в таблице archive_files. Отчеты за старые
+# периоды подключают нужные годовые файлы (ATTACH) и читают рабочую БД и
+# архивы как одну таблицу.
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from database.models import Base, ArchiveFile
+from database.migrations import convert_money_columns
+from logic.money import from_minor
+
+ARCHIVE_PATH = 'archive'
+# Таблицы, строки которых переносятся в архив
+ARCHIVED_TABLES = ('sales', 'sale_costs', 'receipts', 'supplies')
+
+# Строка с наибольшим ID всегда остается в рабочей БД: без неё SQLite
+# выдал бы новым строкам ID, уже занятые в архиве.
+# Продажа переносится, только если её себестоимость уже посчитана
+_SALES_WHERE = ("date >= :start AND date < :end AND id <= :upto "
+                "AND id < (SELECT MAX(id) FROM main.sales) "
+                "AND id IN (SELECT sale_id FROM main.sale_costs)")
+# Поставка переносится, только если она уже учтена в слоях себестоимости
+_SUPPLIES_WHERE = ("date >= :start AND date < :end AND id <= :upto "
+                   "AND id < (SELECT MAX(id) FROM main.supplies) AND id <= :last_supply_id")
+# Чек переносится вместе с последней своей продажей
+_RECEIPTS_WHERE = ("date >= :start AND date < :end AND id <= :upto "
+                   "AND id < (SELECT MAX(id) FROM main.receipts) "
+                   "AND NOT EXISTS (SELECT 1 FROM main.sales WHERE sales.receipt_id = receipts.id)")
+
+
+def _sql_date(value):
+    """Дата в формате, в котором SQLAlchemy хранит DateTime в SQLite"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _columns(table):
+    return ', '.join(column.name for column in Base.metadata.tables[table].columns)
+
+
+class SalesArchive:
+    """Годовые файлы архива истории продаж и поставок"""
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        # Файлы, уже приведенные к текущей схеме (см. _prepare_file)
+        self._prepared = set()
+
+    def file_path(self, year):
+        """Файл архива за год"""
+        return os.path.join(self.path, f'store-{year}.db')
+
+    def archive(self, db, before, chunk_size=5000):
+        """Перенести в архив продажи, чеки и поставки раньше before.
+
+        Переносятся только строки, уже учтенные в себестоимости (перед
+        переносом она досчитывается). Каждая порция переносится одной
+        транзакцией, общей для рабочей БД и годового файла. Возвращает
+        число перенесенных строк по таблицам.
+        """
+        db.update_cost_of_goods()
+        last_supply_id, _ = db.get_costing_checkpoint()
+        moved = {'sales': 0, 'receipts': 0, 'supplies': 0}
+        for year in self._pending_years(db, before, last_supply_id):
+            self._prepare_file(year)
+            while True:
+                counts = self._move_chunk(db, year, before, last_supply_id, chunk_size)
+                if not any(counts.values()):
+                    break
+                for table, count in counts.items():
+                    moved[table] += count
+        return moved
+
+    @contextmanager
+    def reading(self, db, start_date=None, end_date=None):
+        """Чтение истории за период вместе с архивом.
+
+        Если период захватывает архивные годы, их файлы подключаются к
+        соединению чтения, а временные представления sales, sale_costs,
+        receipts и supplies объединяют рабочую БД с архивами - запросы
+        сессий db.Session() внутри блока видят всю историю.
+        """
+        files = [
+            archive_file for archive_file in db.get_archive_files()
+            if (start_date is None or archive_file.last_date is None or archive_file.last_date >= start_date)
+            and (end_date is None or archive_file.first_date is None or archive_file.first_date <= end_date)
+        ]
+        if not files:
+            yield db
+            return
+        attach = {}
+        for archive_file in files:
+            path = os.path.join(self.path, archive_file.file_name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Нет файла архива за {archive_file.year} год: {path}")
+            self._prepare_file(archive_file.year)
+            attach[f'archive_{archive_file.year}'] = path
+        setup = []
+        for table in ARCHIVED_TABLES:
+            columns = _columns(table)
+            parts = [f"SELECT {columns} FROM main.{table}"]
+            parts += [f"SELECT {columns} FROM {schema}.{table}" for schema in attach]
+            setup.append(f"CREATE TEMP VIEW {table} AS " + " UNION ALL ".join(parts))
+        with db.read_group(attach, setup):
+            yield db
+
+    def _prepare_file(self, year):
+        """Создать файл архива за год или привести существующий к текущей схеме"""
+        path = self.file_path(year)
+        if path in self._prepared:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        engine = create_engine(f'sqlite:///{path}')
+        try:
+            Base.metadata.create_all(engine, tables=[Base.metadata.tables[table] for table in ARCHIVED_TABLES])
+            with engine.connect() as connection:
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                # Файлы, созданные до перехода на суммы в копейках (database.money)
+                convert_money_columns(connection, ARCHIVED_TABLES)
+                # Архив читается только отчетами за период
+                connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_archive_sales_date ON sales (date)")
+                connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_archive_supplies_date ON supplies (date)")
+                connection.commit()
+        finally:
+            engine.dispose()
+        self._prepared.add(path)
+
+    @staticmethod
+    def _pending_years(db, before, last_supply_id):
+        params = {'start': '', 'end': _sql_date(before), 'upto': 2 ** 62, 'last_supply_id': last_supply_id}
+        year = "CAST(strftime('%Y', date) AS INTEGER)"
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql(
+                f"SELECT {year} FROM main.sales WHERE {_SALES_WHERE} "
+                f"UNION SELECT {year} FROM main.supplies WHERE {_SUPPLIES_WHERE} "
+                f"UNION SELECT {year} FROM main.receipts WHERE {_RECEIPTS_WHERE}",
+                params
+            )
+            return sorted(row[0] for row in rows if row[0] is not None)
+
+    def _move_chunk(self, db, year, before, last_supply_id, chunk_size):
+        """Перенести порцию строк за год; возвращает число строк по таблицам"""
+        params = {
+            'start': _sql_date(datetime(year, 1, 1)),
+            'end': _sql_date(min(before, datetime(year + 1, 1, 1))),
+            'last_supply_id': last_supply_id,
+            'upto': 2 ** 62,
+            'limit': chunk_size,
+        }
+        with db.write_group(attach={'archive': self.file_path(year)}) as connection:
+            def execute(sql, **extra):
+                return connection.exec_driver_sql(sql, {**params, **extra})
+
+            def chunk_ids(table, where):
+                # Порция - первые chunk_size подходящих строк по ID: дальше
+                # условие дополняется "id <= последний ID порции"
+                return [row[0] for row in execute(
+                    f"SELECT id FROM main.{table} WHERE {where} ORDER BY id LIMIT :limit")]
+
+            def copy(table, where, upto):
+                columns = _columns(table)
+                execute(f"INSERT INTO archive.{table} ({columns}) "
+                        f"SELECT {columns} FROM main.{table} WHERE {where}", upto=upto)
+
+            def delete(table, where, upto):
+                execute(f"DELETE FROM main.{table} WHERE {where}", upto=upto)
+
+            def move(table, where, upto):
+                copy(table, where, upto)
+                delete(table, where, upto)
+
+            stats = execute("SELECT total_sales, costed_sales, total_cogs FROM main.store_stats WHERE id = 1").first()
+            dates = []
+
+            sale_ids = chunk_ids('sales', _SALES_WHERE)
+            # Суммы сырыми запросами - в копейках (database.money)
+            sales_total = cogs_total = 0
+            if sale_ids:
+                upto = sale_ids[-1]
+                sales_total, first, last = execute(
+                    f"SELECT COALESCE(SUM(total), 0), MIN(date), MAX(date) FROM main.sales WHERE {_SALES_WHERE}",
+                    upto=upto).first()
+                dates += [first, last]
+                # Себестоимость порции - строки sale_costs продаж, уже скопированных в архив
+                # (условие продаж само опирается на sale_costs, поэтому они удаляются последними)
+                costs = "sale_id IN (SELECT id FROM archive.sales WHERE id <= :upto)"
+                copy('sales', _SALES_WHERE, upto)
+                cogs_total = execute(f"SELECT COALESCE(SUM(cogs), 0) FROM main.sale_costs WHERE {costs}",
+                                     upto=upto).scalar()
+                copy('sale_costs', costs, upto)
+                delete('sales', _SALES_WHERE, upto)
+                delete('sale_costs', costs, upto)
+
+            receipt_ids = chunk_ids('receipts', _RECEIPTS_WHERE)
+            if receipt_ids:
+                dates += execute(f"SELECT MIN(date), MAX(date) FROM main.receipts WHERE {_RECEIPTS_WHERE}",
+                                 upto=receipt_ids[-1]).first()
+                move('receipts', _RECEIPTS_WHERE, receipt_ids[-1])
+
+            supply_ids = chunk_ids('supplies', _SUPPLIES_WHERE)
+            if supply_ids:
+                dates += execute(f"SELECT MIN(date), MAX(date) FROM main.supplies WHERE {_SUPPLIES_WHERE}",
+                                 upto=supply_ids[-1]).first()
+                move('supplies', _SUPPLIES_WHERE, supply_ids[-1])
+
+            counts = {'sales': len(sale_ids), 'receipts': len(receipt_ids), 'supplies': len(supply_ids)}
+            if not any(counts.values()):
+                return counts
+
+            # Триггеры счетчиков учли удаление как отмену продаж - возвращаем
+            # итоги: перенесенные суммы теперь учитываются в archive_files
+            execute("UPDATE main.store_stats SET total_sales = :total_sales, costed_sales = :costed_sales, "
+                    "total_cogs = :total_cogs WHERE id = 1",
+                    total_sales=stats[0], costed_sales=stats[1], total_cogs=stats[2])
+
+            dates = [_parse_date(value) for value in dates if value is not None]
+            with db.Session() as session:
+                archive_file = session.get(ArchiveFile, year)
+                if archive_file is None:
+                    archive_file = ArchiveFile(year=year, file_name=os.path.basename(self.file_path(year)),
+                                               sales_count=0, sales_total=0.0, cogs_total=0.0,
+                                               supplies_count=0, receipts_count=0)
+                    session.add(archive_file)
+                archive_file.first_date = min(dates + ([archive_file.first_date] if archive_file.first_date else []))
+                archive_file.last_date = max(dates + ([archive_file.last_date] if archive_file.last_date else []))
+                archive_file.sales_count += counts['sales']
+                archive_file.sales_total += from_minor(sales_total)
+                archive_file.cogs_total += from_minor(cogs_total)
+                archive_file.receipts_count += counts['receipts']
+                archive_file.supplies_count += counts['supplies']
+                # Таблицы перечитываются целиком - одна запись change_log на таблицу вместо строки на ID
+                db._commit(session, *[(table, 'reload', [0]) for table, count in counts.items() if count])
+            return counts
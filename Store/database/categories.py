@@ -0,0 +1,29 @@
+# Категории товаров в БД: products.category_id - небольшой целый код
+# (categories.CATEGORY_CODES), названия хранятся один раз в таблице
+# categories. В коде категория - член categories.ProductCategory: тип колонки
+# CategoryType переводит его в код при записи и обратно при чтении, поэтому
+# строкам таблиц и отчетам не нужно сопоставлять строки категорий.
+from sqlalchemy.types import SmallInteger, TypeDecorator
+
+from categories import CATEGORIES_BY_CODE, CATEGORY_CODES, category_code
+
+
+def ensure_categories(connection):
+    """Заполнить таблицу categories кодами CATEGORY_CODES (существующие строки не меняются)"""
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO categories (id, name, title) VALUES (?, ?, ?)",
+        [(code, category.name, category.value) for category, code in CATEGORY_CODES.items()]
+    )
+
+
+class CategoryType(TypeDecorator):
+    """Категория товара: SMALLINT-код в БД, ProductCategory в Python"""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else category_code(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else CATEGORIES_BY_CODE[value]
@@ -0,0 +1,60 @@
+import threading
+
+# Таблицы, новые строки которых требуют досчета себестоимости
+COSTED_TABLES = ('sales', 'supplies', 'receipts')
+
+
+class CostOfGoodsUpdater:
+    """Досчет себестоимости на стороне записи.
+
+    Экземпляр подписывается на изменения DatabaseManager: после commit новых
+    продаж или поставок фоновый поток (не чаще раза в delay секунд) вызывает
+    run - по умолчанию db.update_cost_of_goods, в API сервере - через
+    единственного писателя. О досчитанных продажах update_cost_of_goods
+    сам сообщает подписчикам (таблица sale_costs). Отчеты и снимок для отчетов себестоимость только читают и в
+    основную БД не пишут.
+    """
+
+    def __init__(self, db, run=None, delay=1.0):
+        self.db = db
+        self.run = run or db.update_cost_of_goods
+        self.delay = delay
+        self._pending = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Подписаться на изменения и запустить поток; возвращает self.
+
+        Первый досчет выполняется сразу - для продаж, записанных без
+        работающего досчета (другими программами или до запуска).
+        """
+        self.db.add_change_listener(self)
+        self._pending.set()
+        self._thread = threading.Thread(target=self._run, name='cost-updater', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Отписаться, досчитать уже записанное и остановить поток"""
+        self.db.remove_change_listener(self)
+        self._stopped.set()
+        self._pending.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __call__(self, change):
+        if change.action == 'insert' and change.table in COSTED_TABLES:
+            self._pending.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._pending.wait()
+            # Записи, пришедшие за delay, досчитываются одним вызовом
+            self._stopped.wait(self.delay)
+            self._pending.clear()
+            try:
+                self.run()
+            except Exception as e:
+                print(f"Ошибка досчета себестоимости: {e}")
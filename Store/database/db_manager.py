@@ -1,104 +1,218 @@
-import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Enum as SQLAlchemyEnum, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, insert, select, or_, case
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 from datetime import datetime, timedelta
-import enum
+from collections import namedtuple
+from itertools import takewhile
+from categories import category_code, to_category
+from logic.costing import CostLayerEngine, FIFO
+from logic.money import line_total, money_sum, round_money
+from perf.instrumentation import instrumentation
+from database.migrations import migrate
+from database.models import (
+    Base, Product, Customer, Sale, Receipt, Supply, SaleCost, CostingState,
+    ChangeLog, JournalApplied, ArchiveFile, StoreStats,
+)
 
-Base = declarative_base()
+# Триггеры поддерживают store_stats при любой записи (в т.ч. с других терминалов)
+_PRODUCT_STATS = """
+    units_on_hand = units_on_hand {sign} COALESCE({row}.quantity, 0),
+    low_stock = low_stock {sign} (COALESCE({row}.quantity, 0) < COALESCE({row}.min_stock, 0)),
+    out_of_stock = out_of_stock {sign} (COALESCE({row}.quantity, 0) = 0)"""
 
-# Определение перечисления для SQLAlchemy
-class ProductCategoryEnum(enum.Enum):
-    ELECTRONICS = "ELECTRONICS"
-    CLOTHING = "CLOTHING"
-    FOOD = "FOOD"
-    BOOKS = "BOOKS"
-    OTHER = "OTHER"
+STATS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS stats_product_insert AFTER INSERT ON products
+    BEGIN UPDATE store_stats SET {_PRODUCT_STATS.format(sign='+', row='NEW')} WHERE id = 1; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS stats_product_delete AFTER DELETE ON products
+    BEGIN UPDATE store_stats SET {_PRODUCT_STATS.format(sign='-', row='OLD')} WHERE id = 1; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS stats_product_update AFTER UPDATE OF quantity, min_stock ON products
+    BEGIN
+        UPDATE store_stats SET {_PRODUCT_STATS.format(sign='-', row='OLD')} WHERE id = 1;
+        UPDATE store_stats SET {_PRODUCT_STATS.format(sign='+', row='NEW')} WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_sale_insert AFTER INSERT ON sales
+    BEGIN UPDATE store_stats SET total_sales = total_sales + NEW.total WHERE id = 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_sale_delete AFTER DELETE ON sales
+    BEGIN UPDATE store_stats SET total_sales = total_sales - OLD.total WHERE id = 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_sale_update AFTER UPDATE OF total ON sales
+    BEGIN UPDATE store_stats SET total_sales = total_sales - OLD.total + NEW.total WHERE id = 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_cost_insert AFTER INSERT ON sale_costs
+    BEGIN
+        UPDATE store_stats SET total_cogs = total_cogs + NEW.cogs,
+            costed_sales = costed_sales + COALESCE((SELECT total FROM sales WHERE id = NEW.sale_id), 0)
+        WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_cost_delete AFTER DELETE ON sale_costs
+    BEGIN
+        UPDATE store_stats SET total_cogs = total_cogs - OLD.cogs,
+            costed_sales = costed_sales - COALESCE((SELECT total FROM sales WHERE id = OLD.sale_id), 0)
+        WHERE id = 1;
+    END""",
+]
 
-class Product(Base):
-    __tablename__ = 'products'
-    
-    id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    category = Column(SQLAlchemyEnum(ProductCategoryEnum), nullable=False)
-    price = Column(Float, nullable=False)
-    quantity = Column(Integer, default=0)
-    min_stock = Column(Integer, default=10)
-    barcode = Column(String, nullable=True)
-    description = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.now)
-    
-    # Связи
-    sales = relationship("Sale", back_populates="product")
-    supplies = relationship("Supply", back_populates="product")
+# Сколько ID передавать в одном IN (...) при чтении строк по списку
+ID_CHUNK = 5000
 
-class Customer(Base):
-    __tablename__ = 'customers'
-    
-    id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    phone = Column(String, nullable=False)
-    email = Column(String)
-    discount = Column(Float, default=0.0)
-    total_purchases = Column(Float, default=0.0)
-    created_at = Column(DateTime, default=datetime.now)
-    
-    # Связи
-    sales = relationship("Sale", back_populates="customer")
+# Изменение данных: таблица, действие ('insert', 'update', 'delete') и ID строк
+DataChange = namedtuple('DataChange', ['table', 'action', 'ids'])
 
-class Sale(Base):
-    __tablename__ = 'sales'
-    
-    id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
-    customer_id = Column(Integer, ForeignKey('customers.id'))
-    quantity = Column(Integer, nullable=False)
-    price = Column(Float, nullable=False)
-    total = Column(Float, nullable=False)
-    date = Column(DateTime, default=datetime.now)
-    
-    # Связи
-    product = relationship("Product", back_populates="sales", foreign_keys=[product_id])
-    customer = relationship("Customer", back_populates="sales", foreign_keys=[customer_id])
+def _sqlite_lower(value):
+    return value.lower() if isinstance(value, str) else value
 
-class Supply(Base):
-    __tablename__ = 'supplies'
-    
-    id = Column(Integer, primary_key=True)
-    supplier = Column(String, nullable=False)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
-    quantity = Column(Integer, nullable=False)
-    cost = Column(Float, nullable=False)
-    date = Column(DateTime, default=datetime.now)
-    
-    # Связи
-    product = relationship("Product", back_populates="supplies", foreign_keys=[product_id])
+def _on_connect(dbapi_connection, connection_record):
+    """Настройка соединения SQLite"""
+    # Встроенная lower() понимает только ASCII - для поиска по кириллице
+    # подменяем её на питоновскую
+    dbapi_connection.create_function('lower', 1, _sqlite_lower, deterministic=True)
 
+@instrumentation.register
 class DatabaseManager:
     def __init__(self, db_path='store.db'):
-        self.engine = create_engine(f'sqlite:///{db_path}')
+        self.engine = create_engine(f'sqlite:///{db_path}', **instrumentation.engine_options())
+        event.listen(self.engine, 'connect', _on_connect)
+        # Статистика запросов, если включена (perf.instrumentation)
+        instrumentation.attach(self.engine)
         Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        migrate(self.engine)
+        self._session_factory = sessionmaker(bind=self.engine)
+        # Соединение общей транзакции группы записей (см. write_group) - по потокам
+        self._write_group = threading.local()
+        # Соединение чтения с подключенными БД (см. read_group) - по потокам
+        self._read_group = threading.local()
+        # Движок ценообразования (logic.pricing.PricingEngine), если заданы акции
+        self.pricing = None
+        # Подписчики на изменения данных (вызываются после commit)
+        self._change_listeners = []
+        # Свои записи в change_log помечаются этим ID
+        self.origin = uuid.uuid4().hex
+        # Отдельное соединение для PRAGMA data_version
+        self._version_connection = None
+        self._ensure_dashboard_stats()
+    
+    def Session(self):
+        """Новая сессия БД.
+        
+        Внутри write_group сессия работает в общей транзакции группы: её
+        commit только фиксирует точку сохранения (SAVEPOINT), а откат
+        отменяет изменения одной операции, не затрагивая остальные.
+        """
+        connection = getattr(self._write_group, 'connection', None)
+        if connection is not None:
+            return self._session_factory(bind=connection, join_transaction_mode='create_savepoint')
+        connection = getattr(self._read_group, 'connection', None)
+        if connection is not None:
+            return self._session_factory(bind=connection)
+        return self._session_factory()
+    
+    @staticmethod
+    def _attach(connection, attach):
+        """Подключить к соединению БД {схема: файл} (ATTACH - только вне транзакции)"""
+        for schema, path in (attach or {}).items():
+            connection.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (path,))
+    
+    @contextmanager
+    def write_group(self, attach=None):
+        """Выполнить записи текущего потока одной транзакцией (групповой commit).
+        
+        Методы записи внутри блока фиксируются одним COMMIT при выходе из
+        него; уведомления подписчиков откладываются до этого COMMIT. Если
+        COMMIT не удался, откатываются все записи группы. attach - {схема:
+        файл} БД, подключаемых к соединению группы: запись в них входит в ту
+        же транзакцию.
+        """
+        with self.engine.connect() as connection:
+            self._attach(connection, attach)
+            # pysqlite сам не открывает транзакцию перед SAVEPOINT - открываем явно;
+            # IMMEDIATE сразу берет блокировку записи
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            self._write_group.connection = connection
+            self._write_group.changes = []
+            try:
+                yield connection
+                connection.commit()
+            finally:
+                changes = self._write_group.changes
+                self._write_group.connection = None
+                self._write_group.changes = None
+                if attach:
+                    # Подключенные БД не должны вернуться в пул вместе с соединением
+                    connection.invalidate()
+        for table, action, ids in changes:
+            self._notify(table, action, *ids)
+    
+    @contextmanager
+    def read_group(self, attach=None, setup=()):
+        """Чтения текущего потока через одно соединение с подключенными БД.
+        
+        attach - {схема: файл} для ATTACH, setup - SQL, выполняемый после
+        подключения (например, временные представления). Соединение в пул не
+        возвращается: подключенные БД и временные объекты уходят вместе с ним.
+        """
+        with self.engine.connect() as connection:
+            try:
+                self._attach(connection, attach)
+                for statement in setup:
+                    connection.exec_driver_sql(statement)
+                connection.commit()
+                self._read_group.connection = connection
+                yield connection
+            finally:
+                self._read_group.connection = None
+                connection.invalidate()
+    
+    def add_change_listener(self, callback):
+        """Подписаться на изменения: callback(DataChange) после каждой записи"""
+        self._change_listeners.append(callback)
+    
+    def remove_change_listener(self, callback):
+        """Отписаться от изменений"""
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+    
+    def _commit(self, session, *changes):
+        """Зафиксировать транзакцию вместе с записями change_log и уведомить подписчиков.
+        
+        changes - кортежи (таблица, действие, ID строк).
+        """
+        rows = [
+            {'table_name': table, 'action': action, 'row_id': row_id,
+             'origin': self.origin, 'created_at': datetime.now()}
+            for table, action, ids in changes for row_id in ids
+        ]
+        if rows:
+            session.execute(insert(ChangeLog), rows)
+        session.commit()
+        self._publish(*changes)
+    
+    def _publish(self, *changes):
+        """Уведомить подписчиков о зафиксированных изменениях (в группе - после её COMMIT)"""
+        group_changes = getattr(self._write_group, 'changes', None)
+        if group_changes is not None:
+            # Группа еще не зафиксирована - уведомим после её COMMIT
+            group_changes.extend(changes)
+            return
+        for table, action, ids in changes:
+            self._notify(table, action, *ids)
+    
+    def _notify(self, table, action, *ids):
+        """Сообщить подписчикам об изменении строк"""
+        change = DataChange(table, action, tuple(ids))
+        for callback in list(self._change_listeners):
+            try:
+                callback(change)
+            except Exception as e:
+                print(f"Ошибка обработчика изменений: {e}")
     
     def add_product(self, name, category, price, quantity, min_stock=10, description=None, barcode=None):
         """Добавить товар"""
         with self.Session() as session:
-            # Преобразуем строку в значение enum
-            try:
-                category_enum = ProductCategoryEnum[category]
-            except KeyError:
-                # Если строка не является именем enum, пробуем найти по значению
-                for enum_member in ProductCategoryEnum:
-                    if enum_member.value == category:
-                        category_enum = enum_member
-                        break
-                else:
-                    raise ValueError(f"Неизвестная категория: {category}")
-            
             product = Product(
                 name=name,
-                category=category_enum,
+                category=to_category(category),
                 price=price,
                 quantity=quantity,
                 min_stock=min_stock,
@@ -106,10 +220,31 @@ class DatabaseManager:
                 description=description
             )
             session.add(product)
-            session.commit()
+            session.flush()
+            self._commit(session, ('products', 'insert', [product.id]))
             session.refresh(product)
             return product
     
+    def import_products(self, records):
+        """Добавить товары пакетом (словари с полями add_product), вернуть количество"""
+        with self.Session() as session:
+            products = [
+                Product(
+                    name=record['name'],
+                    category=to_category(record['category']),
+                    price=float(record['price']),
+                    quantity=int(record.get('quantity') or 0),
+                    min_stock=int(record.get('min_stock') or 10),
+                    barcode=record.get('barcode') or None,
+                    description=record.get('description') or None
+                )
+                for record in records
+            ]
+            session.add_all(products)
+            session.flush()
+            self._commit(session, ('products', 'insert', [p.id for p in products]))
+            return len(products)
+    
     def get_all_products(self):
         """Получить все товары"""
         with self.Session() as session:
@@ -128,15 +263,11 @@ class DatabaseManager:
             if product:
                 for key, value in kwargs.items():
                     if key == 'category':
-                        # Преобразуем строку категории в enum
-                        try:
-                            value = ProductCategoryEnum[value]
-                        except KeyError:
-                            raise ValueError(f"Неизвестная категория: {value}")
+                        value = to_category(value)
                     
                     if hasattr(product, key):
                         setattr(product, key, value)
-                session.commit()
+                self._commit(session, ('products', 'update', [product_id]))
                 return True
         return False
     
@@ -146,10 +277,26 @@ class DatabaseManager:
             product = session.query(Product).filter(Product.id == product_id).first()
             if product:
                 session.delete(product)
-                session.commit()
+                self._commit(session, ('products', 'delete', [product_id]))
                 return True
         return False
     
+    def get_product_records(self, ids=None):
+        """Все колонки товаров кортежами (без объектов ORM); ids - только эти товары"""
+        columns = (Product.id, Product.name, Product.category.label('category'), Product.price,
+                   Product.quantity, Product.min_stock, Product.barcode, Product.description)
+        return self._select_by_ids(select(*columns), Product.id, ids)
+    
+    def _select_by_ids(self, statement, id_column, ids):
+        """Строки запроса, все или по списку ID (частями - число параметров SQLite ограничено)"""
+        if ids is None:
+            return self.select_rows(statement)
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), ID_CHUNK):
+            rows += self.select_rows(statement.where(id_column.in_(ids[start:start + ID_CHUNK])))
+        return rows
+    
     def get_low_stock_products(self):
         """Получить товары с низким запасом"""
         with self.Session() as session:
@@ -165,23 +312,94 @@ class DatabaseManager:
                 discount=discount
             )
             session.add(customer)
-            session.commit()
+            session.flush()
+            self._commit(session, ('customers', 'insert', [customer.id]))
             session.refresh(customer)
             return customer
     
+    def import_customers(self, records):
+        """Добавить клиентов пакетом (словари с полями add_customer), вернуть количество"""
+        with self.Session() as session:
+            customers = [
+                Customer(
+                    name=record['name'],
+                    phone=record['phone'],
+                    email=record.get('email') or None,
+                    discount=float(record.get('discount') or 0.0)
+                )
+                for record in records
+            ]
+            session.add_all(customers)
+            session.flush()
+            self._commit(session, ('customers', 'insert', [c.id for c in customers]))
+            return len(customers)
+    
     def get_all_customers(self):
         """Получить всех клиентов"""
         with self.Session() as session:
             return session.query(Customer).all()
     
+    def get_customer_records(self, ids=None):
+        """Все колонки клиентов кортежами (без объектов ORM); ids - только эти клиенты"""
+        columns = (Customer.id, Customer.name, Customer.phone, Customer.email,
+                   Customer.discount, Customer.total_purchases)
+        return self._select_by_ids(select(*columns), Customer.id, ids)
+    
     def get_customer_by_id(self, customer_id):
         """Получить клиента по ID"""
         with self.Session() as session:
             return session.query(Customer).filter(Customer.id == customer_id).first()
     
-    def record_sale(self, product_id, quantity, customer_id=None):
-        """Записать продажу"""
+    def _sale_total(self, product, customer, quantity):
+        """Сумма продажи с учетом акций и скидки клиента (до копейки, см. database.money)"""
+        if self.pricing is not None:
+            return round_money(self.pricing.price_one(
+                product.price, quantity, product.category,
+                customer.discount if customer else 0.0, product.id
+            ))
+        return line_total(product.price, quantity, customer.discount if customer else 0.0)
+    
+    def _make_sale(self, product, customer, customer_id, quantity, price=None, total=None):
+        """Создать продажу и списать товар (товар и клиент уже в сессии).
+        
+        price и total - цена и сумма, уже рассчитанные на кассе (повтор из
+        журнала); если не заданы, считаются по текущим цене и акциям.
+        """
+        if total is None:
+            total = self._sale_total(product, customer, quantity)
+        
+        # Создаем продажу
+        sale = Sale(
+            product_id=product.id,
+            customer_id=customer_id,
+            quantity=quantity,
+            price=product.price if price is None else price,
+            total=total
+        )
+        
+        # Обновляем количество товара
+        product.quantity -= quantity
+        
+        # Обновляем статистику клиента
+        if customer:
+            customer.total_purchases = round_money(customer.total_purchases + total)
+        return sale
+    
+    def _applied_entry(self, session, key):
+        """Запись journal_applied по ключу идемпотентности (None - операция еще не записана)"""
+        return session.get(JournalApplied, key) if key else None
+    
+    def record_sale(self, product_id, quantity, customer_id=None, key=None):
+        """Записать продажу.
+        
+        key - ключ идемпотентности: продажа с уже записанным ключом
+        (например, повтор из журнала) не создается повторно.
+        """
         with self.Session() as session:
+            applied = self._applied_entry(session, key)
+            if applied is not None:
+                return session.get(Sale, applied.row_id) if applied.row_id else None
+            
             product = session.query(Product).filter(Product.id == product_id).first()
             if not product or product.quantity < quantity:
                 return None
@@ -190,35 +408,149 @@ class DatabaseManager:
             if customer_id:
                 customer = session.query(Customer).filter(Customer.id == customer_id).first()
             
-            # Вычисляем сумму с учетом скидки
-            total = product.price * quantity
-            if customer and customer.discount > 0:
-                total = total * (1 - customer.discount / 100)
+            sale = self._make_sale(product, customer, customer_id, quantity)
+            session.add(sale)
+            session.flush()
+            if key:
+                session.add(JournalApplied(key=key, kind='sale', status='applied', row_id=sale.id))
+            changes = [('sales', 'insert', [sale.id]), ('products', 'update', [product_id])]
+            if customer:
+                changes.append(('customers', 'update', [customer.id]))
+            self._commit(session, *changes)
+            session.refresh(sale)
+            return sale
+    
+    def record_sales_batch(self, items):
+        """Записать пакет продаж одной транзакцией (групповой commit).
+        
+        items - словари product_id, quantity, customer_id. Продажи
+        проверяются по порядку: товар списывается с учетом предыдущих строк
+        пакета. Возвращает для каждой строки словарь продажи или None, если
+        товара нет или не хватает остатка.
+        """
+        with self.Session() as session:
+            product_ids = {item['product_id'] for item in items}
+            customer_ids = {item.get('customer_id') for item in items if item.get('customer_id')}
+            products = {p.id: p for p in session.query(Product).filter(Product.id.in_(product_ids))}
+            customers = {c.id: c for c in session.query(Customer).filter(Customer.id.in_(customer_ids))} \
+                if customer_ids else {}
             
-            # Создаем продажу
-            sale = Sale(
-                product_id=product_id,
-                customer_id=customer_id,
-                quantity=quantity,
-                price=product.price,
-                total=total
+            sales = []
+            for item in items:
+                product = products.get(item['product_id'])
+                quantity = item['quantity']
+                if not product or quantity <= 0 or product.quantity < quantity:
+                    sales.append(None)
+                    continue
+                customer_id = item.get('customer_id')
+                customer = customers.get(customer_id) if customer_id else None
+                sales.append(self._make_sale(product, customer, customer_id, quantity))
+            
+            recorded = [sale for sale in sales if sale is not None]
+            if not recorded:
+                return [None] * len(items)
+            session.add_all(recorded)
+            session.flush()
+            results = [
+                None if sale is None else {
+                    'id': sale.id, 'product_id': sale.product_id, 'customer_id': sale.customer_id,
+                    'quantity': sale.quantity, 'price': sale.price, 'total': sale.total, 'date': sale.date,
+                }
+                for sale in sales
+            ]
+            changes = [
+                ('sales', 'insert', [sale.id for sale in recorded]),
+                ('products', 'update', sorted({sale.product_id for sale in recorded})),
+            ]
+            touched_customers = sorted({sale.customer_id for sale in recorded if sale.customer_id in customers})
+            if touched_customers:
+                changes.append(('customers', 'update', touched_customers))
+            self._commit(session, *changes)
+            return results
+    
+    def price_lines(self, products, quantities, customer=None):
+        """Суммы строк чека с учетом акций и скидки клиента.
+        
+        products - товары или строки с полями id, price, category;
+        customer - клиент или строка с полем discount.
+        """
+        discount = customer.discount if customer else 0.0
+        if self.pricing is not None:
+            result = self.pricing.price_lines(
+                [product.price for product in products], quantities,
+                [category_code(product.category) for product in products],
+                discount, [product.id for product in products]
             )
+            return [round_money(float(total)) for total in result.total]
+        return [line_total(product.price, quantity, discount) for product, quantity in zip(products, quantities)]
+    
+    def record_receipt(self, items, customer_id=None, key=None):
+        """Оформить чек из нескольких строк одной транзакцией.
+        
+        items - словари product_id, quantity. Остаток проверяется по сумме
+        строк с одним товаром; если товара нет или не хватает, чек не
+        оформляется и возвращается None. Строки-продажи вставляются одним
+        пакетным INSERT. key - ключ идемпотентности, как в record_sale.
+        """
+        if not items or any(item['quantity'] <= 0 for item in items):
+            return None
+        with self.Session() as session:
+            applied = self._applied_entry(session, key)
+            if applied is not None:
+                return session.get(Receipt, applied.row_id) if applied.row_id else None
             
-            # Обновляем количество товара
-            product.quantity -= quantity
+            product_ids = {item['product_id'] for item in items}
+            products = {p.id: p for p in session.query(Product).filter(Product.id.in_(product_ids))}
+            demand = {}
+            for item in items:
+                demand[item['product_id']] = demand.get(item['product_id'], 0) + item['quantity']
+            if any(product_id not in products or products[product_id].quantity < quantity
+                   for product_id, quantity in demand.items()):
+                return None
+            
+            customer = None
+            if customer_id:
+                customer = session.query(Customer).filter(Customer.id == customer_id).first()
+            
+            lines = [products[item['product_id']] for item in items]
+            quantities = [item['quantity'] for item in items]
+            totals = self.price_lines(lines, quantities, customer)
             
-            # Обновляем статистику клиента
+            receipt = Receipt(customer_id=customer_id, items_count=len(items), total=money_sum(totals))
+            session.add(receipt)
+            session.flush()
+            
+            now = datetime.now()
+            sale_ids = session.scalars(insert(Sale).returning(Sale.id, sort_by_parameter_order=True), [
+                {'product_id': product.id, 'customer_id': customer_id, 'quantity': quantity,
+                 'price': product.price, 'total': total, 'date': now, 'receipt_id': receipt.id}
+                for product, quantity, total in zip(lines, quantities, totals)
+            ]).all()
+            
+            # Обновляем количество товаров и статистику клиента
+            for product_id, quantity in demand.items():
+                products[product_id].quantity -= quantity
             if customer:
-                customer.total_purchases += total
+                customer.total_purchases = round_money(customer.total_purchases + receipt.total)
+            if key:
+                session.add(JournalApplied(key=key, kind='receipt', status='applied', row_id=receipt.id))
+            session.flush()
             
-            session.add(sale)
-            session.commit()
-            session.refresh(sale)
-            return sale
+            changes = [('receipts', 'insert', [receipt.id]), ('sales', 'insert', sale_ids),
+                       ('products', 'update', sorted(demand))]
+            if customer:
+                changes.append(('customers', 'update', [customer.id]))
+            self._commit(session, *changes)
+            session.refresh(receipt)
+            return receipt
     
-    def add_supply(self, supplier, product_id, quantity, cost):
-        """Добавить поставку"""
+    def add_supply(self, supplier, product_id, quantity, cost, key=None):
+        """Добавить поставку (key - ключ идемпотентности, как в record_sale)"""
         with self.Session() as session:
+            applied = self._applied_entry(session, key)
+            if applied is not None:
+                return session.get(Supply, applied.row_id) if applied.row_id else None
+            
             product = session.query(Product).filter(Product.id == product_id).first()
             if not product:
                 return None
@@ -234,10 +566,103 @@ class DatabaseManager:
             product.quantity += quantity
             
             session.add(supply)
-            session.commit()
+            session.flush()
+            if key:
+                session.add(JournalApplied(key=key, kind='supply', status='applied', row_id=supply.id))
+            self._commit(session, ('supplies', 'insert', [supply.id]),
+                         ('products', 'update', [product_id]))
             session.refresh(supply)
             return supply
     
+    @staticmethod
+    def _journal_product_ids(entry):
+        """Товары, затронутые записью журнала"""
+        payload = entry['payload']
+        if entry['kind'] == 'receipt':
+            return [item['product_id'] for item in payload['items']]
+        return [payload['product_id']]
+    
+    def apply_journal(self, entries):
+        """Применить пакет записей локального журнала одной транзакцией.
+        
+        entries - словари key, kind ('sale', 'receipt' или 'supply'), payload,
+        created_at (см. database.journal). Записи с уже известным ключом
+        пропускаются, поэтому повтор пакета безопасен. Продажа из журнала уже
+        состоялась на кассе, поэтому записывается даже при нехватке остатка и
+        по цене и сумме из записи (price, total строки), если они сохранены;
+        операция по удаленному товару помечается как отклоненная. Возвращает
+        словарь {ключ: 'applied' | 'duplicate' | 'rejected'}.
+        """
+        if not entries:
+            return {}
+        with self.Session() as session:
+            keys = [entry['key'] for entry in entries]
+            known = {row.key for row in session.query(JournalApplied.key).filter(JournalApplied.key.in_(keys))}
+            pending = [entry for entry in entries if entry['key'] not in known]
+            results = {key: 'duplicate' for key in known}
+            
+            product_ids = {product_id for entry in pending for product_id in self._journal_product_ids(entry)}
+            customer_ids = {entry['payload'].get('customer_id') for entry in pending
+                            if entry['kind'] != 'supply' and entry['payload'].get('customer_id')}
+            products = {p.id: p for p in session.query(Product).filter(Product.id.in_(product_ids))} \
+                if product_ids else {}
+            customers = {c.id: c for c in session.query(Customer).filter(Customer.id.in_(customer_ids))} \
+                if customer_ids else {}
+            
+            recorded = []
+            for entry in pending:
+                payload = entry['payload']
+                if entry['key'] in results or \
+                        any(product_id not in products for product_id in self._journal_product_ids(entry)):
+                    results.setdefault(entry['key'], 'rejected')
+                    continue
+                created_at = datetime.fromisoformat(entry['created_at'])
+                if entry['kind'] == 'supply':
+                    product = products[payload['product_id']]
+                    row = Supply(supplier=payload['supplier'], product_id=product.id,
+                                 quantity=payload['quantity'], cost=payload['cost'], date=created_at)
+                    product.quantity += payload['quantity']
+                    sales = []
+                else:
+                    customer_id = payload.get('customer_id')
+                    customer = customers.get(customer_id) if customer_id else None
+                    lines = payload['items'] if entry['kind'] == 'receipt' else [payload]
+                    sales = [self._make_sale(products[line['product_id']], customer, customer_id, line['quantity'],
+                                             line.get('price'), line.get('total'))
+                             for line in lines]
+                    for sale in sales:
+                        sale.date = created_at
+                    if entry['kind'] == 'receipt':
+                        row = Receipt(customer_id=customer_id, items_count=len(sales),
+                                      total=money_sum(sale.total for sale in sales), date=created_at, sales=sales)
+                    else:
+                        row = sales[0]
+                session.add(row)
+                recorded.append((entry, row, sales))
+                results[entry['key']] = 'applied'
+            
+            session.flush()
+            session.add_all([
+                JournalApplied(key=entry['key'], kind=entry['kind'], status='applied', row_id=row.id)
+                for entry, row, sales in recorded
+            ] + [
+                JournalApplied(key=key, kind=kind, status='rejected')
+                for key, kind in {entry['key']: entry['kind'] for entry in pending
+                                  if results[entry['key']] == 'rejected'}.items()
+            ])
+            all_sales = [sale for entry, row, sales in recorded for sale in sales]
+            changes = [change for change in [
+                ('receipts', 'insert', [row.id for entry, row, sales in recorded if entry['kind'] == 'receipt']),
+                ('sales', 'insert', [sale.id for sale in all_sales]),
+                ('supplies', 'insert', [row.id for entry, row, sales in recorded if entry['kind'] == 'supply']),
+                ('products', 'update', sorted({product_id for entry, row, sales in recorded
+                                               for product_id in self._journal_product_ids(entry)})),
+                ('customers', 'update', sorted({sale.customer_id for sale in all_sales
+                                                if sale.customer_id in customers})),
+            ] if change[2]]
+            self._commit(session, *changes)
+            return results
+    
     def get_total_sales_amount(self):
         """Получить общую сумму продаж"""
         with self.Session() as session:
@@ -255,6 +680,11 @@ class DatabaseManager:
         with self.Session() as session:
             return session.query(Sale).order_by(Sale.date.desc()).all()
     
+    def get_sales_after(self, sale_id):
+        """Получить продажи с ID больше заданного (для догрузки снимка)"""
+        with self.Session() as session:
+            return session.query(Sale).filter(Sale.id > sale_id).order_by(Sale.id).all()
+    
     def get_recent_supplies(self, days=30):
         """Получить последние поставки"""
         with self.Session() as session:
@@ -264,4 +694,433 @@ class DatabaseManager:
     def get_all_supplies(self):
         """Получить все поставки"""
         with self.Session() as session:
-            return session.query(Supply).order_by(Supply.date.desc()).all()
\ No newline at end of file
+            return session.query(Supply).order_by(Supply.date.desc()).all()
+    
+    def get_supplies_after(self, supply_id):
+        """Получить поставки с ID больше заданного (для догрузки снимка)"""
+        with self.Session() as session:
+            return session.query(Supply).filter(Supply.id > supply_id).order_by(Supply.id).all()
+    
+    def update_cost_of_goods(self, chunk_size=10000, rebuild=False, method=None):
+        """Досчитать себестоимость новых продаж по слоям поставок.
+        
+        Обрабатываются только строки новее контрольной точки. После каждой
+        порции COGS продаж и состояние слоев фиксируются одной транзакцией.
+        rebuild=True пересчитывает всю историю с начала.
+        
+        method - метод оценки ('fifo' или 'average'). Метод хранится в
+        контрольной точке, и следующие вызовы (в т.ч. из других процессов)
+        продолжают им; None - сохраненный метод (FIFO, если расчета не было).
+        Смена метода пересчитывает историю с начала.
+        
+        Если себестоимость изменилась, подписчики получают изменение таблицы
+        sale_costs (без ID строк и без записи в change_log).
+        """
+        with self.Session() as session:
+            state = session.get(CostingState, 1)
+            if method is None:
+                method = state.method if state is not None else FIFO
+            if not rebuild and state is not None and state.method == method:
+                engine = CostLayerEngine.from_dict(json.loads(state.state))
+            else:
+                # Нет контрольной точки, сменился метод или запрошен пересчет - считаем с начала
+                if session.query(ArchiveFile).count():
+                    raise ValueError("Часть истории перенесена в архив - пересчитать себестоимость с начала нельзя")
+                session.query(SaleCost).delete()
+                engine = CostLayerEngine(method)
+                if state is None:
+                    state = CostingState(id=1)
+                    session.add(state)
+                state.method = method
+                state.state = json.dumps(engine.to_dict())
+            
+            processed = 0
+            while True:
+                supplies = session.query(Supply).filter(
+                    Supply.id > engine.last_supply_id
+                ).order_by(Supply.id).limit(chunk_size).all()
+                sales = session.query(Sale).filter(
+                    Sale.id > engine.last_sale_id
+                ).order_by(Sale.id).limit(chunk_size).all()
+                if not supplies and not sales:
+                    break
+                
+                # Хронологический порядок сохраняется только до конца
+                # самой короткой по времени полной порции. Строки отсекаются
+                # только с хвоста списка по ID: продажа из журнала может иметь
+                # больший ID и более раннюю дату, и пропуск строки в середине
+                # сдвинул бы контрольную точку мимо нее
+                cutoff = min(
+                    (max(row.date for row in rows) for rows in (supplies, sales) if len(rows) == chunk_size),
+                    default=None
+                )
+                fetched = supplies + sales
+                if cutoff is not None:
+                    supplies = list(takewhile(lambda row: row.date <= cutoff, supplies))
+                    sales = list(takewhile(lambda row: row.date <= cutoff, sales))
+                
+                cogs = engine.process(supplies, sales)
+                if cogs:
+                    session.execute(insert(SaleCost), [
+                        {'sale_id': sale_id, 'cogs': value} for sale_id, value in cogs.items()
+                    ])
+                state.state = json.dumps(engine.to_dict())
+                session.commit()
+                processed += len(cogs)
+                # Прочитанные строки больше не нужны - не держим их в сессии
+                for row in fetched:
+                    session.expunge(row)
+            
+            session.commit()
+        if processed or rebuild:
+            self._publish(('sale_costs', 'update', ()))
+        return processed
+    
+    def get_costing_checkpoint(self):
+        """ID последних поставки и продажи, учтенных в себестоимости (0, 0 - расчета не было)"""
+        with self.Session() as session:
+            state = session.get(CostingState, 1)
+            if state is None:
+                return 0, 0
+            engine = CostLayerEngine.from_dict(json.loads(state.state))
+            return engine.last_supply_id, engine.last_sale_id
+    
+    def get_archive_files(self):
+        """Годовые файлы архива истории по возрастанию года"""
+        with self.Session() as session:
+            return session.query(ArchiveFile).order_by(ArchiveFile.year).all()
+    
+    def get_cost_of_goods(self, start_date=None, end_date=None):
+        """Получить себестоимость проданного за период"""
+        with self.Session() as session:
+            query = session.query(func.sum(SaleCost.cogs)).join(Sale, Sale.id == SaleCost.sale_id)
+            if start_date is not None:
+                query = query.filter(Sale.date >= start_date)
+            if end_date is not None:
+                query = query.filter(Sale.date <= end_date)
+            return query.scalar() or 0.0
+    
+    # --- Изменения с других терминалов ---
+    
+    def data_version(self):
+        """PRAGMA data_version: меняется после commit любого другого соединения"""
+        if self._version_connection is None:
+            self._version_connection = self.engine.raw_connection()
+            # Опрос идет из потока интерфейса: при блокировке БД сразу
+            # возвращаем ошибку, следующий опрос повторит проверку
+            self._version_connection.cursor().execute("PRAGMA busy_timeout = 0")
+        cursor = self._version_connection.cursor()
+        try:
+            cursor.execute("PRAGMA data_version")
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+    
+    def get_last_change_id(self):
+        """ID последней записи change_log"""
+        with self.Session() as session:
+            return session.query(func.max(ChangeLog.id)).scalar() or 0
+    
+    def get_changes_after(self, change_id, limit=None):
+        """Записи change_log новее change_id"""
+        with self.Session() as session:
+            query = session.query(
+                ChangeLog.id, ChangeLog.table_name, ChangeLog.action, ChangeLog.row_id, ChangeLog.origin
+            ).filter(ChangeLog.id > change_id).order_by(ChangeLog.id)
+            if limit is not None:
+                query = query.limit(limit)
+            return query.all()
+    
+    def get_changed_row_ids(self, change_id, tables):
+        """ID строк таблиц tables, измененных после записи change_log change_id.
+        
+        Возвращает {таблица: множество ID} или None, если журнал уже не
+        покрывает период (записи новее change_id удалены prune_change_log) -
+        тогда таблицы нужно перечитать целиком.
+        """
+        with self.connect() as connection:
+            first, last = connection.execute(select(func.min(ChangeLog.id), func.max(ChangeLog.id))).one()
+            if last is None:
+                covered = change_id == 0
+            else:
+                covered = first <= change_id + 1 and change_id <= last
+            if not covered:
+                return None
+            changed = {table: set() for table in tables}
+            for table, row_id in connection.execute(
+                    select(ChangeLog.table_name, ChangeLog.row_id).where(
+                        ChangeLog.id > change_id, ChangeLog.table_name.in_(tables))):
+                changed[table].add(row_id)
+            return changed
+    
+    def prune_change_log(self, keep_days=7):
+        """Удалить записи change_log старше keep_days дней.
+        
+        Последняя запись сохраняется всегда: ID журнала не начинаются заново,
+        и по ним видно, покрывает ли журнал период (см. get_changed_row_ids).
+        """
+        with self.Session() as session:
+            newest = session.query(func.max(ChangeLog.id)).scalar()
+            if newest is None:
+                return 0
+            deleted = session.query(ChangeLog).filter(
+                ChangeLog.created_at < datetime.now() - timedelta(days=keep_days),
+                ChangeLog.id < newest
+            ).delete()
+            session.commit()
+            return deleted
+    
+    def vacuum(self):
+        """Сжать файл БД (VACUUM вне транзакции)"""
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql("VACUUM")
+    
+    # --- Статистика панели ---
+    
+    def _ensure_dashboard_stats(self):
+        """Создать триггеры счетчиков и заполнить счетчики для существующей БД"""
+        with self.engine.begin() as connection:
+            for ddl in STATS_TRIGGERS:
+                connection.exec_driver_sql(ddl)
+        with self.Session() as session:
+            if session.get(StoreStats, 1) is None:
+                session.add(StoreStats(id=1))
+                session.commit()
+                self.rebuild_dashboard_stats()
+    
+    def rebuild_dashboard_stats(self):
+        """Пересчитать счетчики статистики по таблицам"""
+        with self.Session() as session:
+            quantity = func.coalesce(Product.quantity, 0)
+            units, low, out = session.query(
+                func.coalesce(func.sum(quantity), 0),
+                func.coalesce(func.sum(case((quantity < func.coalesce(Product.min_stock, 0), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((quantity == 0, 1), else_=0)), 0)
+            ).one()
+            stats = session.get(StoreStats, 1)
+            stats.units_on_hand = units
+            stats.low_stock = low
+            stats.out_of_stock = out
+            stats.total_sales = session.query(func.coalesce(func.sum(Sale.total), 0.0)).scalar()
+            stats.total_cogs, stats.costed_sales = session.query(
+                func.coalesce(func.sum(SaleCost.cogs), 0.0),
+                func.coalesce(func.sum(Sale.total), 0.0)
+            ).join(Sale, Sale.id == SaleCost.sale_id).one()
+            # Продажи в архиве (все с посчитанной себестоимостью) входят в итоги
+            archived_sales, archived_cogs = session.query(
+                func.coalesce(func.sum(ArchiveFile.sales_total), 0.0),
+                func.coalesce(func.sum(ArchiveFile.cogs_total), 0.0)
+            ).one()
+            stats.total_sales += archived_sales
+            stats.costed_sales += archived_sales
+            stats.total_cogs += archived_cogs
+            session.commit()
+    
+    def get_dashboard_stats(self):
+        """Получить показатели панели статистики одним чтением счетчиков.
+        
+        Прибыль считается по продажам с уже рассчитанной себестоимостью
+        (см. update_cost_of_goods).
+        """
+        with self.Session() as session:
+            stats = session.get(StoreStats, 1)
+            return {
+                'total_sales': stats.total_sales,
+                'profit': stats.costed_sales - stats.total_cogs,
+                'units_on_hand': stats.units_on_hand,
+                'low_stock': stats.low_stock,
+                'out_of_stock': stats.out_of_stock,
+            }
+    
+    # --- Чтение кортежами (Core) ---
+    
+    @contextmanager
+    def connect(self):
+        """Соединение для чтения Core-запросами.
+        
+        Внутри write_group или read_group - соединение группы (видны её
+        изменения и подключенные БД), иначе - соединение из пула.
+        """
+        connection = getattr(self._write_group, 'connection', None) or \
+            getattr(self._read_group, 'connection', None)
+        if connection is not None:
+            yield connection
+            return
+        with self.engine.connect() as connection:
+            yield connection
+    
+    def select_rows(self, statement, params=None):
+        """Выполнить запрос select() и вернуть список строк (Row).
+        
+        Row - именованный кортеж только выбранных колонок: без объектов ORM,
+        identity map и отслеживания атрибутов. Типы колонок (Money,
+        CategoryType) применяются как в ORM. Скомпилированный SQL кэшируется
+        движком по структуре запроса, значения (поиск, ID, окно страницы)
+        передаются параметрами - повторные запросы не компилируются заново.
+        """
+        with self.connect() as connection:
+            return connection.execute(statement, params).all()
+    
+    def select_scalar(self, statement, params=None):
+        """Выполнить запрос select() и вернуть первое значение первой строки"""
+        with self.connect() as connection:
+            return connection.execute(statement, params).scalar()
+    
+    # --- Постраничное чтение для таблиц интерфейса ---
+    
+    def _page(self, statement, sort_columns, offset, limit, order_by, descending, tiebreak):
+        """Применить сортировку и окно к запросу страницы и прочитать её"""
+        column = sort_columns.get(order_by)
+        if column is not None:
+            statement = statement.order_by(column.desc() if descending else column.asc())
+        # Уникальный ключ в конце - стабильный порядок между страницами
+        statement = statement.order_by(tiebreak.desc() if descending else tiebreak.asc())
+        return self.select_rows(statement.offset(offset).limit(limit))
+    
+    @staticmethod
+    def _like(text):
+        return f"%{text}%"
+    
+    def _products_query(self, columns, search):
+        statement = select(*columns)
+        if search:
+            statement = statement.where(or_(
+                Product.name.ilike(self._like(search)),
+                Product.barcode.ilike(self._like(search))
+            ))
+        return statement
+    
+    def get_products_page(self, offset=0, limit=200, order_by='id', descending=False, search=None):
+        """Получить страницу товаров (кортежи только нужных колонок)"""
+        status = case(
+            (Product.quantity == 0, 0),
+            (Product.quantity < Product.min_stock, 1),
+            else_=2
+        )
+        sort_columns = {
+            'id': Product.id, 'name': Product.name, 'category': Product.category,
+            'price': Product.price, 'quantity': Product.quantity,
+            'min_stock': Product.min_stock, 'status': status,
+        }
+        statement = self._products_query(self._product_row_columns(), search)
+        return self._page(statement, sort_columns, offset, limit, order_by, descending, Product.id)
+    
+    @staticmethod
+    def _product_row_columns():
+        return (Product.id, Product.name, Product.category.label('category'), Product.price,
+                Product.quantity, Product.min_stock)
+    
+    def get_product_rows(self, ids, search=None):
+        """Получить строки товаров по ID (те же колонки, что в странице)"""
+        return self.select_rows(self._products_query(self._product_row_columns(), search).where(
+            Product.id.in_(ids)))
+    
+    def count_products(self, search=None):
+        """Количество товаров с учетом фильтра"""
+        return self.select_scalar(self._products_query((func.count(Product.id),), search))
+    
+    def _sales_query(self, columns, search, days):
+        statement = select(*columns).select_from(Sale).outerjoin(
+            Product, Product.id == Sale.product_id
+        ).outerjoin(Customer, Customer.id == Sale.customer_id)
+        if days is not None:
+            statement = statement.where(Sale.date >= datetime.now() - timedelta(days=days))
+        if search:
+            statement = statement.where(or_(
+                Product.name.ilike(self._like(search)),
+                Customer.name.ilike(self._like(search))
+            ))
+        return statement
+    
+    def get_sales_page(self, offset=0, limit=200, order_by='date', descending=True, search=None, days=30):
+        """Получить страницу продаж с названием товара и именем клиента"""
+        sort_columns = {
+            'id': Sale.id, 'date': Sale.date, 'product': Product.name,
+            'quantity': Sale.quantity, 'total': Sale.total, 'customer': Customer.name,
+            'receipt': Sale.receipt_id,
+        }
+        statement = self._sales_query(self._sale_row_columns(), search, days)
+        return self._page(statement, sort_columns, offset, limit, order_by, descending, Sale.id)
+    
+    @staticmethod
+    def _sale_row_columns():
+        return (Sale.id, Sale.date, Sale.product_id, Product.name.label('product_name'),
+                Sale.quantity, Sale.total, Sale.customer_id, Customer.name.label('customer_name'),
+                Sale.receipt_id)
+    
+    def get_sale_rows(self, ids, search=None):
+        """Получить строки продаж по ID"""
+        return self.select_rows(self._sales_query(self._sale_row_columns(), search, None).where(
+            Sale.id.in_(ids)))
+    
+    def count_sales(self, search=None, days=30):
+        """Количество продаж с учетом фильтра"""
+        return self.select_scalar(self._sales_query((func.count(Sale.id),), search, days))
+    
+    def _supplies_query(self, columns, search, days):
+        statement = select(*columns).select_from(Supply).outerjoin(
+            Product, Product.id == Supply.product_id
+        )
+        if days is not None:
+            statement = statement.where(Supply.date >= datetime.now() - timedelta(days=days))
+        if search:
+            statement = statement.where(or_(
+                Supply.supplier.ilike(self._like(search)),
+                Product.name.ilike(self._like(search))
+            ))
+        return statement
+    
+    def get_supplies_page(self, offset=0, limit=200, order_by='date', descending=True, search=None, days=30):
+        """Получить страницу поставок с названием товара"""
+        sort_columns = {
+            'id': Supply.id, 'date': Supply.date, 'supplier': Supply.supplier,
+            'product': Product.name, 'quantity': Supply.quantity, 'cost': Supply.cost,
+        }
+        statement = self._supplies_query(self._supply_row_columns(), search, days)
+        return self._page(statement, sort_columns, offset, limit, order_by, descending, Supply.id)
+    
+    @staticmethod
+    def _supply_row_columns():
+        return (Supply.id, Supply.date, Supply.supplier, Supply.product_id,
+                Product.name.label('product_name'), Supply.quantity, Supply.cost)
+    
+    def get_supply_rows(self, ids, search=None):
+        """Получить строки поставок по ID"""
+        return self.select_rows(self._supplies_query(self._supply_row_columns(), search, None).where(
+            Supply.id.in_(ids)))
+    
+    def count_supplies(self, search=None, days=30):
+        """Количество поставок с учетом фильтра"""
+        return self.select_scalar(self._supplies_query((func.count(Supply.id),), search, days))
+    
+    def _customers_query(self, columns, search):
+        statement = select(*columns)
+        if search:
+            statement = statement.where(or_(
+                Customer.name.ilike(self._like(search)),
+                Customer.phone.ilike(self._like(search)),
+                Customer.email.ilike(self._like(search))
+            ))
+        return statement
+    
+    def get_customers_page(self, offset=0, limit=200, order_by='id', descending=False, search=None):
+        """Получить страницу клиентов"""
+        sort_columns = {
+            'id': Customer.id, 'name': Customer.name, 'phone': Customer.phone,
+            'email': Customer.email, 'discount': Customer.discount,
+        }
+        statement = self._customers_query(self._customer_row_columns(), search)
+        return self._page(statement, sort_columns, offset, limit, order_by, descending, Customer.id)
+    
+    @staticmethod
+    def _customer_row_columns():
+        return (Customer.id, Customer.name, Customer.phone, Customer.email, Customer.discount)
+    
+    def get_customer_rows(self, ids, search=None):
+        """Получить строки клиентов по ID"""
+        return self.select_rows(self._customers_query(self._customer_row_columns(), search).where(
+            Customer.id.in_(ids)))
+    
+    def count_customers(self, search=None):
+        """Количество клиентов с учетом фильтра"""
+        return self.select_scalar(self._customers_query((func.count(Customer.id),), search))
@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# Имена файлов в каталоге журнала
+JOURNAL_FILE = 'operations.jsonl'
+REJECTED_FILE = 'rejected.jsonl'
+
+
+class OperationJournal:
+    """Локальный журнал продаж и поставок, не дошедших до основной БД.
+
+    Файл JSON Lines только дописывается: каждая запись сбрасывается на диск
+    (fsync) до возврата из append, поэтому оформленная продажа переживает
+    падение программы. Запись содержит ключ идемпотентности, по которому
+    DatabaseManager.apply_journal не допускает повторного применения.
+    """
+
+    def __init__(self, path='journal'):
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, JOURNAL_FILE)
+        self.rejected_path = os.path.join(path, REJECTED_FILE)
+        self._lock = threading.Lock()
+        self._count = len(self._read())
+
+    def append(self, kind, payload, key=None):
+        """Записать операцию ('sale' или 'supply') и вернуть её ключ"""
+        entry = {
+            'key': key or uuid.uuid4().hex,
+            'kind': kind,
+            'payload': payload,
+            'created_at': datetime.now().isoformat(),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._write_lines(self.path, 'a', [line])
+            self._count += 1
+        return entry['key']
+
+    def count(self):
+        """Количество операций, ожидающих записи в БД"""
+        return self._count
+
+    def pending(self, limit=None):
+        """Первые limit операций журнала в порядке записи"""
+        with self._lock:
+            entries = self._read()
+        return entries if limit is None else entries[:limit]
+
+    def remove(self, keys):
+        """Убрать из журнала записанные операции (файл заменяется атомарно)"""
+        keys = set(keys)
+        if not keys:
+            return
+        with self._lock:
+            # Файл перечитывается под блокировкой: записи, добавленные во время
+            # применения пакета, сохраняются
+            entries = [entry for entry in self._read() if entry['key'] not in keys]
+            temp_path = self.path + '.tmp'
+            self._write_lines(temp_path, 'w', [json.dumps(entry, ensure_ascii=False) + '\n'
+                                               for entry in entries])
+            os.replace(temp_path, self.path)
+            self._count = len(entries)
+
+    def reject(self, entries):
+        """Перенести операции, которые нельзя применить, в отдельный файл для разбора"""
+        with self._lock:
+            self._write_lines(self.rejected_path, 'a', [json.dumps(entry, ensure_ascii=False) + '\n'
+                                                        for entry in entries])
+        self.remove(entry['key'] for entry in entries)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Недописанная строка при аварийном завершении
+                    continue
+        return entries
+
+    @staticmethod
+    def _write_lines(path, mode, lines):
+        with open(path, mode, encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class JournalReplayer:
+    """Фоновое применение журнала к основной БД большими пакетами.
+
+    Поток просыпается раз в interval секунд (или сразу после wake) и
+    применяет до batch_size операций одной транзакцией. Пока БД
+    заблокирована или недоступна, интервал повтора удваивается до
+    max_interval.
+    """
+
+    def __init__(self, journal, db, batch_size=1000, interval=5.0, max_interval=60.0):
+        self.journal = journal
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_interval = max_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запустить фоновый поток"""
+        self._thread = threading.Thread(target=self._run, name='journal-replayer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Остановить поток (недописанное останется в журнале до следующего запуска)"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Попробовать применить журнал, не дожидаясь интервала"""
+        self._wake.set()
+
+    def replay(self):
+        """Применить весь журнал; возвращает число записанных операций.
+
+        OperationalError (БД заблокирована или недоступна) пробрасывается -
+        операции остаются в журнале. Отклоненные операции (например, по
+        удаленному товару) переносятся в rejected.jsonl.
+        """
+        applied = 0
+        while not self._stopped.is_set():
+            entries = self.journal.pending(self.batch_size)
+            if not entries:
+                break
+            try:
+                results = self.db.apply_journal(entries)
+            except OperationalError:
+                raise
+            except IntegrityError:
+                # Запись по тому же ключу успела завершиться напрямую - при
+                # повторе ключ уже виден и операция пропускается
+                results = self._replay_one_by_one(entries)
+            except Exception as e:
+                # Пакет не применился из-за отдельной записи - применяем по одной
+                print(f"Ошибка применения пакета журнала: {e}")
+                results = self._replay_one_by_one(entries)
+            applied += sum(1 for status in results.values() if status == 'applied')
+            rejected = [entry for entry in entries if results.get(entry['key']) == 'rejected']
+            if rejected:
+                print(f"Операций журнала отклонено: {len(rejected)}, сохранены в {self.journal.rejected_path}")
+                self.journal.reject(rejected)
+            self.journal.remove(key for key, status in results.items() if status != 'rejected')
+        return applied
+
+    def _replay_one_by_one(self, entries):
+        results = {}
+        for entry in entries:
+            try:
+                results.update(self.db.apply_journal([entry]))
+            except OperationalError:
+                raise
+            except Exception as e:
+                print(f"Операция журнала {entry.get('key')} отклонена: {e}")
+                self.journal.reject([entry])
+        return results
+
+    def _run(self):
+        delay = self.interval
+        while not self._stopped.is_set():
+            if self.journal.count():
+                try:
+                    self.replay()
+                    delay = self.interval
+                except OperationalError as e:
+                    print(f"БД недоступна, журнал будет применен позже: {e}")
+                    delay = min(delay * 2, self.max_interval)
+                except Exception as e:
+                    # Поток не должен завершаться - операции остаются в журнале
+                    print(f"Ошибка применения журнала, повтор позже: {e}")
+                    delay = min(delay * 2, self.max_interval)
+            self._wake.wait(delay)
+            self._wake.clear()
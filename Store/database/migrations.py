@@ -0,0 +1,156 @@
+# Изменения схемы существующих БД. Новые таблицы создает
+# Base.metadata.create_all, но уже существующие таблицы он не меняет - такие
+# изменения оформляются миграциями. Номер последней примененной миграции
+# хранится в PRAGMA user_version, при открытии БД выполняются только
+# следующие по порядку. Новая БД создается create_all сразу в актуальной
+# схеме, поэтому каждая миграция проверяет, нужно ли ей что-то делать.
+from contextlib import contextmanager
+
+from categories import CATEGORY_CODES, ProductCategory
+from database.categories import ensure_categories
+from database.models import Base
+from database.money import Money
+from logic.money import to_minor
+
+
+def table_columns(connection, table):
+    """Имена колонок таблицы"""
+    return {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def _add_sale_receipt(connection):
+    """1: продажа может быть строкой чека (sales.receipt_id)"""
+    if 'receipt_id' not in table_columns(connection, 'sales'):
+        connection.exec_driver_sql("ALTER TABLE sales ADD COLUMN receipt_id INTEGER REFERENCES receipts (id)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_sales_receipt_id ON sales (receipt_id)")
+
+
+@contextmanager
+def _without_triggers(connection):
+    """Удалить триггеры на время перестройки таблиц и создать их заново.
+
+    ALTER TABLE RENAME проверяет все триггеры схемы, а триггеры счетчиков
+    ссылаются на перестраиваемые таблицы.
+    """
+    triggers = connection.exec_driver_sql(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND sql IS NOT NULL").fetchall()
+    for name, _ in triggers:
+        connection.exec_driver_sql(f"DROP TRIGGER {name}")
+    yield
+    for _, sql in triggers:
+        connection.exec_driver_sql(sql)
+
+
+def _rebuild_table(connection, table, changes, foreign_keys=()):
+    """Перестроить таблицу, изменив колонки (SQLite не меняет тип и имя колонки на месте).
+
+    Новая таблица описывается по текущей (PRAGMA table_info и
+    foreign_key_list), а не по моделям: миграция должна работать и после
+    следующих изменений схемы. changes - {колонка: (новое имя, новый тип,
+    SQL-выражение значения по строке старой таблицы)}, foreign_keys -
+    дополнительные (колонка, таблица, колонка). Индексы создаются заново.
+    Вызывать внутри транзакции и _without_triggers.
+    """
+    columns = connection.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()
+    definitions, names, values, primary_key = [], [], [], []
+    for _, name, type_, notnull, default, pk in columns:
+        new_name, type_, value = changes.get(name, (name, type_, name))
+        definition = f"{new_name} {type_}"
+        if notnull:
+            definition += " NOT NULL"
+        if default is not None:
+            definition += f" DEFAULT {default}"
+        definitions.append(definition)
+        names.append(new_name)
+        values.append(value)
+        if pk:
+            primary_key.append((pk, new_name))
+    renamed = {name: new_name for name, (new_name, _, _) in changes.items()}
+    if primary_key:
+        definitions.append(f"PRIMARY KEY ({', '.join(name for _, name in sorted(primary_key))})")
+    for row in connection.exec_driver_sql(f"PRAGMA foreign_key_list({table})"):
+        foreign_keys += ((renamed.get(row[3], row[3]), row[2], row[4]),)
+    definitions += [f"FOREIGN KEY({column}) REFERENCES {target} ({target_column})"
+                    for column, target, target_column in foreign_keys]
+    indexes = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    ).scalars().all()
+
+    temp_name = f'_new_{table}'
+    connection.exec_driver_sql(f"CREATE TABLE {temp_name} ({', '.join(definitions)})")
+    connection.exec_driver_sql(f"INSERT INTO {temp_name} ({', '.join(names)}) "
+                               f"SELECT {', '.join(values)} FROM {table}")
+    connection.exec_driver_sql(f"DROP TABLE {table}")
+    connection.exec_driver_sql(f"ALTER TABLE {temp_name} RENAME TO {table}")
+    for sql in indexes:
+        connection.exec_driver_sql(sql)
+
+
+def convert_money_columns(connection, tables=None):
+    """Перевести денежные колонки (тип Money), еще хранящиеся как REAL, в целые копейки.
+
+    Таблицы перестраиваются, суммы переводятся через to_minor. tables - имена
+    таблиц (None - все таблицы схемы). Вызывать внутри транзакции.
+    """
+    pending = []
+    for table in Base.metadata.sorted_tables:
+        if tables is not None and table.name not in tables:
+            continue
+        types = {row[1]: row[2].upper() for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+        money = [column.name for column in table.columns
+                 if isinstance(column.type, Money) and types.get(column.name, 'INTEGER') != 'INTEGER']
+        if money:
+            pending.append((table.name, money))
+    if not pending:
+        return
+
+    connection.connection.driver_connection.create_function('to_minor', 1, to_minor, deterministic=True)
+    with _without_triggers(connection):
+        for table, money in pending:
+            _rebuild_table(connection, table, {name: (name, 'INTEGER', f'to_minor({name})') for name in money})
+
+
+def _money_minor_units(connection):
+    """2: денежные суммы хранятся целыми копейками (database.money)"""
+    convert_money_columns(connection)
+
+
+def _category_codes(connection):
+    """3: категория товара - код из таблицы categories (products.category_id)"""
+    ensure_categories(connection)
+    if 'category' in table_columns(connection, 'products'):
+        # Строка категории - имя перечисления или русское название; неизвестные - "Другое"
+        code = (f"COALESCE((SELECT id FROM categories WHERE categories.name = products.category "
+                f"OR categories.title = products.category), {CATEGORY_CODES[ProductCategory.OTHER]})")
+        with _without_triggers(connection):
+            _rebuild_table(connection, 'products', {'category': ('category_id', 'SMALLINT', code)},
+                           foreign_keys=(('category_id', 'categories', 'id'),))
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_products_category_id ON products (category_id)")
+
+
+# Порядок менять нельзя: номер миграции - её позиция в списке, начиная с 1
+MIGRATIONS = [
+    _add_sale_receipt,
+    _money_minor_units,
+    _category_codes,
+]
+
+
+def schema_version(connection):
+    """Номер последней примененной миграции"""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine):
+    """Применить недостающие миграции; возвращает номер версии схемы"""
+    with engine.connect() as connection:
+        if schema_version(connection) < len(MIGRATIONS):
+            # pysqlite не открывает транзакцию перед DDL - открываем явно, чтобы
+            # миграции (в т.ч. перестройка таблиц) применялись целиком или никак
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            version = schema_version(connection)
+            for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                migration(connection)
+                connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+            connection.commit()
+        return schema_version(connection)
@@ -1,32 +1,43 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Enum, Text
+# Схема БД - единственное описание таблиц: по нему DatabaseManager создает
+# таблицы, а отчеты и миграции строят запросы.
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import relationship
 from datetime import datetime
-import enum
+
+from database.categories import CategoryType
+from database.money import Money
+# Категории товаров (здесь для импорта вместе со схемой)
+from categories import ProductCategory
 
 Base = declarative_base()
 
-class ProductCategory(enum.Enum):
-    ELECTRONICS = "Электроника"
-    CLOTHING = "Одежда"
-    FOOD = "Продукты"
-    BOOKS = "Книги"
-    OTHER = "Другое"
+class Category(Base):
+    """Категория товара: код и название (строки - categories.CATEGORY_CODES)"""
+    __tablename__ = 'categories'
+    
+    id = Column(Integer, primary_key=True)
+    # Имя члена ProductCategory ('FOOD')
+    name = Column(String, nullable=False, unique=True)
+    # Название для отображения ('Продукты')
+    title = Column(String, nullable=False)
 
 class Product(Base):
     """Модель товара"""
     __tablename__ = 'products'
     
     id = Column(Integer, primary_key=True)
-    name = Column(String(200), nullable=False)
-    category = Column(Enum(ProductCategory), nullable=False)
-    price = Column(Float, nullable=False)
+    name = Column(String, nullable=False)
+    # Код категории (таблица categories); в Python - член ProductCategory
+    category = Column('category_id', CategoryType, ForeignKey('categories.id'), nullable=False, index=True)
+    price = Column(Money, nullable=False)
     quantity = Column(Integer, default=0)
     min_stock = Column(Integer, default=10)
-    barcode = Column(String(100), unique=True)
-    description = Column(Text)
+    barcode = Column(String, nullable=True)
+    description = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     
+    # Связи
     sales = relationship("Sale", back_populates="product")
     supplies = relationship("Supply", back_populates="product")
 
@@ -35,13 +46,14 @@ class Customer(Base):
     __tablename__ = 'customers'
     
     id = Column(Integer, primary_key=True)
-    name = Column(String(100), nullable=False)
-    phone = Column(String(20), unique=True)
-    email = Column(String(100), unique=True)
+    name = Column(String, nullable=False)
+    phone = Column(String, nullable=False)
+    email = Column(String)
     discount = Column(Float, default=0.0)
-    total_purchases = Column(Float, default=0.0)
+    total_purchases = Column(Money, default=0.0)
     created_at = Column(DateTime, default=datetime.now)
     
+    # Связи
     sales = relationship("Sale", back_populates="customer")
 
 class Sale(Base):
@@ -52,30 +64,109 @@ class Sale(Base):
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     customer_id = Column(Integer, ForeignKey('customers.id'))
     quantity = Column(Integer, nullable=False)
-    price = Column(Float, nullable=False)
-    total = Column(Float, nullable=False)
+    price = Column(Money, nullable=False)
+    total = Column(Money, nullable=False)
     date = Column(DateTime, default=datetime.now)
+    # Чек, строкой которого является продажа (NULL - продажа без чека)
+    receipt_id = Column(Integer, ForeignKey('receipts.id'), nullable=True, index=True)
+    
+    # Связи
+    product = relationship("Product", back_populates="sales", foreign_keys=[product_id])
+    customer = relationship("Customer", back_populates="sales", foreign_keys=[customer_id])
+    receipt = relationship("Receipt", back_populates="sales")
 
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+class Receipt(Base):
+    """Чек: несколько строк-продаж, оформленных одной транзакцией"""
+    __tablename__ = 'receipts'
+    
+    id = Column(Integer, primary_key=True)
     customer_id = Column(Integer, ForeignKey('customers.id'))
+    items_count = Column(Integer, nullable=False)
+    total = Column(Money, nullable=False)
+    date = Column(DateTime, default=datetime.now)
     
-    product = relationship("Product", back_populates="sales")
-    customer = relationship("Customer", back_populates="sales")
+    sales = relationship("Sale", back_populates="receipt")
 
 class Supply(Base):
     """Модель поставки"""
     __tablename__ = 'supplies'
     
     id = Column(Integer, primary_key=True)
-    supplier = Column(String(200), nullable=False)
+    supplier = Column(String, nullable=False)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     quantity = Column(Integer, nullable=False)
-    cost = Column(Float, nullable=False)
+    cost = Column(Money, nullable=False)
     date = Column(DateTime, default=datetime.now)
     
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    # Связи
+    product = relationship("Product", back_populates="supplies", foreign_keys=[product_id])
 
-    product = relationship("Product", back_populates="supplies")
+class SaleCost(Base):
+    """Себестоимость продажи по слоям поставок"""
+    __tablename__ = 'sale_costs'
+    
+    sale_id = Column(Integer, ForeignKey('sales.id'), primary_key=True)
+    cogs = Column(Money, nullable=False)
+
+class CostingState(Base):
+    """Контрольная точка расчета себестоимости (открытые слои в JSON)"""
+    __tablename__ = 'costing_state'
+    
+    id = Column(Integer, primary_key=True)
+    method = Column(String, nullable=False)
+    state = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ChangeLog(Base):
+    """Журнал изменений строк для обновления интерфейса других терминалов"""
+    __tablename__ = 'change_log'
+    
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    action = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    # Идентификатор экземпляра DatabaseManager, сделавшего запись
+    origin = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+class JournalApplied(Base):
+    """Ключи идемпотентности операций, уже записанных в БД (см. database.journal)"""
+    __tablename__ = 'journal_applied'
+    
+    key = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    # 'applied' - записано, 'rejected' - применить невозможно (товар удален)
+    status = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=True)
+    applied_at = Column(DateTime, default=datetime.now)
+
+class ArchiveFile(Base):
+    """Годовой файл архива истории (см. database.archive) и итоги перенесенных в него строк"""
+    __tablename__ = 'archive_files'
+    
+    year = Column(Integer, primary_key=True)
+    file_name = Column(String, nullable=False)
+    first_date = Column(DateTime, nullable=True)
+    last_date = Column(DateTime, nullable=True)
+    sales_count = Column(Integer, nullable=False, default=0)
+    sales_total = Column(Money, nullable=False, default=0.0)
+    cogs_total = Column(Money, nullable=False, default=0.0)
+    supplies_count = Column(Integer, nullable=False, default=0)
+    receipts_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class StoreStats(Base):
+    """Счетчики панели статистики (одна строка, ведется триггерами)"""
+    __tablename__ = 'store_stats'
+    
+    id = Column(Integer, primary_key=True)
+    total_sales = Column(Money, nullable=False, default=0.0)
+    # Сумма продаж, для которых уже посчитана себестоимость
+    costed_sales = Column(Money, nullable=False, default=0.0)
+    total_cogs = Column(Money, nullable=False, default=0.0)
+    units_on_hand = Column(Integer, nullable=False, default=0)
+    low_stock = Column(Integer, nullable=False, default=0)
+    out_of_stock = Column(Integer, nullable=False, default=0)
 
 class Employee(Base):
     """Модель сотрудника"""
@@ -84,7 +175,7 @@ class Employee(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     position = Column(String(100))
-    salary = Column(Float)
+    salary = Column(Money)
     hire_date = Column(DateTime, default=datetime.now)
     phone = Column(String(20))
     email = Column(String(100))
@@ -102,4 +193,4 @@ class InventoryCheck(Base):
     date = Column(DateTime, default=datetime.now)
     notes = Column(Text)
     
-    product = relationship("Product")
\ No newline at end of file
+    product = relationship("Product")
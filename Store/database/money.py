@@ -0,0 +1,35 @@
+# Денежные колонки: суммы хранятся в БД целым числом копеек, поэтому
+# SUM(total) и счетчики панели статистики складывают целые числа и сходятся
+# до копейки при любом объеме данных. В коде суммы остаются рублями - тип
+# Money переводит их в копейки при записи и обратно при чтении (правила
+# округления - logic.money).
+from sqlalchemy.sql import operators
+from sqlalchemy.types import Integer, TypeDecorator
+
+from logic.money import from_minor, to_minor
+
+
+class Money(TypeDecorator):
+    """Денежная колонка: INTEGER копеек в БД, рубли (float) в Python.
+
+    Суммы по колонке (func.sum, func.coalesce) и выражения вида
+    цена * количество возвращаются тем же типом и тоже переводятся в рубли.
+    Сырые SQL-запросы получают копейки.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator, Integer.Comparator):
+        def _adapt_expression(self, op, other_comparator):
+            # Деньги +- деньги и деньги * количество - тоже деньги
+            if op in (operators.add, operators.sub, operators.mul) and \
+                    isinstance(other_comparator.type, (Integer, Money)):
+                return op, self.type
+            return super()._adapt_expression(op, other_comparator)
+
+    def process_bind_param(self, value, dialect):
+        return to_minor(value)
+
+    def process_result_value(self, value, dialect):
+        return from_minor(value)
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from database.db_manager import DatabaseManager
+
+# Страниц БД за один шаг копирования: между шагами блокировка чтения
+# отпускается, и запись в основную БД ждет не дольше одного шага
+BACKUP_PAGES_PER_STEP = 256
+# Сколько раз копирование может начаться заново из-за записей в основную БД,
+# прежде чем снимок будет снят за один шаг
+MAX_BACKUP_RESTARTS = 3
+# Пауза перед повтором шага, если основная БД занята записью (с)
+BACKUP_BUSY_SLEEP = 0.005
+
+
+class _BackupRestarted(Exception):
+    """Основная БД слишком часто меняется во время пошагового копирования"""
+
+
+def snapshot_path_for(db_path):
+    """Файл снимка по умолчанию рядом с основной БД: store.db -> store.reporting.db"""
+    return os.path.splitext(db_path)[0] + '.reporting.db'
+
+
+class ReportingSnapshot:
+    """Снимок основной БД для отчетов (SQLite backup API).
+
+    Отчеты (InventoryReports) читают копию store.db, а не саму базу: долгие
+    запросы отчетов не держат блокировку чтения основной БД и не задерживают
+    record_sale. Снимок снимается онлайн, небольшими шагами, и в основную БД
+    ничего не пишет: себестоимость продаж досчитывает сторона записи
+    (database.cost_updater). Если основная БД изменилась, отчет получает
+    снимок не старше max_age секунд (None - любой); фоновый поток (start)
+    обновляет снимок раз в interval секунд заранее.
+
+    Копирование идет во временный файл, который затем заменяет снимок, -
+    отчет, читающий снимок (reading), дочитывается до конца по прежним данным.
+    """
+
+    def __init__(self, db, path=None, max_age=None, interval=60.0):
+        self.db = db
+        self.source_path = db.engine.url.database
+        self.path = path or snapshot_path_for(self.source_path)
+        self.max_age = max_age
+        self.interval = interval
+        # Время снятия текущего снимка (None - снимка еще нет)
+        self.taken_at = None
+        self._taken = None
+        self._snapshot_db = None
+        self._source_state = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запустить периодическое обновление снимка; возвращает self"""
+        self._thread = threading.Thread(target=self._run, name='reporting-snapshot', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Остановить фоновое обновление"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh(self):
+        """Снять свежий снимок основной БД"""
+        with self._refresh_lock:
+            source_state = self._file_state()
+            temp_path = self.path + '.tmp'
+            self._backup(temp_path)
+            with self._lock:
+                if self._snapshot_db is not None:
+                    # Соединения со старым файлом закрываются до его замены
+                    self._snapshot_db.engine.dispose()
+                os.replace(temp_path, self.path)
+                if self._snapshot_db is None:
+                    self._snapshot_db = DatabaseManager(self.path)
+                self.taken_at = datetime.now()
+                self._taken = time.monotonic()
+                self._source_state = source_state
+
+    def is_stale(self):
+        """Изменилась ли основная БД после снятия снимка"""
+        return self.taken_at is None or self._file_state() != self._source_state
+
+    @contextmanager
+    def reading(self):
+        """DatabaseManager снимка на время отчета (устаревший снимок сначала обновляется)"""
+        if self.taken_at is None or (self.max_age is not None and
+                                     time.monotonic() - self._taken > self.max_age and self.is_stale()):
+            self.refresh()
+        with self._lock:
+            yield self._snapshot_db
+
+    def _backup(self, target_path):
+        source = self.db.engine.raw_connection()
+        try:
+            try:
+                self._copy(source.driver_connection, target_path, BACKUP_PAGES_PER_STEP)
+            except _BackupRestarted:
+                # Под постоянной записью пошаговая копия не сходится - копируем
+                # за один шаг (запись подождет одно копирование целиком)
+                self._copy(source.driver_connection, target_path, -1)
+        finally:
+            source.close()
+
+    @staticmethod
+    def _copy(source, target_path, pages):
+        restarts = 0
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            # После записи в основную БД другим соединением копирование
+            # начинается заново - остаток страниц снова растет
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > MAX_BACKUP_RESTARTS:
+                    raise _BackupRestarted()
+            last_remaining = remaining
+
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=BACKUP_BUSY_SLEEP)
+        finally:
+            target.close()
+
+    def _file_state(self):
+        # Commit в режиме журнала отката меняет файл БД (время и размер)
+        try:
+            stat = os.stat(self.source_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if not self.is_stale():
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Ошибка обновления снимка для отчетов: {e}")
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Признак остановки в очереди записей
+_STOP = object()
+
+
+class WriteService:
+    """Единственный писатель БД с групповым commit.
+
+    Операции записи (методы DatabaseManager) ставятся в очередь и
+    выполняются по порядку в одном потоке. Первая операция открывает окно
+    max_delay_ms, за которое собирается группа (не больше max_batch).
+    Группа выполняется в одной транзакции DatabaseManager.write_group:
+    каждая операция - в своей точке сохранения, поэтому ошибка одной
+    операции не отменяет остальные, а на всю группу приходится один COMMIT
+    (и один fsync). submit возвращает concurrent.futures.Future, который
+    завершается после COMMIT группы.
+
+    Однотипные операции, поставленные через submit_batched (например,
+    продажи для record_sales_batch), идущие в группе подряд, выполняются
+    одним пакетным вызовом.
+
+    В очередь нельзя ставить операции, которые сами управляют транзакцией
+    (vacuum, rebuild_dashboard_stats и т.п.).
+    """
+
+    def __init__(self, db, max_batch=200, max_delay_ms=5):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.commits = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """Запустить поток писателя"""
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Выполнить уже поставленные операции и остановить поток"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Поставить запись fn(*args, **kwargs) в очередь; возвращает Future"""
+        future = Future()
+        self._queue.put((future, fn, args, kwargs, None))
+        return future
+
+    def submit_batched(self, batch_fn, item):
+        """Поставить элемент пакетной записи batch_fn(items) -> результаты по элементам"""
+        future = Future()
+        self._queue.put((future, batch_fn, (item,), {}, batch_fn))
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect(first)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        running = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        results = []
+        try:
+            with self.db.write_group():
+                for run in self._runs(running):
+                    results.extend(self._call(run))
+        except Exception as e:
+            # COMMIT группы не удался - ошибка достается всем операциям группы
+            for future, *_ in running:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        self.operations += len(running)
+        for (future, *_), (result, error) in zip(running, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def _runs(operations):
+        """Разбить группу на вызовы: подряд идущие пакетные операции объединяются"""
+        run = []
+        for operation in operations:
+            batch_fn = operation[4]
+            if run and (batch_fn is None or run[0][4] != batch_fn):
+                yield run
+                run = []
+            run.append(operation)
+            if batch_fn is None:
+                yield run
+                run = []
+        if run:
+            yield run
+
+    def _call(self, run):
+        """Выполнить вызов; возвращает пары (результат, ошибка) по операциям"""
+        _, fn, args, kwargs, batch_fn = run[0]
+        try:
+            if batch_fn is None:
+                return [(fn(*args, **kwargs), None)]
+            return [(result, None) for result in batch_fn([operation[2][0] for operation in run])]
+        except Exception as e:
+            if batch_fn is None or len(run) == 1:
+                return [(None, e)]
+            # Пакет откатился целиком - повторяем по одному, чтобы ошибка
+            # досталась только своей операции
+            return [pair for operation in run for pair in self._call([operation])]
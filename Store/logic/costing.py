@@ -0,0 +1,123 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FIFO = 'fifo'
+AVERAGE = 'average'
+
+
+class CostLayerEngine:
+    """Себестоимость продаж по слоям поставок (FIFO или средневзвешенная).
+
+    Каждая поставка открывает слой (количество, цена за единицу), продажа
+    списывает количество со слоёв и получает свою себестоимость (COGS).
+    Состояние - только открытые слои и последние учтённые ID, поэтому
+    его можно сохранить как контрольную точку и продолжить с новых строк.
+
+    Сам движок не блокирует: вызывающий код сериализует операции по товару.
+    """
+
+    def __init__(self, method: str = FIFO):
+        if method not in (FIFO, AVERAGE):
+            raise ValueError(f"Неизвестный метод оценки: {method}")
+        self.method = method
+        self._layers: Dict[int, deque] = {}
+        self._last_unit_cost: Dict[int, float] = {}
+        self._uncosted: Dict[int, int] = {}
+        self.last_supply_id = 0
+        self.last_sale_id = 0
+
+    @property
+    def uncosted_quantity(self) -> int:
+        """Количество проданного товара, для которого не нашлось слоя поставки"""
+        return sum(self._uncosted.values())
+
+    def add_supply(self, product_id: int, quantity: int, cost: float):
+        """Добавить слой поставки (cost - стоимость всей поставки)"""
+        if quantity <= 0:
+            return
+        unit_cost = cost / quantity
+        layers = self._layers.setdefault(product_id, deque())
+        if self.method == AVERAGE and layers:
+            # Один слой со средневзвешенной ценой
+            layer = layers[0]
+            total = layer[0] + quantity
+            layer[1] = (layer[0] * layer[1] + cost) / total
+            layer[0] = total
+        else:
+            layers.append([quantity, unit_cost])
+        self._last_unit_cost[product_id] = unit_cost
+
+    def consume(self, product_id: int, quantity: int) -> float:
+        """Списать продажу со слоёв и вернуть её себестоимость"""
+        layers = self._layers.get(product_id)
+        cogs = 0.0
+        remaining = quantity
+        while remaining > 0 and layers:
+            layer = layers[0]
+            taken = min(remaining, layer[0])
+            cogs += taken * layer[1]
+            layer[0] -= taken
+            remaining -= taken
+            if layer[0] == 0:
+                layers.popleft()
+        if remaining > 0:
+            # Остаток без поставок (начальный запас) - по последней известной цене
+            cogs += remaining * self._last_unit_cost.get(product_id, 0.0)
+            self._uncosted[product_id] = self._uncosted.get(product_id, 0) + remaining
+        return cogs
+
+    def process(self, supplies: Iterable, sales: Iterable) -> Dict[int, float]:
+        """Обработать новые поставки и продажи в хронологическом порядке.
+
+        Записи с ID не новее контрольной точки пропускаются.
+        Возвращает себестоимость каждой обработанной продажи по её ID.
+        """
+        events: List[Tuple] = []
+        for supply in supplies:
+            if supply.id > self.last_supply_id:
+                events.append((supply.date, 0, supply.id, supply))
+        for sale in sales:
+            if sale.id > self.last_sale_id:
+                events.append((sale.date, 1, sale.id, sale))
+        # При равных датах поставка учитывается раньше продажи
+        events.sort(key=lambda e: (e[0], e[1], e[2]))
+
+        result = {}
+        for _, kind, record_id, record in events:
+            if kind == 0:
+                self.add_supply(record.product_id, record.quantity, record.cost)
+                self.last_supply_id = max(self.last_supply_id, record_id)
+            else:
+                result[record_id] = self.consume(record.product_id, record.quantity)
+                self.last_sale_id = max(self.last_sale_id, record_id)
+        return result
+
+    def inventory_value(self, product_id: Optional[int] = None) -> float:
+        """Себестоимость остатка в открытых слоях"""
+        if product_id is not None:
+            return sum(q * c for q, c in self._layers.get(product_id, ()))
+        return sum(q * c for layers in self._layers.values() for q, c in layers)
+
+    def to_dict(self) -> dict:
+        """Контрольная точка состояния"""
+        return {
+            'method': self.method,
+            'last_supply_id': self.last_supply_id,
+            'last_sale_id': self.last_sale_id,
+            'layers': {str(pid): [list(layer) for layer in layers]
+                       for pid, layers in self._layers.items() if layers},
+            'last_unit_cost': {str(pid): cost for pid, cost in self._last_unit_cost.items()},
+            'uncosted': {str(pid): qty for pid, qty in self._uncosted.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CostLayerEngine':
+        """Восстановить состояние из контрольной точки"""
+        engine = cls(data.get('method', FIFO))
+        engine.last_supply_id = data.get('last_supply_id', 0)
+        engine.last_sale_id = data.get('last_sale_id', 0)
+        engine._layers = {int(pid): deque(list(layer) for layer in layers)
+                          for pid, layers in data.get('layers', {}).items()}
+        engine._last_unit_cost = {int(pid): cost for pid, cost in data.get('last_unit_cost', {}).items()}
+        engine._uncosted = {int(pid): qty for pid, qty in data.get('uncosted', {}).items()}
+        return engine
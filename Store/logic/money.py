@@ -0,0 +1,51 @@
+# Денежные суммы с точностью до копейки. В коде суммы - рубли (float), но
+# округление и скидки считаются в целых копейках: float 0.1 + 0.2 не равно
+# 0.3, а сумма в копейках - всегда целое число. В БД суммы хранятся
+# копейками (database.money.Money).
+from decimal import Decimal, ROUND_HALF_UP
+
+# Копеек в рубле
+MINOR_UNITS = 100
+
+
+def to_minor(amount):
+    """Сумма в рублях -> целое число копеек (округление половины вверх, от нуля)"""
+    if amount is None:
+        return None
+    # Через str: float 0.285 должен округляться как 0.285, а не как 0.28499999...
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor):
+    """Целое число копеек -> сумма в рублях"""
+    if minor is None:
+        return None
+    return minor / MINOR_UNITS
+
+
+def round_money(amount):
+    """Округлить сумму до копеек"""
+    return from_minor(to_minor(amount))
+
+
+def apply_discount(amount, discount):
+    """Сумма за вычетом скидки в процентах, округленная до копейки половиной вверх"""
+    minor = to_minor(amount)
+    if not discount:
+        return from_minor(minor)
+    discounted = Decimal(minor) * (100 - Decimal(str(discount))) / 100
+    return from_minor(int(discounted.quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+
+def line_total(price, quantity, discount=0.0):
+    """Сумма строки продажи: цена * количество минус скидка в процентах.
+
+    Скидка применяется к сумме строки целиком, а не к цене единицы, -
+    округляется один раз на строку.
+    """
+    return apply_discount(from_minor(to_minor(price) * quantity), discount)
+
+
+def money_sum(amounts):
+    """Сумма сумм без накопления ошибки float"""
+    return from_minor(sum(to_minor(amount) for amount in amounts))
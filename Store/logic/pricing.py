@@ -0,0 +1,179 @@
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from categories import MAX_CATEGORY_CODE, category_code
+
+# Таблицы скидок индексируются кодами категорий (categories.CATEGORY_CODES);
+# следующий за последним код - "все категории"
+ALL_CATEGORIES = MAX_CATEGORY_CODE + 1
+
+
+@dataclass
+class CategoryPromo:
+    """Постоянная скидка на категорию"""
+    category: str
+    percent: float
+
+
+@dataclass
+class QuantityBreak:
+    """Скидка от количества в строке (для категории или для всех)"""
+    min_quantity: int
+    percent: float
+    category: Optional[str] = None
+
+
+@dataclass
+class Campaign:
+    """Скидка, действующая в заданный период"""
+    start: datetime
+    end: datetime
+    percent: float
+    category: Optional[str] = None
+    product_ids: Optional[Sequence[int]] = None
+
+
+@dataclass
+class PricingResult:
+    """Результат расчёта строк"""
+    subtotal: np.ndarray
+    promo_percent: np.ndarray
+    total: np.ndarray
+
+
+@dataclass
+class PricingRules:
+    """Набор правил ценообразования"""
+    category_promos: List[CategoryPromo] = field(default_factory=list)
+    quantity_breaks: List[QuantityBreak] = field(default_factory=list)
+    campaigns: List[Campaign] = field(default_factory=list)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'PricingRules':
+        """Загрузить правила из JSON-файла"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(
+            category_promos=[CategoryPromo(**item) for item in data.get('category_promos', [])],
+            quantity_breaks=[QuantityBreak(**item) for item in data.get('quantity_breaks', [])],
+            campaigns=[
+                Campaign(**{**item,
+                            'start': datetime.fromisoformat(item['start']),
+                            'end': datetime.fromisoformat(item['end'])})
+                for item in data.get('campaigns', [])
+            ]
+        )
+
+
+class PricingEngine:
+    """Векторный расчёт цен и скидок.
+
+    Правила один раз компилируются в таблицы поиска, после чего корзина или
+    массовая переоценка считаются одним проходом по массивам.
+    Из акционных скидок (категория, количество, кампания) применяется
+    наибольшая, скидка клиента применяется поверх неё.
+    """
+
+    def __init__(self, rules: Optional[PricingRules] = None):
+        self.compile(rules or PricingRules())
+
+    def compile(self, rules: PricingRules):
+        """Скомпилировать правила в таблицы поиска"""
+        self.rules = rules
+
+        # Скидка по категории: таблица [код категории]
+        self._category_percent = np.zeros(ALL_CATEGORIES + 1)
+        for promo in rules.category_promos:
+            code = category_code(promo.category)
+            self._category_percent[code] = max(self._category_percent[code], promo.percent)
+
+        # Скидки от количества: пороги + таблица [категория, порог] с накопленным максимумом
+        thresholds = sorted({b.min_quantity for b in rules.quantity_breaks})
+        self._break_thresholds = np.array(thresholds, dtype=np.int64)
+        table = np.zeros((ALL_CATEGORIES + 1, len(thresholds)))
+        for b in rules.quantity_breaks:
+            column = thresholds.index(b.min_quantity)
+            rows = slice(None) if b.category is None else category_code(b.category)
+            table[rows, column:] = np.maximum(table[rows, column:], b.percent)
+        self._break_table = table
+
+        # Кампании: границы периодов и область действия
+        self._campaign_start = np.array([c.start.timestamp() for c in rules.campaigns])
+        self._campaign_end = np.array([c.end.timestamp() for c in rules.campaigns])
+        self._campaign_percent = np.array([c.percent for c in rules.campaigns])
+        self._campaign_category = np.array(
+            [ALL_CATEGORIES if c.category is None else category_code(c.category)
+             for c in rules.campaigns], dtype=np.int64)
+        self._campaign_products = [
+            None if c.product_ids is None else np.unique(np.asarray(c.product_ids, dtype=np.int64))
+            for c in rules.campaigns
+        ]
+
+    @staticmethod
+    def category_codes(categories) -> np.ndarray:
+        """Преобразовать последовательность категорий в массив кодов"""
+        return np.fromiter((category_code(c) for c in categories), dtype=np.int64)
+
+    def promo_percent(self, categories, quantities=None, product_ids=None,
+                      at: Optional[datetime] = None) -> np.ndarray:
+        """Наибольшая акционная скидка (%) для каждой строки"""
+        categories = np.asarray(categories, dtype=np.int64)
+        percent = self._category_percent[categories]
+
+        if quantities is not None and len(self._break_thresholds):
+            quantities = np.asarray(quantities, dtype=np.int64)
+            column = np.searchsorted(self._break_thresholds, quantities, side='right') - 1
+            hit = column >= 0
+            breaks = np.zeros_like(percent)
+            breaks[hit] = self._break_table[categories[hit], column[hit]]
+            percent = np.maximum(percent, breaks)
+
+        if len(self._campaign_percent):
+            now = (at or datetime.now()).timestamp()
+            active = np.flatnonzero((self._campaign_start <= now) & (now <= self._campaign_end))
+            for index in active:
+                applies = np.ones(len(categories), dtype=bool)
+                code = self._campaign_category[index]
+                if code != ALL_CATEGORIES:
+                    applies &= categories == code
+                products = self._campaign_products[index]
+                if products is not None:
+                    if product_ids is None:
+                        continue
+                    applies &= np.isin(np.asarray(product_ids, dtype=np.int64), products)
+                percent = np.where(applies, np.maximum(percent, self._campaign_percent[index]), percent)
+
+        return percent
+
+    def price_lines(self, prices, quantities, categories, customer_discount=0.0,
+                    product_ids=None, at: Optional[datetime] = None) -> PricingResult:
+        """Рассчитать строки корзины или пакета продаж за один проход.
+
+        customer_discount - скаляр или массив скидок клиентов в процентах.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        subtotal = prices * quantities
+        promo = self.promo_percent(categories, quantities, product_ids, at)
+        total = subtotal * (1 - promo / 100) * (1 - np.asarray(customer_discount, dtype=np.float64) / 100)
+        return PricingResult(subtotal=subtotal, promo_percent=promo, total=total)
+
+    def reprice(self, prices, categories, product_ids=None,
+                at: Optional[datetime] = None) -> np.ndarray:
+        """Массовая переоценка: цены за единицу с учётом акций"""
+        prices = np.asarray(prices, dtype=np.float64)
+        promo = self.promo_percent(categories, None, product_ids, at)
+        return prices * (1 - promo / 100)
+
+    def price_one(self, price: float, quantity: int, category, customer_discount: float = 0.0,
+                  product_id: Optional[int] = None) -> float:
+        """Рассчитать сумму одной строки"""
+        result = self.price_lines(
+            [price], [quantity], [category_code(category)], customer_discount,
+            None if product_id is None else [product_id]
+        )
+        return float(result.total[0])
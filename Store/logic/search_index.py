@@ -0,0 +1,180 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+# Короче триграммы запрос обрабатывается просмотром нормализованных названий
+GRAM_SIZE = 3
+
+
+def _grams(text: str) -> Set[str]:
+    """Множество триграмм строки"""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class ProductSearchIndex:
+    """Инкрементальный поисковый индекс товаров.
+
+    Триграммы ищут подстроки, отсортированный список названий - префиксы
+    для поиска по мере ввода. Списки вхождений только дописываются:
+    устаревшие записи отсеиваются проверкой по актуальному названию и
+    периодически вычищаются.
+    """
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._categories: Dict[int, str] = {}
+        self._by_category: Dict[str, Set[int]] = {}
+        self._postings: Dict[str, array] = {}
+        self._sorted: List[Tuple[str, int]] = []
+        self._stale = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def rebuild(self, products):
+        """Построить индекс заново"""
+        with self._lock:
+            self._names = {}
+            self._categories = {}
+            self._by_category = {}
+            self._postings = {}
+            self._stale = 0
+            self._size = 0
+            for product in products:
+                self._add(product.id, product.name, product.category.value)
+            self._sorted = sorted((name, pid) for pid, name in self._names.items())
+
+    def add(self, product):
+        """Добавить товар в индекс"""
+        with self._lock:
+            self._add(product.id, product.name, product.category.value)
+            insort(self._sorted, (self._names[product.id], product.id))
+
+    def update(self, product):
+        """Обновить товар в индексе после изменения названия или категории"""
+        with self._lock:
+            self._remove(product.id)
+            self._add(product.id, product.name, product.category.value)
+            insort(self._sorted, (self._names[product.id], product.id))
+
+    def remove(self, product_id: int):
+        """Удалить товар из индекса"""
+        with self._lock:
+            self._remove(product_id)
+
+    def _add(self, product_id: int, name: str, category: str):
+        name = name.lower()
+        self._names[product_id] = name
+        category = category.lower()
+        self._categories[product_id] = category
+        self._by_category.setdefault(category, set()).add(product_id)
+        for gram in _grams(name):
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array('q')
+            posting.append(product_id)
+            self._size += 1
+
+    def _remove(self, product_id: int):
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        category = self._categories.pop(product_id)
+        self._by_category[category].discard(product_id)
+        position = bisect_left(self._sorted, (name, product_id))
+        if position < len(self._sorted) and self._sorted[position] == (name, product_id):
+            del self._sorted[position]
+        self._stale += len(_grams(name))
+        if self._stale > self._size // 2:
+            self._compact()
+
+    def _compact(self):
+        """Вычистить устаревшие вхождения из списков"""
+        self._postings = {}
+        self._stale = 0
+        self._size = 0
+        for product_id, name in self._names.items():
+            for gram in _grams(name):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = array('q')
+                posting.append(product_id)
+                self._size += 1
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """ID товаров, у которых запрос входит в название или категорию.
+
+        С limit поиск останавливается после limit найденных товаров.
+        """
+        query = query.lower()
+        with self._lock:
+            grams = _grams(query)
+            if grams:
+                # Кандидаты - по самой редкой триграмме, затем точная проверка
+                postings = [self._postings.get(gram) for gram in grams]
+                if any(p is None for p in postings):
+                    candidates = ()
+                else:
+                    candidates = min(postings, key=len)
+            else:
+                candidates = self._names
+
+            found = set()
+            for pid in candidates:
+                if query in self._names.get(pid, ''):
+                    found.add(pid)
+                    if limit is not None and len(found) >= limit:
+                        return sorted(found)
+
+            # Категорий всего несколько - проверяем их напрямую
+            for category, members in self._by_category.items():
+                if query in category:
+                    found.update(members)
+        result = sorted(found)
+        return result if limit is None else result[:limit]
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[int]:
+        """ID товаров, название которых начинается с префикса"""
+        prefix = prefix.lower()
+        with self._lock:
+            position = bisect_left(self._sorted, (prefix, -1))
+            result = []
+            for name, product_id in self._sorted[position:position + limit]:
+                if not name.startswith(prefix):
+                    break
+                result.append(product_id)
+        return result
+
+    def fuzzy(self, query: str, limit: int = 10, min_similarity: float = 0.5) -> List[int]:
+        """ID товаров, похожих на запрос с учётом опечаток.
+
+        Похожесть - доля триграмм запроса, найденных в названии.
+        """
+        query = query.lower()
+        grams = _grams(query)
+        if not grams:
+            return self.prefix(query, limit)
+        with self._lock:
+            # Название с похожестью не ниже порога содержит хотя бы одну
+            # из k самых редких триграмм запроса - остальные не просматриваем
+            required = math.ceil(min_similarity * len(grams))
+            k = len(grams) - required + 1
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            candidates = set()
+            for posting in postings[:k]:
+                candidates.update(posting)
+
+            scored = []
+            for product_id in candidates:
+                name = self._names.get(product_id)
+                if name is None:
+                    continue
+                similarity = len(grams & _grams(name)) / len(grams)
+                if similarity >= min_similarity:
+                    scored.append((-similarity, len(name), product_id))
+        scored.sort()
+        return [product_id for _, _, product_id in scored[:limit]]
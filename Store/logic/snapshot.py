@@ -0,0 +1,428 @@
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from categories import CATEGORIES_BY_CODE, CATEGORY_CODES
+from logic.store_logic import StoreLogic, Product, Customer, Sale, Supply
+from logic.costing import CostLayerEngine
+
+# 3: категория товара - код categories.CATEGORY_CODES, как в БД
+SNAPSHOT_VERSION = 3
+
+# Колонки фиксированной ширины: 'q' - int64, 'd' - float64.
+# Строковые поля хранятся как индекс в таблице строк (-1 - None).
+PRODUCT_COLUMNS = (
+    ('id', 'q'), ('name', 'q'), ('category', 'q'), ('price', 'd'),
+    ('quantity', 'q'), ('min_stock', 'q'), ('barcode', 'q'), ('description', 'q'),
+)
+CUSTOMER_COLUMNS = (
+    ('id', 'q'), ('name', 'q'), ('phone', 'q'), ('email', 'q'),
+    ('discount', 'd'), ('total_purchases', 'd'),
+)
+SALE_COLUMNS = (
+    ('id', 'q'), ('product_id', 'q'), ('customer_id', 'q'), ('quantity', 'q'),
+    ('price', 'd'), ('total', 'd'), ('date', 'd'), ('cogs', 'd'),
+)
+SUPPLY_COLUMNS = (
+    ('id', 'q'), ('supplier', 'q'), ('product_id', 'q'), ('quantity', 'q'),
+    ('cost', 'd'), ('date', 'd'),
+)
+
+class StringTable:
+    """Таблица строк снимка: смещения + общий UTF-8 блок"""
+
+    def __init__(self, offsets=None, blob=None):
+        self._offsets = offsets
+        self._blob = blob
+        self._index: Dict[str, int] = {}
+        self._pending: List[bytes] = []
+
+    def add(self, value: Optional[str]) -> int:
+        """Добавить строку, вернуть её индекс"""
+        if value is None:
+            return -1
+        index = self._index.get(value)
+        if index is None:
+            index = len(self._pending)
+            self._index[value] = index
+            self._pending.append(value.encode('utf-8'))
+        return index
+
+    def get(self, index: int) -> Optional[str]:
+        """Получить строку по индексу"""
+        if index < 0:
+            return None
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+    def write(self, directory: str):
+        """Записать таблицу строк на диск"""
+        offsets = array('q', [0])
+        with open(os.path.join(directory, 'strings.bin'), 'wb') as f:
+            for data in self._pending:
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        with open(os.path.join(directory, 'strings_idx.bin'), 'wb') as f:
+            offsets.tofile(f)
+
+
+class MappedRecords(Sequence):
+    """Последовательность записей поверх отображённых в память колонок.
+
+    Объекты создаются только при обращении; новые записи дописываются в хвост.
+    """
+
+    def __init__(self, factory: Callable[[Dict[str, object], int], object],
+                 columns: Dict[str, memoryview], length: int):
+        self._factory = factory
+        self._columns = columns
+        self._length = length
+        self._tail: list = []
+
+    def __len__(self) -> int:
+        return self._length + len(self._tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        if index >= self._length:
+            return self._tail[index - self._length]
+        return self._factory(self._columns, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self._factory(self._columns, index)
+        yield from self._tail
+
+    def append(self, record):
+        """Добавить запись в хвост"""
+        self._tail.append(record)
+
+
+def _map_file(path: str):
+    """Отобразить файл в память (пустые файлы отображать нельзя)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _write_columns(directory: str, table: str, columns, rows):
+    """Записать таблицу в виде файлов-колонок"""
+    for position, (name, typecode) in enumerate(columns):
+        data = array(typecode, (row[position] for row in rows))
+        with open(os.path.join(directory, f'{table}_{name}.bin'), 'wb') as f:
+            data.tofile(f)
+
+
+def _map_columns(directory: str, table: str, columns) -> Dict[str, memoryview]:
+    """Отобразить колонки таблицы в память"""
+    mapped = {}
+    for name, typecode in columns:
+        view = _map_file(os.path.join(directory, f'{table}_{name}.bin'))
+        mapped[name] = view.cast(typecode) if len(view) else array(typecode)
+    return mapped
+
+
+def _optional_id(value: Optional[int]) -> int:
+    return -1 if value is None else value
+
+
+def _current_generation(path: str) -> Optional[str]:
+    """Имя актуального поколения снимка"""
+    try:
+        with open(os.path.join(path, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_snapshot(logic: StoreLogic, path: str):
+    """Сохранить снимок состояния StoreLogic.
+
+    Каждое сохранение пишет новое поколение и атомарно переключает CURRENT:
+    старые файлы могут быть ещё отображены в память текущим процессом.
+    """
+    os.makedirs(path, exist_ok=True)
+    current = _current_generation(path)
+    generation = f'gen{int(current[3:]) + 1 if current else 1}'
+    directory = os.path.join(path, generation)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    strings = StringTable()
+    products = [
+        (p.id, strings.add(p.name), CATEGORY_CODES[p.category], p.price,
+         p.quantity, p.min_stock, strings.add(p.barcode), strings.add(p.description))
+        for p in logic.products.values()
+    ]
+    customers = [
+        (c.id, strings.add(c.name), strings.add(c.phone), strings.add(c.email),
+         c.discount, c.total_purchases)
+        for c in logic.customers.values()
+    ]
+    sales = [
+        (s.id, s.product_id, _optional_id(s.customer_id), s.quantity,
+         s.price, s.total, s.date.timestamp(), s.cogs)
+        for s in logic.sales
+    ]
+    supplies = [
+        (s.id, strings.add(s.supplier), s.product_id, s.quantity,
+         s.cost, s.date.timestamp())
+        for s in logic.supplies
+    ]
+
+    _write_columns(directory, 'products', PRODUCT_COLUMNS, products)
+    _write_columns(directory, 'customers', CUSTOMER_COLUMNS, customers)
+    _write_columns(directory, 'sales', SALE_COLUMNS, sales)
+    _write_columns(directory, 'supplies', SUPPLY_COLUMNS, supplies)
+    strings.write(directory)
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'byteorder': sys.byteorder,
+        'counts': {
+            'products': len(products),
+            'customers': len(customers),
+            'sales': len(sales),
+            'supplies': len(supplies),
+        },
+        'high_water': high_water_mark(logic),
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    # Контрольная точка себестоимости - только открытые слои
+    with open(os.path.join(directory, 'costing.json'), 'w', encoding='utf-8') as f:
+        json.dump(logic.costing.to_dict(), f)
+
+    # Атомарно переключаем актуальное поколение
+    tmp_current = os.path.join(path, 'CURRENT.tmp')
+    with open(tmp_current, 'w', encoding='utf-8') as f:
+        f.write(generation)
+    os.replace(tmp_current, os.path.join(path, 'CURRENT'))
+
+    # Старые поколения удаляем; поколение, отображенное в память этим
+    # StoreLogic, остается до следующего сохранения
+    for name in os.listdir(path):
+        if name.startswith('gen') and name not in (generation, logic.snapshot_generation):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def high_water_mark(logic: StoreLogic) -> Dict[str, int]:
+    """Последние учтённые ID записей каждой таблицы и журнала изменений БД"""
+    return {
+        'products': logic.next_product_id - 1,
+        'customers': logic.next_customer_id - 1,
+        'sales': logic.next_sale_id - 1,
+        'supplies': logic.next_supply_id - 1,
+        'changes': logic.last_change_id,
+    }
+
+
+def load_snapshot(path: str) -> Optional[Tuple[StoreLogic, Dict[str, int]]]:
+    """Загрузить снимок, отобразив колонки в память.
+
+    Возвращает None, если снимка нет или он несовместим.
+    """
+    generation = _current_generation(path)
+    if generation is None:
+        return None
+    path = os.path.join(path, generation)
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != SNAPSHOT_VERSION or meta.get('byteorder') != sys.byteorder:
+        return None
+
+    offsets = _map_file(os.path.join(path, 'strings_idx.bin')).cast('q')
+    strings = StringTable(offsets, _map_file(os.path.join(path, 'strings.bin')))
+    counts = meta['counts']
+
+    def make_sale(cols, i):
+        customer_id = cols['customer_id'][i]
+        return Sale(
+            id=cols['id'][i],
+            product_id=cols['product_id'][i],
+            customer_id=None if customer_id < 0 else customer_id,
+            quantity=cols['quantity'][i],
+            price=cols['price'][i],
+            date=datetime.fromtimestamp(cols['date'][i]),
+            total=cols['total'][i],
+            cogs=cols['cogs'][i]
+        )
+
+    def make_supply(cols, i):
+        return Supply(
+            id=cols['id'][i],
+            supplier=strings.get(cols['supplier'][i]),
+            product_id=cols['product_id'][i],
+            quantity=cols['quantity'][i],
+            cost=cols['cost'][i],
+            date=datetime.fromtimestamp(cols['date'][i])
+        )
+
+    logic = StoreLogic()
+    # Справочники небольшие и изменяемые - материализуем сразу
+    cols = _map_columns(path, 'products', PRODUCT_COLUMNS)
+    products = [
+        Product(
+            id=cols['id'][i],
+            name=strings.get(cols['name'][i]),
+            category=CATEGORIES_BY_CODE[cols['category'][i]],
+            price=cols['price'][i],
+            quantity=cols['quantity'][i],
+            min_stock=cols['min_stock'][i],
+            barcode=strings.get(cols['barcode'][i]),
+            description=strings.get(cols['description'][i])
+        )
+        for i in range(counts['products'])
+    ]
+    cols = _map_columns(path, 'customers', CUSTOMER_COLUMNS)
+    customers = [
+        Customer(
+            id=cols['id'][i],
+            name=strings.get(cols['name'][i]),
+            phone=strings.get(cols['phone'][i]),
+            email=strings.get(cols['email'][i]),
+            discount=cols['discount'][i],
+            total_purchases=cols['total_purchases'][i]
+        )
+        for i in range(counts['customers'])
+    ]
+    logic.replace_catalog(products, customers)
+
+    # История только отображается - записи создаются при обращении
+    logic.sales = MappedRecords(make_sale, _map_columns(path, 'sales', SALE_COLUMNS), counts['sales'])
+    logic.supplies = MappedRecords(make_supply, _map_columns(path, 'supplies', SUPPLY_COLUMNS), counts['supplies'])
+    logic.snapshot_generation = generation
+
+    with open(os.path.join(path, 'costing.json'), encoding='utf-8') as f:
+        logic.costing = CostLayerEngine.from_dict(json.load(f))
+
+    high_water = meta['high_water']
+    logic.next_product_id = high_water['products'] + 1
+    logic.next_customer_id = high_water['customers'] + 1
+    logic.next_sale_id = high_water['sales'] + 1
+    logic.next_supply_id = high_water['supplies'] + 1
+    # В снимках без отметки журнала справочники догружаются целиком
+    logic.last_change_id = high_water.get('changes')
+    return logic, high_water
+
+
+def _product(p) -> Product:
+    return Product(
+        id=p.id,
+        name=p.name,
+        category=p.category,
+        price=p.price,
+        quantity=p.quantity,
+        min_stock=p.min_stock,
+        barcode=p.barcode,
+        description=p.description
+    )
+
+
+def _customer(c) -> Customer:
+    return Customer(
+        id=c.id,
+        name=c.name,
+        phone=c.phone,
+        email=c.email,
+        discount=c.discount,
+        total_purchases=c.total_purchases
+    )
+
+
+def _replay_catalog(logic: StoreLogic, db, change_id: Optional[int]):
+    """Догрузить справочники: только строки, изменённые после записи change_log change_id.
+
+    Если отметки нет или журнал уже не покрывает период, справочники
+    перечитываются целиком.
+    """
+    # Отметка берётся до чтения строк: изменения, записанные во время
+    # чтения, будут прочитаны ещё раз в следующий раз
+    last_change_id = db.get_last_change_id()
+    changed = None if change_id is None else db.get_changed_row_ids(change_id, ('products', 'customers'))
+    if changed is None:
+        logic.replace_catalog([_product(p) for p in db.get_product_records()],
+                              [_customer(c) for c in db.get_customer_records()])
+    else:
+        products = [_product(p) for p in db.get_product_records(changed['products'])] \
+            if changed['products'] else []
+        customers = [_customer(c) for c in db.get_customer_records(changed['customers'])] \
+            if changed['customers'] else []
+        # Изменённых строк, которых больше нет в БД, - удалены
+        logic.update_catalog(
+            products, customers,
+            changed['products'] - {p.id for p in products},
+            changed['customers'] - {c.id for c in customers},
+        )
+    logic.last_change_id = last_change_id
+
+
+def replay_from_db(logic: StoreLogic, db, high_water: Dict[str, int]):
+    """Догрузить из БД изменения новее отметки high-water.
+
+    Из справочников товаров и клиентов читаются только строки, изменённые
+    после снимка (по журналу change_log), из истории - только новые строки.
+    """
+    _replay_catalog(logic, db, high_water.get('changes'))
+
+    new_sales = db.get_sales_after(high_water['sales'])
+    new_supplies = db.get_supplies_after(high_water['supplies'])
+    # Себестоимость считается только для новых строк
+    cogs = logic.costing.process(new_supplies, new_sales)
+
+    for s in new_sales:
+        logic.sales.append(Sale(
+            id=s.id,
+            product_id=s.product_id,
+            customer_id=s.customer_id,
+            quantity=s.quantity,
+            price=s.price,
+            date=s.date,
+            total=s.total,
+            cogs=cogs.get(s.id, 0.0)
+        ))
+        logic.next_sale_id = s.id + 1
+
+    for s in new_supplies:
+        logic.supplies.append(Supply(
+            id=s.id,
+            supplier=s.supplier,
+            product_id=s.product_id,
+            quantity=s.quantity,
+            cost=s.cost,
+            date=s.date
+        ))
+        logic.next_supply_id = s.id + 1
+
+
+def restore_store_logic(path: str, db=None) -> StoreLogic:
+    """Восстановить StoreLogic из снимка и догрузить новые строки из БД"""
+    loaded = load_snapshot(path)
+    if loaded is None:
+        logic = StoreLogic()
+    else:
+        logic, _ = loaded
+    if db is not None:
+        replay_from_db(logic, db, high_water_mark(logic))
+    return logic
+
+
+def save_store_logic(logic: StoreLogic, path: str, db=None):
+    """Догрузить последние изменения из БД и сохранить снимок"""
+    if db is not None:
+        replay_from_db(logic, db, high_water_mark(logic))
+    save_snapshot(logic, path)
@@ -1,14 +1,11 @@
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
-from enum import Enum
-
-class ProductCategory(Enum):
-    ELECTRONICS = "Электроника"
-    CLOTHING = "Одежда"
-    FOOD = "Продукты"
-    BOOKS = "Книги"
-    OTHER = "Другое"
+from categories import ProductCategory
+from logic.search_index import ProductSearchIndex
+from logic.costing import CostLayerEngine
+from logic.money import apply_discount, from_minor, line_total, money_sum, round_money, to_minor
 
 @dataclass
 class Product:
@@ -35,7 +32,7 @@ class Product:
     @property
     def total_value(self) -> float:
         """Общая стоимость товара на складе"""
-        return self.price * self.quantity
+        return line_total(self.price, self.quantity)
 
 @dataclass
 class Customer:
@@ -48,8 +45,8 @@ class Customer:
     total_purchases: float = 0.0
     
     def apply_discount(self, amount: float) -> float:
-        """Применить скидку клиента"""
-        return amount * (1 - self.discount / 100)
+        """Применить скидку клиента (с округлением до копейки)"""
+        return apply_discount(amount, self.discount)
 
 @dataclass
 class Sale:
@@ -61,14 +58,17 @@ class Sale:
     price: float
     date: datetime
     total: float
+    cogs: float = 0.0  # себестоимость по слоям поставок
     
     @classmethod
     def create_sale(cls, product: Product, customer: Optional[Customer], 
-                   quantity: int) -> 'Sale':
-        """Создать новую продажу"""
-        total = product.price * quantity
-        if customer:
-            total = customer.apply_discount(total)
+                   quantity: int, pricing=None) -> 'Sale':
+        """Создать новую продажу (pricing - PricingEngine с акционными правилами)"""
+        if pricing is not None:
+            total = round_money(pricing.price_one(product.price, quantity, product.category,
+                                                  customer.discount if customer else 0.0, product.id))
+        else:
+            total = line_total(product.price, quantity, customer.discount if customer else 0.0)
         
         return cls(
             id=0,
@@ -90,8 +90,17 @@ class Supply:
     cost: float
     date: datetime
 
+# Количество полос блокировок для товаров и клиентов
+LOCK_STRIPES = 64
+
 class StoreLogic:
-    """Основная логика магазина"""
+    """Основная логика магазина.
+
+    Безопасна для использования из нескольких потоков: изменения товара и
+    клиента защищены блокировками-полосами по их ID, а выдача ID - отдельной
+    блокировкой на каждый счётчик. Операции над разными товарами не ждут
+    друг друга.
+    """
     
     def __init__(self):
         self.products: Dict[int, Product] = {}
@@ -102,20 +111,82 @@ class StoreLogic:
         self.next_customer_id = 1
         self.next_sale_id = 1
         self.next_supply_id = 1
+        self.search_index = ProductSearchIndex()
+        # Движок ценообразования (logic.pricing.PricingEngine), если заданы акции
+        self.pricing = None
+        # Себестоимость продаж по слоям поставок
+        self.costing = CostLayerEngine()
+        # Последняя учтённая запись журнала изменений БД (change_log); None -
+        # неизвестна, справочники догружаются из БД целиком
+        self.last_change_id = None
+        # Поколение снимка, колонки которого отображены в память (sales, supplies)
+        self.snapshot_generation = None
         
+        self._product_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._customer_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._id_locks = {
+            'next_product_id': threading.Lock(),
+            'next_customer_id': threading.Lock(),
+            'next_sale_id': threading.Lock(),
+            'next_supply_id': threading.Lock(),
+        }
+    
+    def _product_lock(self, product_id: int) -> threading.Lock:
+        """Блокировка полосы, в которую попадает товар"""
+        return self._product_locks[hash(product_id) % LOCK_STRIPES]
+    
+    def _customer_lock(self, customer_id: int) -> threading.Lock:
+        """Блокировка полосы, в которую попадает клиент"""
+        return self._customer_locks[hash(customer_id) % LOCK_STRIPES]
+    
+    def _allocate_id(self, counter: str) -> int:
+        """Атомарно выдать следующий ID из счётчика"""
+        with self._id_locks[counter]:
+            value = getattr(self, counter)
+            setattr(self, counter, value + 1)
+            return value
+        
+    def replace_catalog(self, products: List[Product], customers: List[Customer]):
+        """Заменить справочники товаров и клиентов (при загрузке из снимка или БД)"""
+        self.products = {p.id: p for p in products}
+        self.customers = {c.id: c for c in customers}
+        self.next_product_id = max(self.products, default=self.next_product_id - 1) + 1
+        self.next_customer_id = max(self.customers, default=self.next_customer_id - 1) + 1
+        self.search_index.rebuild(products)
+    
+    def update_catalog(self, products: List[Product], customers: List[Customer],
+                       removed_products=(), removed_customers=()):
+        """Точечно обновить справочники: заменить или добавить записи, удалить removed_*"""
+        for product_id in removed_products:
+            if self.products.pop(product_id, None) is not None:
+                self.search_index.remove(product_id)
+        for product in products:
+            old = self.products.get(product.id)
+            self.products[product.id] = product
+            if old is None:
+                self.search_index.add(product)
+            elif old.name != product.name or old.category != product.category:
+                self.search_index.update(product)
+        for customer_id in removed_customers:
+            self.customers.pop(customer_id, None)
+        for customer in customers:
+            self.customers[customer.id] = customer
+        self.next_product_id = max(self.next_product_id, max(self.products, default=0) + 1)
+        self.next_customer_id = max(self.next_customer_id, max(self.customers, default=0) + 1)
+    
     def add_product(self, name: str, category: ProductCategory, 
                    price: float, quantity: int, min_stock: int) -> Product:
         """Добавить новый товар"""
         product = Product(
-            id=self.next_product_id,
+            id=self._allocate_id('next_product_id'),
             name=name,
             category=category,
             price=price,
             quantity=quantity,
             min_stock=min_stock
         )
-        self.products[self.next_product_id] = product
-        self.next_product_id += 1
+        self.products[product.id] = product
+        self.search_index.add(product)
         return product
     
     def update_product(self, product_id: int, **kwargs) -> Optional[Product]:
@@ -123,91 +194,99 @@ class StoreLogic:
         if product_id not in self.products:
             return None
         
-        product = self.products[product_id]
-        for key, value in kwargs.items():
-            if hasattr(product, key):
-                setattr(product, key, value)
+        with self._product_lock(product_id):
+            product = self.products.get(product_id)
+            if product is None:
+                return None
+            for key, value in kwargs.items():
+                if hasattr(product, key):
+                    setattr(product, key, value)
+            if 'name' in kwargs or 'category' in kwargs:
+                self.search_index.update(product)
         
         return product
     
     def delete_product(self, product_id: int) -> bool:
         """Удалить товар"""
-        if product_id in self.products:
-            del self.products[product_id]
+        with self._product_lock(product_id):
+            if self.products.pop(product_id, None) is None:
+                return False
+            self.search_index.remove(product_id)
             return True
-        return False
     
     def add_customer(self, name: str, phone: str, email: str, discount: float = 0) -> Customer:
         """Добавить нового клиента"""
         customer = Customer(
-            id=self.next_customer_id,
+            id=self._allocate_id('next_customer_id'),
             name=name,
             phone=phone,
             email=email,
             discount=discount
         )
-        self.customers[self.next_customer_id] = customer
-        self.next_customer_id += 1
+        self.customers[customer.id] = customer
         return customer
     
     def process_sale(self, product_id: int, quantity: int, 
                     customer_id: Optional[int] = None) -> Optional[Sale]:
         """Обработать продажу"""
-        if product_id not in self.products:
-            return None
-        
-        product = self.products[product_id]
-        
-        if product.quantity < quantity:
-            return None
-        
         customer = self.customers.get(customer_id) if customer_id else None
         
-        # Создаем продажу
-        sale = Sale.create_sale(product, customer, quantity)
-        sale.id = self.next_sale_id
-        self.next_sale_id += 1
+        # Проверка остатка и списание - атомарно в пределах полосы товара
+        with self._product_lock(product_id):
+            product = self.products.get(product_id)
+            if product is None or product.quantity < quantity:
+                return None
+            
+            # Создаем продажу
+            sale = Sale.create_sale(product, customer, quantity, self.pricing)
+            
+            # Обновляем количество товара и списываем себестоимость
+            product.quantity -= quantity
+            sale.cogs = self.costing.consume(product_id, quantity)
         
-        # Обновляем количество товара
-        product.quantity -= quantity
+        sale.id = self._allocate_id('next_sale_id')
         
         # Обновляем статистику клиента
         if customer:
-            customer.total_purchases += sale.total
+            with self._customer_lock(customer.id):
+                customer.total_purchases = round_money(customer.total_purchases + sale.total)
         
+        # list.append атомарен, отдельная блокировка не нужна
         self.sales.append(sale)
         return sale
     
     def add_supply(self, supplier: str, product_id: int, 
                   quantity: int, cost: float) -> Optional[Supply]:
         """Добавить поставку"""
-        if product_id not in self.products:
-            return None
+        with self._product_lock(product_id):
+            product = self.products.get(product_id)
+            if product is None:
+                return None
+            
+            # Обновляем количество товара и открываем слой себестоимости
+            product.quantity += quantity
+            self.costing.add_supply(product_id, quantity, cost)
         
         supply = Supply(
-            id=self.next_supply_id,
+            id=self._allocate_id('next_supply_id'),
             supplier=supplier,
             product_id=product_id,
             quantity=quantity,
             cost=cost,
             date=datetime.now()
         )
-        self.next_supply_id += 1
-        
-        # Обновляем количество товара
-        self.products[product_id].quantity += quantity
         
         self.supplies.append(supply)
         return supply
     
     def get_low_stock_products(self) -> List[Product]:
         """Получить товары с низким запасом"""
-        return [p for p in self.products.values() 
+        return [p for p in list(self.products.values()) 
                 if p.quantity < p.min_stock]
     
     def get_total_inventory_value(self) -> float:
         """Получить общую стоимость инвентаря"""
-        return sum(p.total_value for p in self.products.values())
+        return money_sum(p.total_value for p in list(self.products.values()))
     
     def get_sales_by_period(self, start_date: datetime, 
                            end_date: datetime) -> List[Sale]:
@@ -217,25 +296,29 @@ class StoreLogic:
     
     def get_total_sales(self) -> float:
         """Получить общую сумму продаж"""
-        return sum(s.total for s in self.sales)
+        return money_sum(s.total for s in self.sales)
     
     def get_total_profit(self) -> float:
-        """Получить общую прибыль"""
-        sales_total = self.get_total_sales()
-        supply_costs = sum(s.cost for s in self.supplies)
-        return sales_total - supply_costs
-    
-    def search_products(self, query: str) -> List[Product]:
-        """Поиск товаров"""
-        query = query.lower()
-        results = []
-        
-        for product in self.products.values():
-            if (query in product.name.lower() or 
-                query in product.category.value.lower()):
-                results.append(product)
-        
-        return results
+        """Получить общую прибыль (выручка минус себестоимость проданного)"""
+        # В копейках, как money_sum: разность сумм float накапливала бы ошибку
+        return from_minor(sum(to_minor(s.total) - to_minor(s.cogs) for s in self.sales))
+    
+    def search_products(self, query: str, fuzzy: bool = False,
+                        limit: Optional[int] = None) -> List[Product]:
+        """Поиск товаров по подстроке названия или категории.
+
+        При fuzzy=True ищет похожие названия с учётом опечаток (по умолчанию до 10).
+        """
+        if fuzzy:
+            ids = self.search_index.fuzzy(query, limit or 10)
+        else:
+            ids = self.search_index.search(query, limit)
+        return [self.products[pid] for pid in ids if pid in self.products]
+    
+    def suggest_products(self, prefix: str, limit: int = 10) -> List[Product]:
+        """Подсказки товаров по началу названия"""
+        ids = self.search_index.prefix(prefix, limit)
+        return [self.products[pid] for pid in ids if pid in self.products]
     
     def get_best_selling_products(self, limit: int = 10) -> List[Tuple[Product, int]]:
         """Получить самые продаваемые товары"""
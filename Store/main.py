@@ -1,36 +1,179 @@
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QTableWidgetItem, QMessageBox
-from PyQt5.QtCore import Qt
+import uuid
+# Первым - отсчет времени запуска (STORE_STARTUP_TIMING=1 выводит разбивку)
+from perf.startup import startup
+from perf.instrumentation import instrumentation
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from PyQt5.QtCore import QTimer
 from ui.main_window import ModernMainWindow
+from ui.table_models import (LazyTableModel, PRODUCT_COLUMNS, SALE_COLUMNS,
+                             SUPPLY_COLUMNS, CUSTOMER_COLUMNS)
+from ui.db_worker import DbWorker, DbChangeRelay
+from ui.change_watcher import ChangeWatcher
+from ui.perf_hud import PerfHud, PERF_HUD_ENV
 from database.db_manager import DatabaseManager
-from logic.store_logic import StoreLogic, ProductCategory
+from categories import to_category
+from database.journal import OperationJournal, JournalReplayer
+from database.cost_updater import CostOfGoodsUpdater
+from database.reporting import ReportingSnapshot
+from database.archive import SalesArchive, ARCHIVE_PATH
+from logic.snapshot import restore_store_logic, save_store_logic
 from reports.inventory_reports import InventoryReports
 
+# Каталог бинарного снимка StoreLogic
+SNAPSHOT_PATH = 'snapshot'
+# Файл правил ценообразования (акции, скидки от количества)
+PRICING_RULES_PATH = 'pricing_rules.json'
+# Каталог локального журнала продаж и поставок
+JOURNAL_PATH = 'journal'
+# Запись дольше этого (мс) уходит в журнал, чтобы не задерживать кассу
+SLOW_WRITE_MS = 1500
+# Отчеты строятся по снимку БД не старше стольких секунд
+REPORT_SNAPSHOT_MAX_AGE = 10
+
+def product_row_text(row):
+    """Текст товара в комбобоксе"""
+    return f"{row.name} (Остаток: {row.quantity})"
+
+def customer_row_text(row):
+    """Текст клиента в комбобоксе"""
+    return f"{row.name} ({row.phone})"
+
 class StoreApp:
     """Главный класс приложения магазина"""
     
     def __init__(self):
+        startup.mark("импорт модулей")
         self.app = QApplication(sys.argv)
         self.app.setApplicationName("Store Management System")
+        startup.mark("QApplication")
+        
+        # Статистика запросов к БД (STORE_QUERY_STATS=<файл.json>);
+        # панели производительности (STORE_PERF_HUD=1) она тоже нужна
+        instrumentation.enable_from_env()
+        if os.environ.get(PERF_HUD_ENV):
+            instrumentation.enable()
         
         # Инициализация компонентов
         self.db = DatabaseManager()
-        self.logic = StoreLogic()
-        self.reports = InventoryReports(self.db)
+        # Отчеты читают снимок БД (и архив истории за старые периоды) и
+        # выполняются в отдельном фоновом потоке: долгий отчет не задерживает продажи
+        self.reports = InventoryReports(self.db, ReportingSnapshot(self.db, max_age=REPORT_SNAPSHOT_MAX_AGE),
+                                        SalesArchive(ARCHIVE_PATH))
+        startup.mark("база данных")
+        
+        # Обращения к БД выполняются в фоновом потоке
+        self.worker = DbWorker()
+        self.report_worker = DbWorker()
+        
+        # Продажи и поставки, не записанные в БД, сохраняются в локальный журнал
+        # и применяются в фоне; pending_writes - операции, ожидающие ответа БД
+        self.journal = OperationJournal(JOURNAL_PATH)
+        self.replayer = JournalReplayer(self.journal, self.db)
+        self.pending_writes = {}
+        
+        # Правила ценообразования, если заданы
+        self.pricing = None
+        if os.path.exists(PRICING_RULES_PATH):
+            from logic.pricing import PricingEngine, PricingRules
+            self.pricing = PricingEngine(PricingRules.from_file(PRICING_RULES_PATH))
+            self.db.pricing = self.pricing
+        
+        # Снимок отображается в память, из БД догружаются только новые строки;
+        # восстановление идет в фоне и не задерживает появление окна
+        self.logic = None
+        self.worker.submit(restore_store_logic, SNAPSHOT_PATH, self.db,
+                           on_result=self.on_logic_restored,
+                           on_error=lambda e: print(f"Ошибка восстановления снимка: {e}"))
         
         # Создание главного окна
         self.main_window = ModernMainWindow()
+        self.worker.busy_changed.connect(self.main_window.set_busy)
+        self.perf_hud = PerfHud(self.app, self.main_window, self.worker, instrumentation)
+        startup.mark("главное окно")
+        self.setup_table_models()
+        self.setup_pickers()
+        
+        # Уведомления об изменениях строк - точечное обновление интерфейса
+        self.db_changes = DbChangeRelay()
+        self.db_changes.changed.connect(self.on_data_changed)
+        self.db.add_change_listener(self.db_changes)
+        
+        # Себестоимость новых продаж досчитывается в фоне после записи;
+        # отчеты и снимок для отчетов ее только читают
+        self.cost_updater = CostOfGoodsUpdater(self.db).start()
         
         # Переменная для хранения выбранного товара
         self.selected_product_id = None
         
+        # Строки оформляемого чека: строка товара из комбобокса и количество
+        self.basket = []
+        
         # Подключение сигналов
         self.connect_signals()
         
-        # Загрузка начальных данных
+        # Данные вкладок загружаются при первом открытии
+        self.loaded_tabs = set()
         self.load_initial_data()
-        
+        startup.mark("первая вкладка")
+        
+        # Изменения с других терминалов (PRAGMA data_version + change_log)
+        self.change_watcher = ChangeWatcher(self.db, self.worker)
+        self.change_watcher.changed.connect(self.on_data_changed)
+        self.change_watcher.start()
+        
+        self.replayer.start()
+        self.journal_timer = QTimer()
+        self.journal_timer.timeout.connect(
+            lambda: self.main_window.set_journal_pending(self.journal.count()))
+        self.journal_timer.start(1000)
+        
+        # Сохранение снимка при выходе (после завершения фоновых запросов)
+        self.app.aboutToQuit.connect(self.change_watcher.stop)
+        self.app.aboutToQuit.connect(self.replayer.stop)
+        self.app.aboutToQuit.connect(self.cost_updater.stop)
+        self.app.aboutToQuit.connect(self.worker.wait_idle)
+        self.app.aboutToQuit.connect(self.report_worker.wait_idle)
+        self.app.aboutToQuit.connect(self.save_snapshot)
+        self.app.aboutToQuit.connect(self.export_query_stats)
+        
+    def setup_table_models(self):
+        """Модели таблиц с подгрузкой страниц из БД"""
+        self.products_model = LazyTableModel(
+            PRODUCT_COLUMNS, self.db.get_products_page, self.db.count_products,
+            worker=self.worker, fetch_rows=self.db.get_product_rows)
+        self.sales_model = LazyTableModel(
+            SALE_COLUMNS, self.db.get_sales_page, self.db.count_sales,
+            order_by='date', descending=True, worker=self.worker,
+            fetch_rows=self.db.get_sale_rows)
+        self.supplies_model = LazyTableModel(
+            SUPPLY_COLUMNS, self.db.get_supplies_page, self.db.count_supplies,
+            order_by='date', descending=True, worker=self.worker,
+            fetch_rows=self.db.get_supply_rows)
+        self.customers_model = LazyTableModel(
+            CUSTOMER_COLUMNS, self.db.get_customers_page, self.db.count_customers,
+            worker=self.worker, fetch_rows=self.db.get_customer_rows)
+        window = self.main_window
+        self.table_models = {
+            'products': (self.products_model, window.products_tab),
+            'sales': (self.sales_model, window.sales_tab),
+            'supplies': (self.supplies_model, window.supply_tab),
+            'customers': (self.customers_model, window.customers_tab),
+        }
+        
+        for view, model, filter_input in (
+            (window.products_table, self.products_model, window.products_filter_input),
+            (window.sales_history_table, self.sales_model, window.sales_filter_input),
+            (window.supplies_table, self.supplies_model, window.supplies_filter_input),
+            (window.customers_table, self.customers_model, window.customers_filter_input),
+        ):
+            view.setModel(model)
+            # Индикатор сортировки без повторного запроса к БД
+            view.horizontalHeader().setSortIndicator(model.sort_column(), model.sort_order())
+            filter_input.textChanged.connect(model.set_filter)
+            model.refreshed.connect(lambda view=view: self.resize_columns(view))
+    
     def connect_signals(self):
         """Подключение сигналов к слотам"""
         # Товары
@@ -40,10 +183,14 @@ class StoreApp:
         self.main_window.refresh_products_btn.clicked.connect(self.refresh_products)
         
         # Подключение сигнала выбора строки в таблице
-        self.main_window.products_table.itemSelectionChanged.connect(self.on_product_selected)
+        self.main_window.products_table.selectionModel().selectionChanged.connect(self.on_product_selected)
         
         # Продажи
         self.main_window.process_sale_btn.clicked.connect(self.process_sale)
+        self.main_window.add_to_basket_btn.clicked.connect(self.add_to_basket)
+        self.main_window.remove_basket_line_btn.clicked.connect(self.remove_basket_line)
+        self.main_window.clear_basket_btn.clicked.connect(self.clear_basket)
+        self.main_window.sale_customer_combo.currentIndexChanged.connect(self.update_basket_view)
         self.main_window.refresh_sales_history_btn.clicked.connect(self.refresh_sales_history)
         
         # Поставки
@@ -60,115 +207,158 @@ class StoreApp:
         self.main_window.export_excel_btn.clicked.connect(self.export_to_excel)
         
     def load_initial_data(self):
-        """Загрузка начальных данных"""
-        # Загрузка товаров
-        self.refresh_products()
-        
-        # Загрузка клиентов
-        self.refresh_customers()
-        
-        # Обновление комбобоксов
-        self.update_product_comboboxes()
-        self.update_customer_combobox()
-        
-        # Загрузка истории
-        self.refresh_sales_history()
-        self.refresh_supplies_history()
-        
-        # Обновление статистики
+        """Загрузка начальных данных (только открытая вкладка)"""
+        window = self.main_window
+        self.tab_loaders = {
+            window.products_tab: self.load_products_tab,
+            window.sales_tab: self.load_sales_tab,
+            window.supply_tab: self.load_supply_tab,
+            window.customers_tab: self.load_customers_tab,
+            window.reports_tab: self.load_reports_tab,
+        }
+        window.tab_widget.currentChanged.connect(self.on_tab_changed)
+        self.on_tab_changed(window.tab_widget.currentIndex())
+    
+    def on_tab_changed(self, index):
+        """Загрузка данных вкладки при первом открытии"""
+        tab = self.main_window.tab_widget.widget(index)
+        if tab is None or tab in self.loaded_tabs:
+            return
+        self.loaded_tabs.add(tab)
+        self.tab_loaders[tab]()
+    
+    def is_loaded(self, tab):
+        """Загружены ли данные вкладки"""
+        return tab in self.loaded_tabs
+    
+    def load_products_tab(self):
+        """Загрузка вкладки Товары"""
+        self.products_model.refresh()
+    
+    def load_sales_tab(self):
+        """Загрузка вкладки Продажи"""
+        self.sales_model.refresh()
+        self.main_window.sale_product_combo.reload()
+        self.main_window.sale_customer_combo.reload()
+    
+    def load_supply_tab(self):
+        """Загрузка вкладки Поставки"""
+        self.supplies_model.refresh()
+        self.main_window.supply_product_combo.reload()
+    
+    def load_customers_tab(self):
+        """Загрузка вкладки Клиенты"""
+        self.customers_model.refresh()
+    
+    def load_reports_tab(self):
+        """Загрузка вкладки Отчеты"""
         self.update_statistics()
     
+    def on_logic_restored(self, logic):
+        """StoreLogic восстановлен из снимка"""
+        logic.pricing = self.pricing
+        self.logic = logic
+    
+    def on_db_error(self, error):
+        """Ошибка фонового запроса к БД"""
+        self.main_window.show_message("Ошибка", str(error))
+    
+    def on_data_changed(self, change):
+        """Точечное обновление интерфейса после записи в БД"""
+        window = self.main_window
+        # Счетчики статистики ведутся в БД - перечитываем одну строку;
+        # sale_costs - досчитана себестоимость, изменилась прибыль
+        if self.is_loaded(window.reports_tab) and change.table in ('products', 'sales', 'supplies', 'sale_costs'):
+            self.update_statistics()
+        
+        model, tab = self.table_models.get(change.table, (None, None))
+        if model is None:
+            return
+        if self.is_loaded(tab):
+            model.apply_change(change)
+        
+        # Комбобоксы есть только на вкладках Продажи и Поставки
+        if self.is_loaded(window.sales_tab) or self.is_loaded(window.supply_tab):
+            self.patch_pickers(change)
+    
+    def patch_pickers(self, change):
+        """Обновить комбобоксы для измененных товаров или клиентов"""
+        ids = list(change.ids)
+        if change.action == 'reload':
+            if change.table == 'products':
+                self.update_product_comboboxes()
+            elif change.table == 'customers':
+                self.update_customer_combobox()
+        elif change.table == 'products':
+            if change.action == 'delete':
+                self.patch_products(ids, [])
+            else:
+                self.worker.submit(self.db.get_product_rows, ids,
+                                   on_result=lambda rows: self.patch_products(ids, rows))
+        elif change.table == 'customers':
+            if change.action == 'delete':
+                self.patch_customers(ids, [])
+            else:
+                self.worker.submit(self.db.get_customer_rows, ids,
+                                   on_result=lambda rows: self.patch_customers(ids, rows))
+    
+    def patch_products(self, ids, rows):
+        """Обновить комбобоксы для измененных товаров"""
+        texts = {row.id: product_row_text(row) for row in rows}
+        rows = {row.id: row for row in rows}
+        self.main_window.sale_product_combo.patch_items(ids, texts, rows)
+        self.main_window.supply_product_combo.patch_items(ids, texts, rows)
+    
+    def patch_customers(self, ids, rows):
+        """Обновить комбобокс для измененных клиентов"""
+        texts = {row.id: customer_row_text(row) for row in rows}
+        self.main_window.sale_customer_combo.patch_items(ids, texts, {row.id: row for row in rows})
+    
+    def setup_pickers(self):
+        """Комбобоксы товаров и клиентов с поиском по мере ввода"""
+        window = self.main_window
+        for picker in (window.sale_product_combo, window.supply_product_combo):
+            picker.set_source(self.search_products, product_row_text, self.worker)
+        window.sale_customer_combo.set_source(self.search_customers, customer_row_text, self.worker)
+    
+    def search_products(self, text, limit):
+        """Лучшие совпадения товаров для комбобокса (по названию или штрихкоду)"""
+        return self.db.get_products_page(limit=limit, order_by='name', search=text or None)
+    
+    def search_customers(self, text, limit):
+        """Лучшие совпадения клиентов для комбобокса (по имени, телефону, email)"""
+        return self.db.get_customers_page(limit=limit, order_by='name', search=text or None)
+    
     def update_product_comboboxes(self):
         """Обновление комбобоксов с товарами"""
-        products = self.db.get_all_products()
-        
-        # Обновляем комбобокс на вкладке Продажи
-        self.main_window.sale_product_combo.clear()
-        for product in products:
-            self.main_window.sale_product_combo.addItem(f"{product.name} (Остаток: {product.quantity})", product.id)
-        
-        # Обновляем комбобокс на вкладке Поставки
-        self.main_window.supply_product_combo.clear()
-        for product in products:
-            self.main_window.supply_product_combo.addItem(f"{product.name} (Остаток: {product.quantity})", product.id)
+        self.main_window.sale_product_combo.reload()
+        self.main_window.supply_product_combo.reload()
     
     def update_customer_combobox(self):
         """Обновление комбобокса с клиентами"""
-        customers = self.db.get_all_customers()
-        
-        # Обновляем комбобокс на вкладке Продажи
-        self.main_window.sale_customer_combo.clear()
-        self.main_window.sale_customer_combo.addItem("Без клиента", None)  # Опция без клиента
-        for customer in customers:
-            self.main_window.sale_customer_combo.addItem(f"{customer.name} ({customer.phone})", customer.id)
+        self.main_window.sale_customer_combo.reload()
     
     def refresh_sales_history(self):
         """Обновление истории продаж"""
-        try:
-            sales = self.db.get_recent_sales(days=30)  # Получаем продажи за последние 30 дней
-            
-            table = self.main_window.sales_history_table
-            table.setRowCount(len(sales))
-            
-            for row, sale in enumerate(sales):
-                table.setItem(row, 0, QTableWidgetItem(str(sale.id)))
-                table.setItem(row, 1, QTableWidgetItem(sale.date.strftime("%d.%m.%Y %H:%M")))
-                
-                # Получаем название товара
-                product = self.db.get_product_by_id(sale.product_id)
-                product_name = product.name if product else f"Товар ID:{sale.product_id}"
-                table.setItem(row, 2, QTableWidgetItem(product_name))
-                
-                table.setItem(row, 3, QTableWidgetItem(str(sale.quantity)))
-                table.setItem(row, 4, QTableWidgetItem(f"{sale.total:.2f} ₽"))
-                
-                # Получаем имя клиента
-                if sale.customer_id:
-                    customer = self.db.get_customer_by_id(sale.customer_id)
-                    customer_name = customer.name if customer else f"Клиент ID:{sale.customer_id}"
-                else:
-                    customer_name = "Без клиента"
-                table.setItem(row, 5, QTableWidgetItem(customer_name))
-            
-            table.resizeColumnsToContents()
-            
-        except Exception as e:
-            print(f"Ошибка обновления истории продаж: {e}")
+        self.sales_model.refresh()
     
     def refresh_supplies_history(self):
         """Обновление истории поставок"""
-        try:
-            supplies = self.db.get_recent_supplies(days=30)  # Получаем поставки за последние 30 дней
-            
-            table = self.main_window.supplies_table
-            table.setRowCount(len(supplies))
-            
-            for row, supply in enumerate(supplies):
-                table.setItem(row, 0, QTableWidgetItem(str(supply.id)))
-                table.setItem(row, 1, QTableWidgetItem(supply.date.strftime("%d.%m.%Y %H:%M")))
-                table.setItem(row, 2, QTableWidgetItem(supply.supplier))
-                
-                # Получаем название товара
-                product = self.db.get_product_by_id(supply.product_id)
-                product_name = product.name if product else f"Товар ID:{supply.product_id}"
-                table.setItem(row, 3, QTableWidgetItem(product_name))
-                
-                table.setItem(row, 4, QTableWidgetItem(str(supply.quantity)))
-                table.setItem(row, 5, QTableWidgetItem(f"{supply.cost:.2f} ₽"))
-            
-            table.resizeColumnsToContents()
-            
-        except Exception as e:
-            print(f"Ошибка обновления истории поставок: {e}")
+        self.supplies_model.refresh()
+    
+    def resize_columns(self, view):
+        """Подогнать ширину колонок по первой странице (один раз)"""
+        if not view.property("columns_sized") and view.model().rowCount():
+            view.resizeColumnsToContents()
+            view.setProperty("columns_sized", True)
     
     def on_product_selected(self):
         """Обработка выбора товара в таблице"""
-        selected_items = self.main_window.products_table.selectedItems()
+        selected_rows = self.main_window.products_table.selectionModel().selectedRows()
         
-        if selected_items:
-            # Получаем ID товара из первого столбца выбранной строки
-            row = selected_items[0].row()
-            product_id = int(self.main_window.products_table.item(row, 0).text())
+        if selected_rows:
+            # Получаем ID товара выбранной строки из модели
+            product_id = self.products_model.row_id(selected_rows[0].row())
             
             self.selected_product_id = product_id
             self.main_window.edit_product_btn.setEnabled(True)
@@ -183,23 +373,16 @@ class StoreApp:
     
     def load_product_to_form(self, product_id):
         """Загрузка данных товара в форму"""
-        product = self.db.get_product_by_id(product_id)
+        self.worker.submit(self.db.get_product_by_id, product_id,
+                           on_result=self.fill_product_form, key='product_form')
+    
+    def fill_product_form(self, product):
+        """Заполнение формы данными товара"""
         if product:
             self.main_window.product_name_input.setText(product.name)
             
-            # Устанавливаем категорию
-            if hasattr(product.category, 'value'):
-                category_text = product.category.value
-            elif isinstance(product.category, str):
-                try:
-                    category_enum = ProductCategory[product.category]
-                    category_text = category_enum.value
-                except KeyError:
-                    category_text = product.category
-            else:
-                category_text = str(product.category)
-            
-            index = self.main_window.product_category_input.findText(category_text)
+            # Категория товара из БД - член ProductCategory
+            index = self.main_window.product_category_input.findText(product.category.value)
             if index >= 0:
                 self.main_window.product_category_input.setCurrentIndex(index)
             
@@ -212,20 +395,7 @@ class StoreApp:
         try:
             name = self.main_window.product_name_input.text().strip()
 
-            selected_category_text = self.main_window.product_category_input.currentText()
-
-            # Находим соответствующее значение перечисления
-            category_enum = None
-            for cat in ProductCategory:
-                if cat.value == selected_category_text:
-                    category_enum = cat
-                    break
-        
-            if category_enum is None:
-                self.main_window.show_message("Ошибка", f"Неизвестная категория: {selected_category_text}")
-                return
-
-            category = category_enum.name  # Используем .name вместо .value
+            category = to_category(self.main_window.product_category_input.currentText())
 
             price = self.main_window.product_price_input.value()
             quantity = self.main_window.product_quantity_input.value()
@@ -235,25 +405,27 @@ class StoreApp:
                 self.main_window.show_message("Ошибка", "Введите название товара")
                 return
             
-            # Используем логику
-            product = self.logic.add_product(name, category, price, quantity, min_stock)
-            
-            # Сохраняем в БД - передаем имя enum
-            self.db.add_product(
+            # Сохраняем в БД
+            # (StoreLogic догрузит товар из БД при сохранении снимка)
+            self.worker.submit(
+                self.db.add_product,
                 name=name,
                 category=category,
                 price=price,
                 quantity=quantity,
-                min_stock=min_stock
+                min_stock=min_stock,
+                on_result=lambda product: self.on_product_added(name),
+                on_error=self.on_db_error
             )
             
-            self.main_window.show_message("Успех", f"Товар '{name}' добавлен!")
-            self.refresh_products()
-            self.clear_product_form()
-            
         except Exception as e:
             self.main_window.show_message("Ошибка", str(e))
     
+    def on_product_added(self, name):
+        """Товар добавлен в БД"""
+        self.main_window.show_message("Успех", f"Товар '{name}' добавлен!")
+        self.clear_product_form()
+    
     def edit_product(self):
         """Редактирование товара"""
         if self.selected_product_id is None:
@@ -262,20 +434,7 @@ class StoreApp:
         
         try:
             name = self.main_window.product_name_input.text().strip()
-            selected_category_text = self.main_window.product_category_input.currentText()
-            
-            # Находим соответствующее значение перечисления
-            category_enum = None
-            for cat in ProductCategory:
-                if cat.value == selected_category_text:
-                    category_enum = cat
-                    break
-            
-            if category_enum is None:
-                self.main_window.show_message("Ошибка", f"Неизвестная категория: {selected_category_text}")
-                return
-            
-            category = category_enum.name
+            category = to_category(self.main_window.product_category_input.currentText())
             price = self.main_window.product_price_input.value()
             quantity = self.main_window.product_quantity_input.value()
             min_stock = self.main_window.product_min_stock_input.value()
@@ -285,28 +444,32 @@ class StoreApp:
                 return
             
             # Обновляем товар в БД
-            success = self.db.update_product(
+            self.worker.submit(
+                self.db.update_product,
                 product_id=self.selected_product_id,
                 name=name,
                 category=category,
                 price=price,
                 quantity=quantity,
-                min_stock=min_stock
+                min_stock=min_stock,
+                on_result=lambda success: self.on_product_updated(success, name),
+                on_error=self.on_db_error
             )
-            
-            if success:
-                self.main_window.show_message("Успех", f"Товар '{name}' обновлен!")
-                self.refresh_products()
-                self.clear_product_form()
-                self.main_window.edit_product_btn.setEnabled(False)
-                self.main_window.delete_product_btn.setEnabled(False)
-                self.selected_product_id = None
-            else:
-                self.main_window.show_message("Ошибка", "Не удалось обновить товар")
                 
         except Exception as e:
             self.main_window.show_message("Ошибка", str(e))
     
+    def on_product_updated(self, success, name):
+        """Результат обновления товара"""
+        if success:
+            self.main_window.show_message("Успех", f"Товар '{name}' обновлен!")
+            self.clear_product_form()
+            self.main_window.edit_product_btn.setEnabled(False)
+            self.main_window.delete_product_btn.setEnabled(False)
+            self.selected_product_id = None
+        else:
+            self.main_window.show_message("Ошибка", "Не удалось обновить товар")
+    
     def delete_product(self):
         """Удаление товара"""
         if self.selected_product_id is None:
@@ -323,62 +486,24 @@ class StoreApp:
         )
         
         if reply == QMessageBox.Yes:
-            try:
-                # Удаляем товар из БД
-                success = self.db.delete_product(self.selected_product_id)
-                
-                if success:
-                    self.main_window.show_message("Успех", "Товар удален!")
-                    self.refresh_products()
-                    self.clear_product_form()
-                    self.main_window.edit_product_btn.setEnabled(False)
-                    self.main_window.delete_product_btn.setEnabled(False)
-                    self.selected_product_id = None
-                else:
-                    self.main_window.show_message("Ошибка", "Не удалось удалить товар")
-                    
-            except Exception as e:
-                self.main_window.show_message("Ошибка", str(e))
+            # Удаляем товар из БД
+            self.worker.submit(self.db.delete_product, self.selected_product_id,
+                               on_result=self.on_product_deleted, on_error=self.on_db_error)
+    
+    def on_product_deleted(self, success):
+        """Результат удаления товара"""
+        if success:
+            self.main_window.show_message("Успех", "Товар удален!")
+            self.clear_product_form()
+            self.main_window.edit_product_btn.setEnabled(False)
+            self.main_window.delete_product_btn.setEnabled(False)
+            self.selected_product_id = None
+        else:
+            self.main_window.show_message("Ошибка", "Не удалось удалить товар")
     
     def refresh_products(self):
         """Обновление списка товаров"""
-        products = self.db.get_all_products()
-        
-        table = self.main_window.products_table
-        table.setRowCount(len(products))
-        
-        for row, product in enumerate(products):
-            table.setItem(row, 0, QTableWidgetItem(str(product.id)))
-            table.setItem(row, 1, QTableWidgetItem(product.name))
-
-            # Получаем читаемое название категории
-            if hasattr(product.category, 'value'):
-                category_display = product.category.value
-            elif isinstance(product.category, str):
-                try:
-                    category_enum = ProductCategory[product.category]
-                    category_display = category_enum.value
-                except KeyError:
-                    category_display = product.category
-            else:
-                category_display = str(product.category)
-            
-            table.setItem(row, 2, QTableWidgetItem(category_display))
-            
-            table.setItem(row, 3, QTableWidgetItem(f"{product.price:.2f} ₽"))
-            table.setItem(row, 4, QTableWidgetItem(str(product.quantity)))
-            table.setItem(row, 5, QTableWidgetItem(str(product.min_stock)))
-            
-            # Статус
-            status = "✅ В наличии"
-            if product.quantity == 0:
-                status = "❌ Нет в наличии"
-            elif product.quantity < product.min_stock:
-                status = "⚠️ Низкий запас"
-            
-            table.setItem(row, 6, QTableWidgetItem(status))
-        
-        table.resizeColumnsToContents()
+        self.products_model.refresh()
         
         # Обновляем комбобоксы с товарами
         self.update_product_comboboxes()
@@ -390,43 +515,137 @@ class StoreApp:
         self.main_window.product_quantity_input.setValue(0)
         self.main_window.product_min_stock_input.setValue(10)
     
+    def add_to_basket(self):
+        """Добавить выбранный товар в чек"""
+        product = self.main_window.sale_product_combo.current_row()
+        if product is None:
+            self.main_window.show_message("Ошибка", "Выберите товар")
+            return False
+        
+        quantity = self.main_window.sale_quantity_spin.value()
+        line = next((line for line in self.basket if line['product'].id == product.id), None)
+        in_basket = line['quantity'] if line else 0
+        if in_basket + quantity > product.quantity:
+            self.main_window.show_message("Ошибка", f"Недостаточно товара на складе (остаток: {product.quantity})")
+            return False
+        
+        if line:
+            line['quantity'] += quantity
+        else:
+            self.basket.append({'product': product, 'quantity': quantity})
+        self.main_window.sale_quantity_spin.setValue(1)
+        self.update_basket_view()
+        return True
+    
+    def remove_basket_line(self):
+        """Удалить выбранную строку чека"""
+        row = self.main_window.basket_table.currentRow()
+        if 0 <= row < len(self.basket):
+            del self.basket[row]
+            self.update_basket_view()
+    
+    def clear_basket(self):
+        """Очистить чек"""
+        self.basket = []
+        self.update_basket_view()
+    
+    def update_basket_view(self):
+        """Перерисовать корзину с предварительными суммами"""
+        totals = self.db.price_lines([line['product'] for line in self.basket],
+                                     [line['quantity'] for line in self.basket],
+                                     self.main_window.sale_customer_combo.current_row())
+        self.main_window.show_basket(self.basket, totals)
+    
     def process_sale(self):
-        """Обработка продажи"""
+        """Оформление чека (без строк в корзине - продажа выбранного товара)"""
         try:
-            # Получаем выбранный товар из комбобокса
-            product_index = self.main_window.sale_product_combo.currentIndex()
-            if product_index == -1:
-                self.main_window.show_message("Ошибка", "Выберите товар")
-                return
-            
-            product_id = self.main_window.sale_product_combo.itemData(product_index)
-            quantity = self.main_window.sale_quantity_spin.value()
-            
             # Получаем выбранного клиента
-            customer_index = self.main_window.sale_customer_combo.currentIndex()
-            customer_id = self.main_window.sale_customer_combo.itemData(customer_index)
-            
-            if quantity <= 0:
-                self.main_window.show_message("Ошибка", "Введите количество больше 0")
+            if not self.main_window.sale_customer_combo.has_selection():
+                self.main_window.show_message("Ошибка", "Выберите клиента из списка")
                 return
+            customer_id = self.main_window.sale_customer_combo.current_id()
             
-            sale = self.db.record_sale(product_id, quantity, customer_id)
+            if not self.basket and not self.add_to_basket():
+                return
             
-            if sale:
-                self.main_window.show_message("Успех", f"Продажа оформлена на сумму {sale.total:.2f} ₽")
-                self.refresh_products()
-                self.refresh_sales_history()
-                self.clear_sale_form()
-                self.update_statistics()
-            else:
-                self.main_window.show_message("Ошибка", "Не удалось оформить продажу")
+            # Кнопка недоступна, пока чек записывается
+            self.main_window.process_sale_btn.setEnabled(False)
+            # Цены и суммы на момент оформления: повтор из журнала записывает
+            # именно их, а не пересчитывает по текущим ценам и акциям
+            customer = self.main_window.sale_customer_combo.current_row()
+            totals = self.db.price_lines([line['product'] for line in self.basket],
+                                         [line['quantity'] for line in self.basket], customer)
+            items = [{'product_id': line['product'].id, 'quantity': line['quantity'],
+                      'price': line['product'].price, 'total': total}
+                     for line, total in zip(self.basket, totals)]
+            key = self.start_write('receipt', {'customer_id': customer_id, 'items': items,
+                                               'discount': customer.discount if customer else 0.0})
+            self.worker.submit(self.db.record_receipt, items, customer_id, key,
+                               on_result=lambda receipt: self.on_receipt_recorded(key, receipt),
+                               on_error=lambda error: self.journal_write(key, error))
                 
         except Exception as e:
             self.main_window.show_message("Ошибка", str(e))
     
+    def start_write(self, kind, payload):
+        """Зарегистрировать запись в БД; если ответа нет SLOW_WRITE_MS, она уходит в журнал"""
+        key = uuid.uuid4().hex
+        self.pending_writes[key] = (kind, payload)
+        QTimer.singleShot(SLOW_WRITE_MS, lambda: self.journal_write(key))
+        return key
+    
+    def finish_write(self, key):
+        """Снять запись с ожидания; False - она уже сохранена в журнал"""
+        return self.pending_writes.pop(key, None) is not None
+    
+    def journal_write(self, key, error=None):
+        """БД не ответила или вернула ошибку - сохранить операцию в журнал.
+        
+        Если запрос к БД все же выполнится позже, повтор из журнала
+        будет пропущен по тому же ключу.
+        """
+        write = self.pending_writes.pop(key, None)
+        if write is None:
+            return
+        if error is not None:
+            print(f"Ошибка записи в БД: {error}")
+        kind, payload = write
+        try:
+            self.journal.append(kind, payload, key)
+        except OSError as e:
+            self.main_window.process_sale_btn.setEnabled(True)
+            self.main_window.show_message("Ошибка", f"Не удалось сохранить операцию: {e}")
+            return
+        self.replayer.wake()
+        self.main_window.set_journal_pending(self.journal.count())
+        if kind != 'supply':
+            self.main_window.process_sale_btn.setEnabled(True)
+            self.clear_sale_form()
+            self.main_window.show_message("Продажа сохранена",
+                                          "База данных недоступна: продажа сохранена в журнал "
+                                          "и будет записана автоматически")
+        else:
+            self.clear_supply_form()
+            self.main_window.show_message("Поставка сохранена",
+                                          "База данных недоступна: поставка сохранена в журнал "
+                                          "и будет записана автоматически")
+    
+    def on_receipt_recorded(self, key, receipt):
+        """Результат записи чека"""
+        if not self.finish_write(key):
+            return
+        self.main_window.process_sale_btn.setEnabled(True)
+        if receipt:
+            self.main_window.show_message(
+                "Успех", f"Чек №{receipt.id} ({receipt.items_count} поз.) оформлен на сумму {receipt.total:.2f} ₽")
+            self.clear_sale_form()
+        else:
+            self.main_window.show_message("Ошибка", "Не удалось оформить чек: товара недостаточно на складе")
+    
     def clear_sale_form(self):
         """Очистка формы продажи"""
         self.main_window.sale_quantity_spin.setValue(1)
+        self.clear_basket()
     
     def add_supply(self):
         """Добавление поставки"""
@@ -440,13 +659,11 @@ class StoreApp:
                 return
             
             # Получаем выбранный товар из комбобокса
-            product_index = self.main_window.supply_product_combo.currentIndex()
-            if product_index == -1:
+            product_id = self.main_window.supply_product_combo.current_id()
+            if product_id is None:
                 self.main_window.show_message("Ошибка", "Выберите товар")
                 return
             
-            product_id = self.main_window.supply_product_combo.itemData(product_index)
-            
             if quantity <= 0:
                 self.main_window.show_message("Ошибка", "Введите количество больше 0")
                 return
@@ -455,18 +672,23 @@ class StoreApp:
                 self.main_window.show_message("Ошибка", "Введите стоимость поставки больше 0")
                 return
             
-            supply = self.db.add_supply(supplier, product_id, quantity, cost)
-            
-            if supply:
-                self.main_window.show_message("Успех", f"Поставка добавлена!")
-                self.refresh_products()
-                self.refresh_supplies_history()
-                self.clear_supply_form()
-                self.update_statistics()
+            payload = {'supplier': supplier, 'product_id': product_id, 'quantity': quantity, 'cost': cost}
+            key = self.start_write('supply', payload)
+            self.worker.submit(self.db.add_supply, supplier, product_id, quantity, cost, key,
+                               on_result=lambda supply: self.on_supply_added(key, supply),
+                               on_error=lambda error: self.journal_write(key, error))
                 
         except Exception as e:
             self.main_window.show_message("Ошибка", str(e))
     
+    def on_supply_added(self, key, supply):
+        """Результат добавления поставки"""
+        if not self.finish_write(key):
+            return
+        if supply:
+            self.main_window.show_message("Успех", f"Поставка добавлена!")
+            self.clear_supply_form()
+    
     def clear_supply_form(self):
         """Очистка формы поставки"""
         self.main_window.supplier_input.clear()
@@ -485,31 +707,21 @@ class StoreApp:
                 self.main_window.show_message("Ошибка", "Заполните обязательные поля")
                 return
             
-            customer = self.db.add_customer(name, phone, email, discount)
-            
-            if customer:
-                self.main_window.show_message("Успех", f"Клиент '{name}' добавлен!")
-                self.refresh_customers()
-                self.clear_customer_form()
+            self.worker.submit(self.db.add_customer, name, phone, email, discount,
+                               on_result=self.on_customer_added, on_error=self.on_db_error)
                 
         except Exception as e:
             self.main_window.show_message("Ошибка", str(e))
     
+    def on_customer_added(self, customer):
+        """Результат добавления клиента"""
+        if customer:
+            self.main_window.show_message("Успех", f"Клиент '{customer.name}' добавлен!")
+            self.clear_customer_form()
+    
     def refresh_customers(self):
         """Обновление списка клиентов"""
-        customers = self.db.get_all_customers()
-        
-        table = self.main_window.customers_table
-        table.setRowCount(len(customers))
-        
-        for row, customer in enumerate(customers):
-            table.setItem(row, 0, QTableWidgetItem(str(customer.id)))
-            table.setItem(row, 1, QTableWidgetItem(customer.name))
-            table.setItem(row, 2, QTableWidgetItem(customer.phone))
-            table.setItem(row, 3, QTableWidgetItem(customer.email))
-            table.setItem(row, 4, QTableWidgetItem(f"{customer.discount}%"))
-        
-        table.resizeColumnsToContents()
+        self.customers_model.refresh()
         
         # Обновляем комбобокс с клиентами
         self.update_customer_combobox()
@@ -523,48 +735,72 @@ class StoreApp:
     
     def update_statistics(self):
         """Обновление статистики"""
-        try:
-            # Общие продажи
-            total_sales = self.db.get_total_sales_amount()
-            self.main_window.total_sales_label.setText(f"Общие продажи: {total_sales:.2f} ₽")
-            
-            # Товары на складе
-            products = self.db.get_all_products()
-            total_products = sum(p.quantity for p in products)
-            self.main_window.total_products_label.setText(f"Товаров на складе: {total_products}")
-            
-            # Товары с низким запасом
-            low_stock = len(self.db.get_low_stock_products())
-            self.main_window.low_stock_label.setText(f"Товаров с низким запасом: {low_stock}")
-            
-        except Exception as e:
-            print(f"Ошибка обновления статистики: {e}")
+        self.worker.submit(self.load_statistics, on_result=self.show_statistics,
+                           on_error=lambda e: print(f"Ошибка обновления статистики: {e}"),
+                           key='statistics')
+    
+    def load_statistics(self):
+        """Расчет статистики (выполняется в фоне)"""
+        # Себестоимость новых продаж досчитывает cost_updater
+        return self.db.get_dashboard_stats()
+    
+    def show_statistics(self, stats):
+        """Отображение статистики"""
+        self.main_window.total_sales_label.setText(f"Общие продажи: {stats['total_sales']:.2f} ₽")
+        self.main_window.total_profit_label.setText(f"Прибыль: {stats['profit']:.2f} ₽")
+        self.main_window.total_products_label.setText(f"Товаров на складе: {stats['units_on_hand']}")
+        self.main_window.low_stock_label.setText(f"Товаров с низким запасом: {stats['low_stock']}")
+        self.main_window.out_of_stock_label.setText(f"Нет в наличии: {stats['out_of_stock']}")
+    
+    def show_report(self, generate):
+        """Сформировать отчет в фоне и показать его"""
+        self.main_window.report_text.setPlainText("Формирование отчета...")
+        self.report_worker.submit(generate, on_result=self.main_window.report_text.setPlainText,
+                                  on_error=self.on_db_error, key='report')
     
     def show_sales_report(self):
         """Показать отчет по продажам"""
-        report = self.reports.generate_sales_report()
-        self.main_window.report_text.setPlainText(report)
+        self.show_report(self.reports.generate_sales_report)
     
     def show_inventory_report(self):
         """Показать отчет по инвентарю"""
-        report = self.reports.generate_inventory_report()
-        self.main_window.report_text.setPlainText(report)
+        self.show_report(self.reports.generate_inventory_report)
     
     def show_financial_report(self):
         """Показать финансовый отчет"""
-        report = self.reports.generate_financial_report()
-        self.main_window.report_text.setPlainText(report)
+        self.show_report(self.reports.generate_financial_report)
     
     def export_to_excel(self):
         """Экспорт в Excel"""
+        self.report_worker.submit(
+            self.reports.export_to_excel,
+            on_result=lambda filename: self.main_window.show_message("Успех", f"Данные экспортированы в {filename}"),
+            on_error=lambda e: self.main_window.show_message("Ошибка", f"Ошибка экспорта: {str(e)}"),
+            key='export'
+        )
+    
+    def save_snapshot(self):
+        """Сохранение снимка StoreLogic"""
+        if self.logic is None:
+            # Снимок еще не был восстановлен - сохранять нечего
+            return
         try:
-            filename = self.reports.export_to_excel()
-            self.main_window.show_message("Успех", f"Данные экспортированы в {filename}")
+            save_store_logic(self.logic, SNAPSHOT_PATH, self.db)
         except Exception as e:
-            self.main_window.show_message("Ошибка", f"Ошибка экспорта: {str(e)}")
+            print(f"Ошибка сохранения снимка: {e}")
+    
+    def export_query_stats(self):
+        """Выгрузка статистики запросов, если она включена"""
+        if not instrumentation.enabled:
+            return
+        try:
+            print(f"Статистика запросов сохранена в {instrumentation.export_json()}")
+        except OSError as e:
+            print(f"Ошибка сохранения статистики запросов: {e}")
     
     def run(self):
         """Запуск приложения"""
+        startup.watch_first_paint(self.main_window)
         self.main_window.show()
         sys.exit(self.app.exec_())
 
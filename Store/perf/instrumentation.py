@@ -0,0 +1,366 @@
+import functools
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# STORE_QUERY_STATS=<файл.json> включает сбор статистики запросов
+# (и её выгрузку в этот файл при выходе); STORE_SLOW_QUERY_MS - порог
+# медленного запроса, STORE_SLOW_QUERY_LOG - файл журнала медленных запросов
+QUERY_STATS_ENV = 'STORE_QUERY_STATS'
+SLOW_QUERY_MS_ENV = 'STORE_SLOW_QUERY_MS'
+SLOW_QUERY_LOG_ENV = 'STORE_SLOW_QUERY_LOG'
+
+DEFAULT_SLOW_MS = 50.0
+# Сколько последних медленных запросов хранить в памяти
+SLOW_QUERIES_KEPT = 200
+
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Ключ группировки: списки IN (?, ?, ...) разной длины считаются одним запросом"""
+    return _SPACES.sub(' ', _IN_LIST.sub('(?, ...)', statement)).strip()
+
+
+class _StatementStats:
+    __slots__ = ('sql', 'count', 'total', 'max', 'rows', 'cache_misses', 'errors')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.cache_misses = 0
+        self.errors = 0
+
+    def to_dict(self):
+        return {
+            'sql': self.sql,
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'avg_ms': round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+            'rows': self.rows,
+            'cache_misses': self.cache_misses,
+            'errors': self.errors,
+        }
+
+
+class _MethodStats:
+    __slots__ = ('calls', 'total', 'max', 'queries', 'errors')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.queries = 0
+        self.errors = 0
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.total * 1000, 3),
+            'avg_ms': round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+            'queries': self.queries,
+            'errors': self.errors,
+        }
+
+
+class _CountingCursor(sqlite3.Cursor):
+    """Курсор, считающий выбранные строки для статистики запроса"""
+
+    _stat = None
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self._stat is not None:
+            self._stat.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._stat is not None:
+            self._stat.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._stat is not None:
+            self._stat.rows += len(rows)
+        return rows
+
+
+class _CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=_CountingCursor):
+        return super().cursor(factory)
+
+
+class QueryInstrumentation:
+    """Статистика запросов к БД: время и строки по каждому SQL, вызовы методов
+    DatabaseManager и InventoryReports, журнал медленных запросов с планом
+    выполнения (EXPLAIN QUERY PLAN).
+
+    Выключена по умолчанию и тогда ничего не стоит: методы не оборачиваются,
+    обработчики событий движка не подключаются. Включать нужно до создания
+    DatabaseManager (см. enable).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_ms = DEFAULT_SLOW_MS
+        self.slow_log = None
+        self.export_path = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._classes = []
+        self._cache_hit = self._cache_miss = None
+        self.reset()
+
+    def reset(self):
+        """Сбросить накопленную статистику"""
+        with self._lock:
+            self.started_at = datetime.now()
+            self.statements = {}
+            self.methods = {}
+            self.slow_queries = deque(maxlen=SLOW_QUERIES_KEPT)
+            # Итоги по всем запросам (для замеров отдельных действий интерфейса)
+            self.total_queries = 0
+            self.total_time = 0.0
+            self.cache_hits = 0
+            self.cache_misses = 0
+
+    def enable(self, slow_ms=None, slow_log=None, export_path=None):
+        """Включить сбор статистики (до создания DatabaseManager)"""
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if slow_log is not None:
+            self.slow_log = slow_log
+        if export_path is not None:
+            self.export_path = export_path
+        if not self.enabled:
+            self.enabled = True
+            for cls in self._classes:
+                self._wrap_class(cls)
+
+    def enable_from_env(self):
+        """Включить по переменным окружения, если задана STORE_QUERY_STATS"""
+        export_path = os.environ.get(QUERY_STATS_ENV)
+        if not export_path:
+            return
+        slow_ms = os.environ.get(SLOW_QUERY_MS_ENV)
+        self.enable(slow_ms=float(slow_ms) if slow_ms else None,
+                    slow_log=os.environ.get(SLOW_QUERY_LOG_ENV, 'slow_queries.log'),
+                    export_path=export_path)
+
+    # --- Подключение ---
+
+    def engine_options(self):
+        """Дополнительные параметры create_engine (курсор со счетчиком строк)"""
+        if not self.enabled:
+            return {}
+        return {'connect_args': {'factory': _CountingConnection}}
+
+    def attach(self, engine):
+        """Подключить обработчики событий движка"""
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+        self._cache_hit = CACHE_HIT
+        self._cache_miss = CACHE_MISS
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+
+    def register(self, cls):
+        """Учитывать вызовы публичных методов класса (декоратор)"""
+        self._classes.append(cls)
+        if self.enabled:
+            self._wrap_class(cls)
+        return cls
+
+    def _wrap_class(self, cls):
+        for name, member in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.isfunction(member) or getattr(member, '_instrumented', False):
+                continue
+            setattr(cls, name, self._wrap_method(f"{cls.__name__}.{name}", member))
+
+    def _wrap_method(self, name, method):
+        stats = self
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            stack = stats._stack()
+            # [имя метода, число запросов, выполненных непосредственно в нем]
+            frame = [name, 0]
+            stack.append(frame)
+            started = time.perf_counter()
+            failed = False
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                stack.pop()
+                stats._record_method(name, elapsed, frame[1], failed)
+
+        wrapper._instrumented = True
+        return wrapper
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record_method(self, name, elapsed, queries, failed):
+        with self._lock:
+            entry = self.methods.get(name)
+            if entry is None:
+                entry = self.methods[name] = _MethodStats()
+            entry.calls += 1
+            entry.total += elapsed
+            entry.max = max(entry.max, elapsed)
+            entry.queries += queries
+            entry.errors += failed
+
+    # --- События движка ---
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        sql = normalize_sql(statement)
+        with self._lock:
+            entry = self.statements.get(sql)
+            if entry is None:
+                entry = self.statements[sql] = _StatementStats(sql)
+            entry.count += 1
+            entry.total += elapsed
+            entry.max = max(entry.max, elapsed)
+            if cursor.rowcount > 0:
+                # INSERT/UPDATE/DELETE; строки SELECT считает курсор при выборке
+                entry.rows += cursor.rowcount
+            self.total_queries += 1
+            self.total_time += elapsed
+            if context.cache_hit == self._cache_miss:
+                entry.cache_misses += 1
+                self.cache_misses += 1
+            elif context.cache_hit == self._cache_hit:
+                self.cache_hits += 1
+        if isinstance(cursor, _CountingCursor):
+            cursor._stat = entry
+        stack = self._stack()
+        if stack:
+            stack[-1][1] += 1
+        if elapsed * 1000 >= self.slow_ms:
+            self._log_slow(cursor, statement, parameters, executemany, elapsed)
+
+    def _on_error(self, context):
+        statement = context.statement
+        if statement is None:
+            return
+        sql = normalize_sql(statement)
+        with self._lock:
+            entry = self.statements.get(sql)
+            if entry is None:
+                entry = self.statements[sql] = _StatementStats(sql)
+            entry.errors += 1
+
+    def _log_slow(self, cursor, statement, parameters, executemany, elapsed):
+        plan = []
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            try:
+                # Напрямую через sqlite3 - план не попадает в статистику
+                plan = [row[-1] for row in cursor.connection.execute(
+                    "EXPLAIN QUERY PLAN " + statement, parameters or ()
+                ).fetchall()]
+            except sqlite3.Error as e:
+                plan = [f"не удалось получить план: {e}"]
+        stack = self._stack()
+        record = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'ms': round(elapsed * 1000, 3),
+            'method': ' > '.join(frame[0] for frame in stack) or None,
+            'sql': _SPACES.sub(' ', statement).strip(),
+            'plan': plan,
+        }
+        with self._lock:
+            self.slow_queries.append(record)
+        if self.slow_log:
+            try:
+                with open(self.slow_log, 'a', encoding='utf-8') as f:
+                    f.write(f"{record['time']} {record['ms']:.1f} мс {record['method'] or '-'}\n"
+                            f"  {record['sql']}\n")
+                    for step in plan:
+                        f.write(f"    план: {step}\n")
+            except OSError as e:
+                print(f"Ошибка записи журнала медленных запросов: {e}")
+
+    # --- Результаты ---
+
+    def totals(self):
+        """Итоговые счетчики: число запросов, время в БД (с), попадания и промахи кэша"""
+        with self._lock:
+            return {
+                'queries': self.total_queries,
+                'db_time': self.total_time,
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+            }
+
+    def snapshot(self):
+        """Снимок статистики в виде словаря (для JSON)"""
+        with self._lock:
+            statements = sorted((entry.to_dict() for entry in self.statements.values()),
+                                key=lambda entry: entry['total_ms'], reverse=True)
+            methods = {name: entry.to_dict() for name, entry in sorted(self.methods.items())}
+            slow_queries = list(self.slow_queries)
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'taken_at': datetime.now().isoformat(timespec='seconds'),
+            'slow_ms': self.slow_ms,
+            'queries': sum(entry['count'] for entry in statements),
+            'statements': statements,
+            'methods': methods,
+            'slow_queries': slow_queries,
+        }
+
+    def export_json(self, path=None):
+        """Выгрузить снимок статистики в JSON-файл и вернуть путь"""
+        path = path or self.export_path
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def report(self, top=10):
+        """Текстовая сводка: самые затратные запросы и методы"""
+        snapshot = self.snapshot()
+        lines = [f"Запросов к БД: {snapshot['queries']}, медленных (>= {self.slow_ms:g} мс): "
+                 f"{len(snapshot['slow_queries'])}", "", "Методы:"]
+        methods = sorted(snapshot['methods'].items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for name, entry in methods[:top]:
+            lines.append(f"  {name:<44} {entry['calls']:6} выз. {entry['total_ms']:10.1f} мс "
+                         f"{entry['queries']:7} запр.")
+        lines += ["", "Запросы:"]
+        for entry in snapshot['statements'][:top]:
+            lines.append(f"  {entry['count']:6} x {entry['avg_ms']:8.2f} мс = {entry['total_ms']:10.1f} мс, "
+                         f"строк {entry['rows']}: {entry['sql'][:100]}")
+        return "\n".join(lines)
+
+
+# Общий экземпляр процесса
+instrumentation = QueryInstrumentation()
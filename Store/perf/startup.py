@@ -0,0 +1,57 @@
+import os
+import time
+
+# Переменная окружения, включающая вывод замеров запуска
+STARTUP_TIMING_ENV = 'STORE_STARTUP_TIMING'
+
+# Отсчет ведется от импорта модуля - он импортируется первым в main.py
+_START = time.perf_counter()
+
+
+class StartupTimer:
+    """Замеры этапов запуска: время каждого этапа и итог до первой отрисовки"""
+
+    def __init__(self, start=None):
+        self.start = _START if start is None else start
+        self.marks = []
+        self._last = self.start
+        self.enabled = bool(os.environ.get(STARTUP_TIMING_ENV))
+
+    def mark(self, stage):
+        """Отметить завершение этапа"""
+        now = time.perf_counter()
+        self.marks.append((stage, now - self._last, now - self.start))
+        self._last = now
+
+    def report(self):
+        """Текст разбивки по этапам"""
+        lines = ["Запуск приложения:"]
+        for stage, duration, total in self.marks:
+            lines.append(f"  {stage:<28} {duration * 1000:8.1f} мс  (всего {total * 1000:8.1f} мс)")
+        return "\n".join(lines)
+
+    def print_report(self):
+        """Вывести разбивку, если замеры включены"""
+        if self.enabled:
+            print(self.report())
+
+    def watch_first_paint(self, widget, stage="первая отрисовка"):
+        """Отметить первую отрисовку виджета и вывести разбивку"""
+        from PyQt5.QtCore import QObject, QEvent
+
+        timer = self
+
+        class _FirstPaint(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Paint:
+                    widget.removeEventFilter(self)
+                    timer.mark(stage)
+                    timer.print_report()
+                return False
+
+        self._paint_filter = _FirstPaint(widget)
+        widget.installEventFilter(self._paint_filter)
+
+
+# Общий таймер процесса
+startup = StartupTimer()
@@ -0,0 +1,123 @@
+import argparse
+import random
+import sys
+import threading
+import time
+
+from logic.money import money_sum
+from logic.store_logic import ProductCategory, StoreLogic
+
+# Остаток товара в начале прогона - небольшой, чтобы часть продаж упиралась
+# в нехватку и проверялась защита от продажи в минус
+INITIAL_STOCK = 20
+
+
+def _worker(logic, product_ids, customer_ids, operations, seed, barrier, counts):
+    """Поток кассы: случайные продажи и поставки, учет успешных операций"""
+    rng = random.Random(seed)
+    sold, supplied = {}, {}
+    barrier.wait()
+    for _ in range(operations):
+        product_id = rng.choice(product_ids)
+        if rng.random() < 0.6:
+            customer_id = rng.choice(customer_ids)
+            if logic.process_sale(product_id, 1, customer_id) is not None:
+                sold[product_id] = sold.get(product_id, 0) + 1
+        else:
+            logic.add_supply('stress', product_id, 1, 10.0)
+            supplied[product_id] = supplied.get(product_id, 0) + 1
+    counts.append((sold, supplied))
+
+
+def run(skus, threads, operations, seed=0):
+    """Один прогон: threads потоков по operations операций над skus товарами.
+
+    Возвращает (операций в секунду, список расхождений).
+    """
+    logic = StoreLogic()
+    product_ids = [logic.add_product(f"Товар {i}", ProductCategory.OTHER, 100.0, INITIAL_STOCK, 5).id
+                   for i in range(skus)]
+    customer_ids = [logic.add_customer(f"Клиент {i}", str(i), f"c{i}@example.com").id for i in range(8)]
+
+    counts = []
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=_worker, args=(logic, product_ids, customer_ids, operations,
+                                               seed * 1000 + n, barrier, counts))
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    problems = []
+    sold, supplied = {}, {}
+    for thread_sold, thread_supplied in counts:
+        for product_id, quantity in thread_sold.items():
+            sold[product_id] = sold.get(product_id, 0) + quantity
+        for product_id, quantity in thread_supplied.items():
+            supplied[product_id] = supplied.get(product_id, 0) + quantity
+
+    for product_id in product_ids:
+        expected = INITIAL_STOCK + supplied.get(product_id, 0) - sold.get(product_id, 0)
+        actual = logic.products[product_id].quantity
+        if actual != expected:
+            problems.append(f"товар {product_id}: остаток {actual}, ожидалось {expected}")
+        if actual < 0:
+            problems.append(f"товар {product_id}: отрицательный остаток {actual}")
+
+    if len(logic.sales) != sum(sold.values()):
+        problems.append(f"продаж {len(logic.sales)}, успешных операций {sum(sold.values())}")
+    if len(logic.supplies) != sum(supplied.values()):
+        problems.append(f"поставок {len(logic.supplies)}, операций {sum(supplied.values())}")
+    for name, rows in (('продаж', logic.sales), ('поставок', logic.supplies)):
+        ids = sorted(row.id for row in rows)
+        if ids != list(range(1, len(ids) + 1)):
+            problems.append(f"ID {name} повторяются или идут с пропусками")
+
+    for customer_id in customer_ids:
+        expected = money_sum(sale.total for sale in logic.sales if sale.customer_id == customer_id)
+        actual = logic.customers[customer_id].total_purchases
+        if abs(actual - expected) > 0.001:
+            problems.append(f"клиент {customer_id}: сумма покупок {actual:.2f}, ожидалось {expected:.2f}")
+
+    return threads * operations / elapsed, problems
+
+
+def main(argv=None):
+    """Стресс-проверка StoreLogic: параллельные продажи и поставки без потерь остатка"""
+    parser = argparse.ArgumentParser(
+        description="Параллельные продажи и поставки в StoreLogic: проверка остатков и пропускная способность")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=5000, help="операций на поток")
+    parser.add_argument('--skus', type=int, nargs='+', default=[1, 16, 256, 4096],
+                        help="число товаров в прогонах (1 - все потоки бьют в один товар)")
+    parser.add_argument('--rounds', type=int, default=3, help="повторов каждого прогона")
+    parser.add_argument('--switch-interval', type=float, default=1e-6,
+                        help="интервал переключения потоков, с (частые переключения выявляют гонки)")
+    args = parser.parse_args(argv)
+
+    sys.setswitchinterval(args.switch_interval)
+
+    failed = False
+    for skus in args.skus:
+        rates = []
+        for round_number in range(args.rounds):
+            rate, problems = run(skus, args.threads, args.operations, seed=round_number)
+            rates.append(rate)
+            for problem in problems:
+                failed = True
+                print(f"  ОШИБКА ({skus} товаров): {problem}")
+        print(f"{skus:>6} товаров, {args.threads} потоков: {max(rates):10.0f} опер/с")
+
+    if failed:
+        raise SystemExit("Обнаружены потерянные обновления")
+    print("Остатки, продажи и суммы покупок сходятся")
+
+
+if __name__ == "__main__":
+    main()
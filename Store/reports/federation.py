@@ -0,0 +1,351 @@
+# Отчеты по сети магазинов: у каждого магазина свой store.db. Данные не
+# копируются в общий файл - сводные запросы подключают файлы магазинов
+# (ATTACH, только чтение) и объединяют их через UNION ALL, а показатели по
+# каждому магазину считаются параллельно, отдельными соединениями. Годовые
+# файлы архива истории магазина (database.archive) подключаются так же.
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+
+from categories import ProductCategory
+from database.archive import ARCHIVE_PATH
+from logic.money import from_minor
+
+# Товар в разных магазинах сопоставляется по штрихкоду, без него - по названию
+PRODUCT_KEY = "COALESCE(NULLIF(barcode, ''), name)"
+
+
+def _sql_date(value):
+    """Дата в формате, в котором SQLAlchemy хранит DateTime в SQLite"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _minor_units(connection, schema='main'):
+    """Функция: колонка суммы -> SQL-выражение в копейках.
+
+    Файлы магазинов открываются только на чтение и могут быть еще не
+    переведены на копейки (database.money) - тогда суммы в рублях (REAL).
+    """
+    types = {row[1]: row[2].upper() for row in connection.execute(f"PRAGMA {schema}.table_info(sales)")}
+    if types.get('total') == 'INTEGER':
+        return lambda column: column
+    return lambda column: f"CAST(ROUND({column} * 100) AS INTEGER)"
+
+
+def _category_column(connection, schema):
+    """SQL-выражение имени категории товара p ('FOOD'): в новых БД - код из таблицы categories"""
+    columns = {row[1] for row in connection.execute(f"PRAGMA {schema}.table_info(products)")}
+    if 'category_id' in columns:
+        return f"(SELECT name FROM {schema}.categories WHERE categories.id = p.category_id)"
+    return "p.category"
+
+
+def _category_name(value):
+    try:
+        return ProductCategory[value].value
+    except KeyError:
+        return value or ''
+
+
+class StoreFederation:
+    """Отчеты по нескольким магазинам сети.
+
+    stores - {название магазина: путь к его store.db}. Файлы открываются
+    только на чтение. Архив истории магазина ищется рядом с его store.db
+    (каталог archive, как у SalesArchive); продажи и поставки из годовых
+    файлов за отчетный период входят в показатели наравне с рабочей БД.
+    Показатели по магазинам (выручка, себестоимость,
+    поставки, инвентарь) считаются параллельно в пуле потоков - SQLite
+    отпускает GIL на время запроса. Сводные запросы по товарам и
+    категориям выполняются в одном соединении, к которому подключены все
+    магазины, через временные представления chain_sales и chain_products.
+    """
+
+    def __init__(self, stores, max_workers=None):
+        if not stores:
+            raise ValueError("Не задано ни одного магазина")
+        self.stores = dict(stores)
+        self.max_workers = max_workers or len(self.stores)
+
+    # --- Соединения ---
+
+    @staticmethod
+    def _open(path):
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+
+    @staticmethod
+    def _tables(connection, schema='main'):
+        return {row[0] for row in connection.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+
+    @staticmethod
+    def _attach(connection, schema, path):
+        """Подключить файл только на чтение под именем schema"""
+        limit = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        # В списке кроме подключенных есть main и temp
+        attached = len(connection.execute("PRAGMA database_list").fetchall()) - 2
+        if attached >= limit:
+            raise ValueError(f"Запрос подключает не больше {limit} файлов (магазины и годы архива), "
+                             "сократите период или число магазинов")
+        connection.execute(f"ATTACH DATABASE ? AS {schema}", (f'file:{path}?mode=ro',))
+
+    def _attach_archives(self, connection, schema, path, start_date=None, end_date=None):
+        """Подключить годовые файлы архива магазина, пересекающие период; имена их схем"""
+        if 'archive_files' not in self._tables(connection, schema):
+            return []
+        start = _sql_date(start_date) if start_date is not None else None
+        end = _sql_date(end_date) if end_date is not None else None
+        schemas = []
+        for year, file_name, first_date, last_date in connection.execute(
+            f"SELECT year, file_name, first_date, last_date FROM {schema}.archive_files ORDER BY year"
+        ).fetchall():
+            if (start is not None and last_date is not None and last_date < start) or \
+                    (end is not None and first_date is not None and first_date > end):
+                continue
+            archive_path = os.path.join(os.path.dirname(path), ARCHIVE_PATH, file_name)
+            if not os.path.exists(archive_path):
+                raise FileNotFoundError(f"Нет файла архива за {year} год: {archive_path}")
+            archive_schema = f'{schema}_archive_{year}'
+            self._attach(connection, archive_schema, archive_path)
+            schemas.append(archive_schema)
+        return schemas
+
+    @contextmanager
+    def chain(self, start_date=None, end_date=None, history=True):
+        """Соединение, к которому подключены все магазины, с представлениями chain_sales и chain_products.
+
+        В chain_sales входят архивы магазинов за период start_date-end_date
+        (None - без ограничения); history=False - без продаж, только chain_products.
+        """
+        with closing(sqlite3.connect(':memory:')) as connection:
+            limit = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+            if len(self.stores) > limit:
+                raise ValueError(f"Сводный запрос подключает не больше {limit} магазинов, задано {len(self.stores)}")
+            sales, products = [], []
+            for number, (name, path) in enumerate(self.stores.items()):
+                schema = f'store_{number}'
+                self._attach(connection, schema, path)
+                store = connection.execute("SELECT quote(?)", (name,)).fetchone()[0]
+                category = _category_column(connection, schema)
+                # Суммы в представлениях - в копейках; архивные продажи - по
+                # товарам рабочей БД магазина (товары в архив не переносятся)
+                history_schemas = [schema] + (
+                    self._attach_archives(connection, schema, path, start_date, end_date) if history else [])
+                for sales_schema in history_schemas:
+                    minor = _minor_units(connection, sales_schema)
+                    sales.append(
+                        f"SELECT {store} AS store, {PRODUCT_KEY} AS product_key, p.name AS product_name, "
+                        f"{category} AS category, s.quantity AS quantity, {minor('s.total')} AS total, "
+                        f"s.date AS date FROM {sales_schema}.sales s JOIN {schema}.products p ON p.id = s.product_id"
+                    )
+                minor = _minor_units(connection, schema)
+                products.append(
+                    f"SELECT {store} AS store, {PRODUCT_KEY} AS product_key, name, {category} AS category, "
+                    f"{minor('price')} AS price, COALESCE(quantity, 0) AS quantity, "
+                    f"COALESCE(min_stock, 0) AS min_stock FROM {schema}.products p"
+                )
+            connection.execute("CREATE TEMP VIEW chain_sales AS " + " UNION ALL ".join(sales))
+            connection.execute("CREATE TEMP VIEW chain_products AS " + " UNION ALL ".join(products))
+            yield connection
+
+    # --- Показатели по магазинам ---
+
+    def store_summaries(self, start_date, end_date):
+        """Показатели каждого магазина за период (параллельно); список словарей в порядке stores"""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='store-report') as pool:
+            futures = [pool.submit(self._store_summary, name, path, start_date, end_date)
+                       for name, path in self.stores.items()]
+            return [future.result() for future in futures]
+
+    def _store_summary(self, name, path, start_date, end_date):
+        period = (_sql_date(start_date), _sql_date(end_date))
+        with closing(self._open(path)) as connection:
+            # Рабочая БД и архивы за период - одна история (UNION ALL)
+            minor = _minor_units(connection)
+            schemas = ['main'] + self._attach_archives(connection, 'main', path, start_date, end_date)
+            history_minor = {schema: _minor_units(connection, schema) for schema in schemas}
+
+            def union(select):
+                return " UNION ALL ".join(select(schema, history_minor[schema]) for schema in schemas)
+
+            sales_count, revenue = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total), 0) FROM ("
+                + union(lambda schema, m: f"SELECT {m('total')} AS total, date FROM {schema}.sales")
+                + ") WHERE date BETWEEN ? AND ?", period
+            ).fetchone()
+            cogs = None
+            if 'sale_costs' in self._tables(connection):
+                # Себестоимость - по уже посчитанным продажам (update_cost_of_goods магазина);
+                # в архив продажа переносится вместе с ее себестоимостью
+                cogs = from_minor(connection.execute(
+                    "SELECT COALESCE(SUM(cogs), 0) FROM ("
+                    + union(lambda schema, m: f"SELECT {m('c.cogs')} AS cogs, s.date AS date "
+                                              f"FROM {schema}.sale_costs c JOIN {schema}.sales s ON s.id = c.sale_id")
+                    + ") WHERE date BETWEEN ? AND ?", period
+                ).fetchone()[0])
+            supplies = connection.execute(
+                "SELECT COALESCE(SUM(cost), 0) FROM ("
+                + union(lambda schema, m: f"SELECT {m('cost')} AS cost, date FROM {schema}.supplies")
+                + ") WHERE date BETWEEN ? AND ?", period
+            ).fetchone()[0]
+            inventory_value, low_stock, out_of_stock = connection.execute(
+                f"SELECT COALESCE(SUM({minor('price')} * quantity), 0), "
+                "COALESCE(SUM(COALESCE(quantity, 0) < COALESCE(min_stock, 0)), 0), "
+                "COALESCE(SUM(COALESCE(quantity, 0) = 0), 0) FROM products"
+            ).fetchone()
+        return {
+            'store': name,
+            'sales_count': sales_count,
+            'revenue': from_minor(revenue),
+            'cogs': cogs,
+            'supplies': from_minor(supplies),
+            'inventory_value': from_minor(inventory_value),
+            'low_stock': low_stock,
+            'out_of_stock': out_of_stock,
+        }
+
+    @staticmethod
+    def chain_totals(summaries):
+        """Итоги сети по показателям магазинов"""
+        totals = {'store': 'Итого по сети'}
+        for key in ('sales_count', 'revenue', 'supplies', 'inventory_value', 'low_stock', 'out_of_stock'):
+            totals[key] = sum(summary[key] for summary in summaries)
+        costs = [summary['cogs'] for summary in summaries]
+        totals['cogs'] = None if None in costs else sum(costs)
+        return totals
+
+    # --- Сводные запросы по сети ---
+
+    def category_sales(self, start_date, end_date):
+        """Выручка по категориям: [(категория, {магазин: сумма}, итого)] по убыванию итога"""
+        with self.chain(start_date, end_date) as connection:
+            rows = connection.execute(
+                "SELECT category, store, SUM(total) FROM chain_sales WHERE date BETWEEN ? AND ? "
+                "GROUP BY category, store", (_sql_date(start_date), _sql_date(end_date))
+            ).fetchall()
+        categories = {}
+        for category, store, amount in rows:
+            categories.setdefault(_category_name(category), {})[store] = from_minor(amount)
+        return sorted(((category, by_store, sum(by_store.values())) for category, by_store in categories.items()),
+                      key=lambda item: -item[2])
+
+    def best_sellers(self, start_date, end_date, limit=5):
+        """Лучшие товары сети по выручке: (название, продано, выручка, магазинов)"""
+        with self.chain(start_date, end_date) as connection:
+            rows = connection.execute(
+                "SELECT MIN(product_name), SUM(quantity), SUM(total) AS revenue, COUNT(DISTINCT store) "
+                "FROM chain_sales WHERE date BETWEEN ? AND ? "
+                "GROUP BY product_key ORDER BY revenue DESC LIMIT ?",
+                (_sql_date(start_date), _sql_date(end_date), limit)
+            ).fetchall()
+        return [(name, sold, from_minor(revenue), stores) for name, sold, revenue, stores in rows]
+
+    def stock_levels(self):
+        """Остатки товаров с низким запасом хотя бы в одном магазине.
+
+        Возвращает {ключ товара: {'name': ..., 'stores': {магазин: (остаток, минимум)}}}
+        с остатками этого товара во всех магазинах сети.
+        """
+        with self.chain(history=False) as connection:
+            rows = connection.execute(
+                "SELECT product_key, name, store, quantity, min_stock FROM chain_products "
+                "WHERE product_key IN (SELECT product_key FROM chain_products WHERE quantity < min_stock) "
+                "ORDER BY name, store"
+            ).fetchall()
+        levels = {}
+        for key, name, store, quantity, min_stock in rows:
+            product = levels.setdefault(key, {'name': name, 'stores': {}})
+            product['stores'][store] = (quantity, min_stock)
+        return levels
+
+    @staticmethod
+    def transfers(levels):
+        """Перемещения излишков (сверх минимума) в магазины с низким запасом.
+
+        Возвращает [(товар, откуда, куда, количество)]; больший излишек
+        закрывает больший недостаток.
+        """
+        result = []
+        for product in levels.values():
+            surplus = {store: quantity - min_stock for store, (quantity, min_stock) in product['stores'].items()
+                       if quantity > min_stock}
+            deficit = {store: min_stock - quantity for store, (quantity, min_stock) in product['stores'].items()
+                       if quantity < min_stock}
+            for target in sorted(deficit, key=deficit.get, reverse=True):
+                while deficit[target] > 0 and surplus:
+                    source = max(surplus, key=surplus.get)
+                    quantity = min(surplus[source], deficit[target])
+                    result.append((product['name'], source, target, quantity))
+                    deficit[target] -= quantity
+                    surplus[source] -= quantity
+                    if not surplus[source]:
+                        del surplus[source]
+        return result
+
+    # --- Текстовые отчеты ---
+
+    def generate_chain_report(self, start_date=None, end_date=None):
+        """Сводный отчет сети с разбивкой по магазинам"""
+        if not start_date:
+            start_date = datetime.now() - timedelta(days=30)
+        if not end_date:
+            end_date = datetime.now()
+
+        # Показатели магазинов и сводные запросы не зависят друг от друга
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix='chain-report') as pool:
+            summaries = pool.submit(self.store_summaries, start_date, end_date)
+            categories = pool.submit(self.category_sales, start_date, end_date)
+            best_sellers = pool.submit(self.best_sellers, start_date, end_date)
+            summaries, categories, best_sellers = summaries.result(), categories.result(), best_sellers.result()
+        totals = self.chain_totals(summaries)
+
+        report = f"Отчет по сети с {start_date.strftime('%d.%m.%Y')} по {end_date.strftime('%d.%m.%Y')}\n"
+        report += "=" * 80 + "\n\n"
+
+        for summary in summaries + [totals]:
+            report += f"{summary['store']}\n"
+            report += f"  Продаж: {summary['sales_count']} на сумму {summary['revenue']:.2f} ₽\n"
+            if summary['cogs'] is not None:
+                report += f"  Себестоимость проданного: {summary['cogs']:.2f} ₽ | "
+                report += f"Валовая прибыль: {summary['revenue'] - summary['cogs']:.2f} ₽\n"
+            report += f"  Затраты на поставки: {summary['supplies']:.2f} ₽\n"
+            report += f"  Стоимость инвентаря: {summary['inventory_value']:.2f} ₽\n"
+            report += f"  Низкий запас: {summary['low_stock']} | Нет в наличии: {summary['out_of_stock']}\n"
+            report += "-" * 40 + "\n"
+
+        report += "\nПродажи по категориям:\n"
+        for category, by_store, amount in categories:
+            stores = ", ".join(f"{store}: {by_store[store]:.2f}" for store in self.stores if store in by_store)
+            report += f"  {category}: {amount:.2f} ₽ ({stores})\n"
+
+        report += "\nТоп-5 товаров сети по выручке:\n"
+        for i, (name, sold, revenue, stores) in enumerate(best_sellers, 1):
+            report += f"{i}. {name}: продано {sold} на сумму {revenue:.2f} ₽ (магазинов: {stores})\n"
+
+        return report
+
+    def generate_transfer_report(self):
+        """Низкий запас по сети и перемещения между магазинами"""
+        levels = self.stock_levels()
+
+        report = "Низкий запас по сети\n"
+        report += "=" * 80 + "\n\n"
+
+        if not levels:
+            return report + "Во всех магазинах запас не ниже минимального.\n"
+
+        for product in levels.values():
+            report += f"{product['name']}\n"
+            for store, (quantity, min_stock) in product['stores'].items():
+                mark = " ⚠️" if quantity < min_stock else ""
+                report += f"  {store}: {quantity} (мин: {min_stock}){mark}\n"
+
+        transfers = self.transfers(levels)
+        report += "\nПеремещения:\n"
+        if not transfers:
+            report += "  Излишков в других магазинах нет - нужна поставка.\n"
+        for name, source, target, quantity in transfers:
+            report += f"  {name}: {source} -> {target}, {quantity} шт.\n"
+
+        return report
@@ -1,30 +1,74 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+# pandas, matplotlib и openpyxl импортируются внутри методов: они нужны
+# только при формировании отчета и заметно замедляют запуск приложения
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from io import BytesIO
 import base64
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select
 from database.models import Product, Customer, Sale, Supply
+from logic.money import from_minor, money_sum, to_minor
+from perf.instrumentation import instrumentation
 
+@instrumentation.register
 class InventoryReports:
-    """Система отчетов и инвентаризации"""
+    """Система отчетов и инвентаризации.
     
-    def __init__(self, db_manager):
+    Если задан snapshot (database.reporting.ReportingSnapshot), запросы
+    отчетов выполняются по снимку БД, а не по рабочей базе. Если задан
+    archive (database.archive.SalesArchive), отчеты за период читают и
+    перенесенную в архив историю.
+    """
+    
+    def __init__(self, db_manager, snapshot=None, archive=None):
         self.db = db_manager
+        self.snapshot = snapshot
+        self.archive = archive
+    
+    @contextmanager
+    def _reading(self, start_date=None, end_date=None):
+        """БД, по которой строится отчет: снимок или рабочая база (с архивом за период, если он задан)"""
+        with self._database() as db:
+            if self.archive is None or start_date is None:
+                yield db
+            else:
+                with self.archive.reading(db, start_date, end_date):
+                    yield db
+    
+    @contextmanager
+    def _database(self):
+        if self.snapshot is None:
+            yield self.db
+        else:
+            with self.snapshot.reading() as db:
+                yield db
+    
+    @staticmethod
+    def _sale_rows():
+        """Запрос строк продаж с товаром и клиентом (кортежи, без объектов ORM).
+
+        Товара или клиента может не быть (удалены) - тогда category и
+        customer_id строки равны None.
+        """
+        return select(
+            Sale.date, Sale.quantity, Sale.price, Sale.total,
+            Product.name.label('product_name'), Product.category.label('category'),
+            Customer.id.label('customer_id'), Customer.name.label('customer_name'), Customer.discount
+        ).select_from(Sale).outerjoin(
+            Product, Product.id == Sale.product_id
+        ).outerjoin(Customer, Customer.id == Sale.customer_id)
     
     def generate_sales_report(self, start_date=None, end_date=None):
         """Сгенерировать отчет по продажам"""
+        import pandas as pd
+        
         if not start_date:
             start_date = datetime.now() - timedelta(days=30)
         if not end_date:
             end_date = datetime.now()
         
-        session = self.db.Session()
-        try:
-            # Получаем данные о продажах
-            sales = session.query(Sale).filter(
-                Sale.date.between(start_date, end_date)
-            ).all()
+        with self._reading(start_date, end_date) as db:
+            # Продажи вместе с товаром и клиентом - одним запросом
+            sales = db.select_rows(self._sale_rows().where(Sale.date.between(start_date, end_date)))
             
             if not sales:
                 return "Нет данных о продажах за выбранный период."
@@ -32,18 +76,15 @@ class InventoryReports:
             # Создаем DataFrame
             data = []
             for sale in sales:
-                product = session.query(Product).get(sale.product_id)
-                customer = session.query(Customer).get(sale.customer_id) if sale.customer_id else None
-                
                 data.append({
                     'Дата': sale.date.strftime('%d.%m.%Y %H:%M'),
-                    'Товар': product.name if product else 'Неизвестно',
-                    'Категория': product.category.value if product else '',
+                    'Товар': sale.product_name if sale.category else 'Неизвестно',
+                    'Категория': sale.category.value if sale.category else '',
                     'Количество': sale.quantity,
                     'Цена за единицу': sale.price,
                     'Сумма': sale.total,
-                    'Клиент': customer.name if customer else 'Гость',
-                    'Скидка': f"{customer.discount}%" if customer else '0%'
+                    'Клиент': sale.customer_name if sale.customer_id else 'Гость',
+                    'Скидка': f"{sale.discount}%" if sale.customer_id else '0%'
                 })
             
             df = pd.DataFrame(data)
@@ -67,19 +108,19 @@ class InventoryReports:
                 report += f"{row['Дата']} - {row['Товар']} ({row['Цена за единицу']:.2f}₽ шт.) x {row['Количество']} = {row['Сумма']:.2f} ₽\n"
             
             return report
-            
-        finally:
-            session.close()
     
     def generate_inventory_report(self):
         """Сгенерировать отчет по инвентарю"""
-        session = self.db.Session()
-        try:
-            products = session.query(Product).all()
+        with self._reading() as db:
+            products = db.select_rows(select(
+                Product.name, Product.category.label('category'), Product.price,
+                Product.quantity, Product.min_stock
+            ))
             
             report = "Отчет по инвентарю\n"
             report += "=" * 80 + "\n\n"
             
+            # Итог копится в копейках - сходится до копейки при любом числе товаров
             total_value = 0
             low_stock_count = 0
             out_of_stock_count = 0
@@ -93,8 +134,8 @@ class InventoryReports:
                     status = "⚠️ Низкий запас"
                     low_stock_count += 1
                 
-                product_value = product.price * product.quantity
-                total_value += product_value
+                product_value = from_minor(to_minor(product.price) * product.quantity)
+                total_value += to_minor(product.price) * product.quantity
                 
                 report += f"{product.name} ({product.category.value})\n"
                 report += f"  Количество: {product.quantity} (мин: {product.min_stock})\n"
@@ -104,14 +145,11 @@ class InventoryReports:
             
             report += f"\nИтого:\n"
             report += f"Всего товаров: {len(products)}\n"
-            report += f"Общая стоимость инвентаря: {total_value:.2f} ₽\n"
+            report += f"Общая стоимость инвентаря: {from_minor(total_value):.2f} ₽\n"
             report += f"Товаров с низким запасом: {low_stock_count}\n"
             report += f"Товаров нет в наличии: {out_of_stock_count}\n"
             
             return report
-            
-        finally:
-            session.close()
     
     def generate_financial_report(self, start_date=None, end_date=None):
         """Сгенерировать финансовый отчет"""
@@ -120,61 +158,74 @@ class InventoryReports:
         if not end_date:
             end_date = datetime.now()
         
-        session = self.db.Session()
-        try:
-            # Продажи за период
-            sales = session.query(func.sum(Sale.total)).filter(
-                Sale.date.between(start_date, end_date)
-            ).scalar() or 0
-            
-            # Поставки за период
-            supplies = session.query(func.sum(Supply.cost)).filter(
-                Supply.date.between(start_date, end_date)
-            ).scalar() or 0
-            
-            # Текущий инвентарь
-            inventory_value = session.query(
-                func.sum(Product.price * Product.quantity)
-            ).scalar() or 0
-            
-            # Лучшие товары
-            best_sellers = session.query(
-                Product.name,
-                func.sum(Sale.quantity).label('total_sold'),
-                func.sum(Sale.total).label('revenue')
-            ).join(Sale).filter(
-                Sale.date.between(start_date, end_date)
-            ).group_by(Product.id).order_by(
-                desc('revenue')
-            ).limit(5).all()
-            
-            report = f"Финансовый отчет с {start_date.strftime('%d.%m.%Y')} по {end_date.strftime('%d.%m.%Y')}\n"
-            report += "=" * 80 + "\n\n"
-            
-            report += f"Выручка от продаж: {sales:.2f} ₽\n"
-            report += f"Затраты на поставки: {supplies:.2f} ₽\n"
-            report += f"Валовая прибыль: {sales - supplies:.2f} ₽\n"
-            report += f"Стоимость инвентаря: {inventory_value:.2f} ₽\n\n"
-            
-            report += "Топ-5 товаров по выручке:\n"
-            for i, (name, sold, revenue) in enumerate(best_sellers, 1):
-                report += f"{i}. {name}: продано {sold} на сумму {revenue:.2f} ₽\n"
-            
-            # Маржинальность (примерная)
-            if supplies > 0:
-                margin = ((sales - supplies) / sales) * 100 if sales > 0 else 0
-                report += f"\nМаржинальность: {margin:.1f}%\n"
-            
-            return report
-            
-        finally:
-            session.close()
+        # Себестоимость продаж уже досчитана стороной записи (CostOfGoodsUpdater);
+        # отчет ее только читает
+        with self._reading(start_date, end_date) as db:
+            session = db.Session()
+            try:
+                # Продажи за период
+                sales = session.query(func.sum(Sale.total)).filter(
+                    Sale.date.between(start_date, end_date)
+                ).scalar() or 0
+                
+                # Поставки за период
+                supplies = session.query(func.sum(Supply.cost)).filter(
+                    Supply.date.between(start_date, end_date)
+                ).scalar() or 0
+                
+                # Себестоимость проданного по слоям поставок (FIFO)
+                cogs = db.get_cost_of_goods(start_date, end_date)
+                
+                # Текущий инвентарь
+                inventory_value = session.query(
+                    func.sum(Product.price * Product.quantity)
+                ).scalar() or 0
+                
+                # Лучшие товары
+                best_sellers = session.query(
+                    Product.name,
+                    func.sum(Sale.quantity).label('total_sold'),
+                    func.sum(Sale.total).label('revenue')
+                ).join(Sale).filter(
+                    Sale.date.between(start_date, end_date)
+                ).group_by(Product.id).order_by(
+                    desc('revenue')
+                ).limit(5).all()
+                
+                report = f"Финансовый отчет с {start_date.strftime('%d.%m.%Y')} по {end_date.strftime('%d.%m.%Y')}\n"
+                report += "=" * 80 + "\n\n"
+                
+                report += f"Выручка от продаж: {sales:.2f} ₽\n"
+                report += f"Себестоимость проданного: {cogs:.2f} ₽\n"
+                report += f"Валовая прибыль: {sales - cogs:.2f} ₽\n"
+                report += f"Затраты на поставки: {supplies:.2f} ₽\n"
+                report += f"Стоимость инвентаря: {inventory_value:.2f} ₽\n\n"
+                
+                report += "Топ-5 товаров по выручке:\n"
+                for i, (name, sold, revenue) in enumerate(best_sellers, 1):
+                    report += f"{i}. {name}: продано {sold} на сумму {revenue:.2f} ₽\n"
+                
+                # Маржинальность по себестоимости проданного
+                if sales > 0:
+                    margin = ((sales - cogs) / sales) * 100
+                    report += f"\nМаржинальность: {margin:.1f}%\n"
+                
+                return report
+                
+            finally:
+                session.close()
     
     def generate_stock_chart(self):
         """Сгенерировать график запасов"""
-        session = self.db.Session()
-        try:
-            products = session.query(Product).order_by(Product.quantity).limit(15).all()
+        import matplotlib
+        # График рисуется в PNG (в т.ч. из фонового потока) - без GUI-бэкенда
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        
+        with self._reading() as db:
+            products = db.select_rows(
+                select(Product.name, Product.quantity, Product.min_stock).order_by(Product.quantity).limit(15)
+            )
             
             if not products:
                 return None
@@ -211,18 +262,19 @@ class InventoryReports:
             plt.close()
             
             return base64.b64encode(buffer.read()).decode('utf-8')
-            
-        finally:
-            session.close()
     
     def export_to_excel(self, filename='store_report.xlsx'):
         """Экспортировать данные в Excel"""
-        session = self.db.Session()
-        try:
+        import pandas as pd
+        
+        with self._reading() as db:
             with pd.ExcelWriter(filename, engine='openpyxl') as writer:
                 # Экспорт товаров
                 products_data = []
-                for product in session.query(Product).all():
+                for product in db.select_rows(select(
+                    Product.id, Product.name, Product.category.label('category'), Product.price,
+                    Product.quantity, Product.min_stock
+                )):
                     products_data.append({
                         'ID': product.id,
                         'Название': product.name,
@@ -239,18 +291,15 @@ class InventoryReports:
                 
                 # Экспорт продаж (последние 100)
                 sales_data = []
-                for sale in session.query(Sale).order_by(desc(Sale.date)).limit(100).all():
-                    product = session.query(Product).get(sale.product_id)
-                    customer = session.query(Customer).get(sale.customer_id) if sale.customer_id else None
-                    
+                for sale in db.select_rows(self._sale_rows().order_by(desc(Sale.date)).limit(100)):
                     sales_data.append({
                         'Дата': sale.date,
-                        'Товар': product.name if product else '',
+                        'Товар': sale.product_name if sale.category else '',
                         'Количество': sale.quantity,
                         'Цена': sale.price,
                         'Сумма': sale.total,
-                        'Клиент': customer.name if customer else 'Гость',
-                        'Скидка': f"{customer.discount}%" if customer else '0%'
+                        'Клиент': sale.customer_name if sale.customer_id else 'Гость',
+                        'Скидка': f"{sale.discount}%" if sale.customer_id else '0%'
                     })
                 
                 if sales_data:
@@ -258,7 +307,10 @@ class InventoryReports:
                 
                 # Экспорт клиентов
                 customers_data = []
-                for customer in session.query(Customer).all():
+                for customer in db.select_rows(select(
+                    Customer.id, Customer.name, Customer.phone, Customer.email,
+                    Customer.discount, Customer.total_purchases
+                )):
                     customers_data.append({
                         'ID': customer.id,
                         'Имя': customer.name,
@@ -282,16 +334,13 @@ class InventoryReports:
                     ],
                     'Значение': [
                         len(products_data),
-                        sum(p['Стоимость'] for p in products_data),
+                        money_sum(p['Стоимость'] for p in products_data),
                         sum(1 for p in products_data if p['Количество'] < p['Мин. запас']),
                         len(customers_data),
-                        sum(s['Сумма'] for s in sales_data)
+                        money_sum(s['Сумма'] for s in sales_data)
                     ]
                 }
                 
                 pd.DataFrame(summary_data).to_excel(writer, sheet_name='Сводка', index=False)
             
-            return filename
-            
-        finally:
-            session.close()
\ No newline at end of file
+            return filename
\ No newline at end of file
@@ -0,0 +1,416 @@
+import argparse
+import asyncio
+import enum
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+from sqlalchemy import inspect
+
+from database.archive import SalesArchive
+from database.cost_updater import CostOfGoodsUpdater
+from database.db_manager import DatabaseManager
+from database.reporting import ReportingSnapshot
+from database.writer import WriteService
+
+
+class HttpError(Exception):
+    """Ошибка запроса с HTTP-статусом"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 500: 'Internal Server Error'}
+
+# Поля товара, которые можно изменить через PATCH /products/<id>: тип значения
+# и допустимость null
+PRODUCT_FIELDS = {
+    'name': (str, False),
+    'category': (str, False),
+    'price': (float, False),
+    'quantity': (int, False),
+    'min_stock': (int, False),
+    'barcode': (str, True),
+    'description': (str, True),
+}
+
+
+def to_jsonable(value):
+    """Преобразование значений БД для json.dumps"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    if hasattr(value, '_asdict'):
+        return value._asdict()
+    if hasattr(value, '__table__'):
+        # Ключи - имена атрибутов модели (Product.category хранится в колонке category_id)
+        return {attr.key: getattr(value, attr.key) for attr in inspect(value).mapper.column_attrs}
+    raise TypeError(f"Не удается сериализовать {type(value).__name__}")
+
+
+class ApiServer:
+    """Локальный HTTP/JSON сервис над одним DatabaseManager.
+
+    Терминалы обращаются к серверу вместо общего файла SQLite: записи
+    выполняются единственным писателем WriteService и объединяются в
+    групповые commit, чтения - в отдельном небольшом пуле. Отчеты строятся
+    по снимку БД (database.reporting), который обновляется в фоне раз в
+    report_interval секунд.
+    """
+
+    def __init__(self, db, batch_window_ms=5, max_batch=200, read_threads=4, report_interval=60.0):
+        self.db = db
+        self.report_interval = report_interval
+        self.writer = WriteService(db, max_batch, batch_window_ms)
+        # Себестоимость новых продаж досчитывается через писателя, отчеты ее только читают
+        self.cost_updater = CostOfGoodsUpdater(
+            db, run=lambda: self.writer.submit(self.db.update_cost_of_goods).result())
+        self.readers = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix='db-reader')
+        self.started = time.time()
+        self._reports = None
+        self._report_snapshot = None
+        # Отчеты запрашиваются из нескольких потоков чтения - создаются один раз
+        self._reports_lock = threading.Lock()
+        self.routes = [
+            ('GET', ('health',), self.health),
+            ('GET', ('stats',), self.stats),
+            ('GET', ('products',), self.list_products),
+            ('POST', ('products',), self.create_product),
+            ('GET', ('products', None), self.get_product),
+            ('PATCH', ('products', None), self.update_product),
+            ('DELETE', ('products', None), self.delete_product),
+            ('GET', ('customers',), self.list_customers),
+            ('POST', ('customers',), self.create_customer),
+            ('GET', ('sales',), self.list_sales),
+            ('POST', ('sales',), self.create_sale),
+            ('POST', ('receipts',), self.create_receipt),
+            ('GET', ('supplies',), self.list_supplies),
+            ('POST', ('supplies',), self.create_supply),
+            ('GET', ('reports', None), self.report),
+        ]
+
+    @property
+    def reports(self):
+        # pandas нужен только отчетам - импортируем при первом запросе
+        with self._reports_lock:
+            if self._reports is None:
+                from reports.inventory_reports import InventoryReports
+                self._report_snapshot = ReportingSnapshot(
+                    self.db, max_age=self.report_interval, interval=self.report_interval,
+                ).start()
+                self._reports = InventoryReports(self.db, self._report_snapshot, SalesArchive())
+            return self._reports
+
+    async def read(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.readers, lambda: fn(*args, **kwargs))
+
+    async def write(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.writer.submit(fn, *args, **kwargs))
+
+    # --- Разбор параметров ---
+
+    @staticmethod
+    def _int(value, name):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise HttpError(400, f"Параметр {name} должен быть целым числом")
+
+    @staticmethod
+    def _float(value, name):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise HttpError(400, f"Параметр {name} должен быть числом")
+        if not math.isfinite(value):
+            raise HttpError(400, f"Параметр {name} должен быть числом")
+        return value
+
+    def _page_args(self, query, default_order):
+        return {
+            'offset': self._int(query.get('offset', 0), 'offset'),
+            'limit': min(self._int(query.get('limit', 200), 'limit'), 1000),
+            'order_by': query.get('order_by', default_order),
+            'descending': query.get('desc', '0') in ('1', 'true'),
+            'search': query.get('search') or None,
+        }
+
+    @staticmethod
+    def _require(body, *fields):
+        missing = [field for field in fields if body.get(field) in (None, '')]
+        if missing:
+            raise HttpError(400, f"Не заполнены поля: {', '.join(missing)}")
+
+    def _product_changes(self, body):
+        """Изменения товара из тела PATCH (только поля PRODUCT_FIELDS)"""
+        unknown = sorted(set(body) - set(PRODUCT_FIELDS))
+        if unknown:
+            raise HttpError(400, f"Нельзя изменить поля: {', '.join(unknown)}")
+        if not body:
+            raise HttpError(400, "Нет полей для изменения")
+        changes = {}
+        for field, value in body.items():
+            kind, nullable = PRODUCT_FIELDS[field]
+            if value is None:
+                if not nullable:
+                    raise HttpError(400, f"Поле {field} не может быть пустым")
+            elif kind is int:
+                value = self._int(value, field)
+            elif kind is float:
+                value = self._float(value, field)
+            elif not isinstance(value, str):
+                raise HttpError(400, f"Параметр {field} должен быть строкой")
+            changes[field] = value
+        return changes
+
+    # --- Обработчики ---
+
+    async def health(self, params, query, body):
+        return 200, {
+            'status': 'ok',
+            'uptime': round(time.time() - self.started, 1),
+            'write_commits': self.writer.commits,
+            'write_operations': self.writer.operations,
+        }
+
+    async def stats(self, params, query, body):
+        return 200, await self.read(self.db.get_dashboard_stats)
+
+    async def list_products(self, params, query, body):
+        return 200, await self.read(self.db.get_products_page, **self._page_args(query, 'id'))
+
+    async def get_product(self, params, query, body):
+        product = await self.read(self.db.get_product_by_id, self._int(params[0], 'id'))
+        if product is None:
+            raise HttpError(404, "Товар не найден")
+        return 200, product
+
+    async def create_product(self, params, query, body):
+        self._require(body, 'name', 'category', 'price')
+        try:
+            product = await self.write(
+                self.db.add_product, body['name'], body['category'], self._float(body['price'], 'price'),
+                self._int(body.get('quantity', 0), 'quantity'),
+                self._int(body.get('min_stock', 10), 'min_stock'),
+                body.get('description'), body.get('barcode')
+            )
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        return 201, product
+
+    async def update_product(self, params, query, body):
+        try:
+            updated = await self.write(self.db.update_product, self._int(params[0], 'id'),
+                                       **self._product_changes(body))
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        if not updated:
+            raise HttpError(404, "Товар не найден")
+        return 200, {'updated': True}
+
+    async def delete_product(self, params, query, body):
+        if not await self.write(self.db.delete_product, self._int(params[0], 'id')):
+            raise HttpError(404, "Товар не найден")
+        return 200, {'deleted': True}
+
+    async def list_customers(self, params, query, body):
+        return 200, await self.read(self.db.get_customers_page, **self._page_args(query, 'id'))
+
+    async def create_customer(self, params, query, body):
+        self._require(body, 'name', 'phone')
+        customer = await self.write(
+            self.db.add_customer, body['name'], body['phone'], body.get('email'),
+            self._float(body.get('discount', 0.0), 'discount')
+        )
+        return 201, customer
+
+    async def list_sales(self, params, query, body):
+        days = self._int(query.get('days', 30), 'days')
+        return 200, await self.read(self.db.get_sales_page, days=days, **self._page_args(query, 'date'))
+
+    async def create_sale(self, params, query, body):
+        self._require(body, 'product_id', 'quantity')
+        item = {
+            'product_id': self._int(body['product_id'], 'product_id'),
+            'quantity': self._int(body['quantity'], 'quantity'),
+            'customer_id': self._int(body['customer_id'], 'customer_id') if body.get('customer_id') else None,
+        }
+        # Продажи, попавшие в одну группу подряд, записываются одним record_sales_batch
+        sale = await asyncio.wrap_future(self.writer.submit_batched(self.db.record_sales_batch, item))
+        if sale is None:
+            raise HttpError(409, "Товар не найден или недостаточно на складе")
+        return 201, sale
+
+    async def create_receipt(self, params, query, body):
+        self._require(body, 'items')
+        if not isinstance(body['items'], list):
+            raise HttpError(400, "items должен быть списком строк")
+        items = []
+        for item in body['items']:
+            if not isinstance(item, dict):
+                raise HttpError(400, "Строка чека должна быть объектом с product_id и quantity")
+            self._require(item, 'product_id', 'quantity')
+            items.append({'product_id': self._int(item['product_id'], 'product_id'),
+                          'quantity': self._int(item['quantity'], 'quantity')})
+        customer_id = self._int(body['customer_id'], 'customer_id') if body.get('customer_id') else None
+        receipt = await self.write(self.db.record_receipt, items, customer_id, body.get('key'))
+        if receipt is None:
+            raise HttpError(409, "Товар не найден или недостаточно на складе")
+        return 201, receipt
+
+    async def list_supplies(self, params, query, body):
+        days = self._int(query.get('days', 30), 'days')
+        return 200, await self.read(self.db.get_supplies_page, days=days, **self._page_args(query, 'date'))
+
+    async def create_supply(self, params, query, body):
+        self._require(body, 'supplier', 'product_id', 'quantity', 'cost')
+        supply = await self.write(
+            self.db.add_supply, body['supplier'], self._int(body['product_id'], 'product_id'),
+            self._int(body['quantity'], 'quantity'), self._float(body['cost'], 'cost')
+        )
+        if supply is None:
+            raise HttpError(404, "Товар не найден")
+        return 201, supply
+
+    async def report(self, params, query, body):
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=self._int(query.get('days', 30), 'days'))
+        kind = params[0]
+        if kind == 'sales':
+            text = await self.read(self.reports.generate_sales_report, start_date, end_date)
+        elif kind == 'financial':
+            text = await self.read(self.reports.generate_financial_report, start_date, end_date)
+        elif kind == 'inventory':
+            text = await self.read(self.reports.generate_inventory_report)
+        else:
+            raise HttpError(404, f"Неизвестный отчет: {kind}")
+        return 200, {'report': text}
+
+    # --- HTTP ---
+
+    def _route(self, method, path):
+        parts = tuple(part for part in path.split('/') if part)
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            if len(pattern) != len(parts):
+                continue
+            params = []
+            for expected, actual in zip(pattern, parts):
+                if expected is None:
+                    params.append(actual)
+                elif expected != actual:
+                    break
+            else:
+                if route_method == method:
+                    return handler, params
+                allowed = True
+        raise HttpError(405 if allowed else 404, "Метод не поддерживается" if allowed else "Не найдено")
+
+    async def dispatch(self, method, target, raw_body):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            handler, params = self._route(method, url.path)
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+            except ValueError:
+                raise HttpError(400, "Тело запроса должно быть JSON")
+            if not isinstance(body, dict):
+                raise HttpError(400, "Тело запроса должно быть JSON-объектом")
+            return await handler(params, query, body)
+        except HttpError as e:
+            return e.status, {'error': e.message}
+        except Exception as e:
+            print(f"Ошибка обработки {method} {target}: {e}")
+            return 500, {'error': str(e)}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0) or 0)
+                raw_body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method.upper(), target, raw_body)
+                data = json.dumps(payload, default=to_jsonable, ensure_ascii=False).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, ready=None):
+        """Запустить сервер (ready - asyncio.Event, выставляется после bind)"""
+        self.writer.start()
+        self.cost_updater.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"API сервер слушает http://{host}:{port}")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self._report_snapshot is not None:
+                self._report_snapshot.stop()
+            self.cost_updater.stop()
+            self.writer.stop()
+            self.readers.shutdown(wait=False)
+
+
+def main(argv=None):
+    """Запуск сервера из командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Локальный HTTP/JSON API магазина (запуск из каталога Store: python -m server.api_server)")
+    parser.add_argument('--db', default='store.db', help="путь к файлу БД")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--batch-window-ms', type=float, default=5,
+                        help="сколько ждать записи для группового commit (мс)")
+    parser.add_argument('--max-batch', type=int, default=200,
+                        help="максимум записей в одном commit (1 - без группировки)")
+    parser.add_argument('--report-interval', type=float, default=60,
+                        help="как часто обновлять снимок БД для отчетов (с)")
+    args = parser.parse_args(argv)
+
+    api = ApiServer(DatabaseManager(args.db), args.batch_window_ms, args.max_batch,
+                    report_interval=args.report_interval)
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+STORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def request(reader, writer, method, path, body=None):
+    """Один HTTP-запрос по keep-alive соединению"""
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode('latin-1') + data
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    payload = json.loads(await reader.readexactly(length)) if length else None
+    return status, payload
+
+
+async def terminal(host, port, product_ids, sales, latencies, statuses):
+    """Терминал: продажи подряд по одному соединению"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(sales):
+            started = time.perf_counter()
+            status, _ = await request(reader, writer, 'POST', '/sales', {
+                'product_id': product_ids[i % len(product_ids)], 'quantity': 1
+            })
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(host, port, terminals, sales):
+    reader, writer = await asyncio.open_connection(host, port)
+    _, products = await request(reader, writer, 'GET', '/products?limit=100&order_by=quantity&desc=1')
+    _, before = await request(reader, writer, 'GET', '/health')
+    product_ids = [product['id'] for product in products]
+    if not product_ids:
+        raise SystemExit("В БД нет товаров")
+
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        terminal(host, port, product_ids[t % len(product_ids):] + product_ids[:t % len(product_ids)],
+                 sales, latencies, statuses)
+        for t in range(terminals)
+    ))
+    elapsed = time.perf_counter() - started
+
+    _, after = await request(reader, writer, 'GET', '/health')
+    writer.close()
+
+    latencies.sort()
+    total = len(latencies)
+    commits = after['write_commits'] - before['write_commits']
+    print(f"Терминалов: {terminals}, продаж: {total}, время: {elapsed:.2f} с")
+    print(f"Пропускная способность: {total / elapsed:.0f} продаж/с")
+    print(f"Задержка p50: {latencies[total // 2] * 1000:.1f} мс, "
+          f"p95: {latencies[int(total * 0.95)] * 1000:.1f} мс, "
+          f"max: {latencies[-1] * 1000:.1f} мс")
+    print(f"Коды ответов: {statuses}")
+    if commits:
+        print(f"Групповых commit: {commits}, в среднем продаж на commit: {total / commits:.1f}")
+
+
+def spawn_server(db, port, server_args):
+    """Запустить сервер на копии БД (исходный файл не меняется)"""
+    workdir = tempfile.mkdtemp(prefix='store-load-')
+    copy = os.path.join(workdir, 'store.db')
+    shutil.copy(db, copy)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'server.api_server', '--db', copy, '--port', str(port)] + server_args,
+        cwd=STORE_DIR, stdout=subprocess.DEVNULL
+    )
+    return process, workdir
+
+
+async def wait_ready(host, port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise SystemExit("Сервер не запустился")
+
+
+def main(argv=None):
+    """Нагрузочный прогон: N терминалов одновременно оформляют продажи"""
+    parser = argparse.ArgumentParser(description="Нагрузка на API сервер: продажи с N терминалов")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--terminals', type=int, default=50)
+    parser.add_argument('--sales', type=int, default=40, help="продаж на терминал")
+    parser.add_argument('--spawn', metavar='DB', help="запустить сервер на копии этой БД")
+    parser.add_argument('--max-batch', type=int, default=200,
+                        help="для --spawn: максимум продаж в commit (1 - без группировки)")
+    args = parser.parse_args(argv)
+
+    process = workdir = None
+    if args.spawn:
+        process, workdir = spawn_server(args.spawn, args.port, ['--max-batch', str(args.max_batch)])
+    try:
+        asyncio.run(wait_ready(args.host, args.port))
+        asyncio.run(run(args.host, args.port, args.terminals, args.sales))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from database.db_manager import DataChange
+
+
+class ChangeWatcher(QObject):
+    """Отслеживание изменений, сделанных другими терминалами.
+
+    Раз в interval_ms опрашивается PRAGMA data_version (дешевая проверка
+    без чтения таблиц). Если версия изменилась, после паузы debounce_ms
+    (чтобы собрать серию записей) через DbWorker читаются новые записи
+    change_log. Чужие изменения группируются по таблице и действию и
+    отправляются сигналом changed(DataChange) - так же, как собственные
+    уведомления DatabaseManager.
+    """
+
+    changed = pyqtSignal(object)
+
+    # Больше изменений за раз - таблицу проще перечитать целиком
+    MAX_ROWS = 500
+
+    def __init__(self, db, worker, interval_ms=1000, debounce_ms=300, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.worker = worker
+        self._version = None
+        self._last_change_id = 0
+        self._reload_tables = set()
+
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(interval_ms)
+        self._poll_timer.timeout.connect(self._poll)
+
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(debounce_ms)
+        self._debounce_timer.timeout.connect(self._fetch_changes)
+
+    def start(self):
+        """Начать отслеживание с текущего состояния БД"""
+        self._version = self.db.data_version()
+        self._last_change_id = self.db.get_last_change_id()
+        self._poll_timer.start()
+
+    def stop(self):
+        """Остановить отслеживание"""
+        self._poll_timer.stop()
+        self._debounce_timer.stop()
+
+    def _poll(self):
+        try:
+            version = self.db.data_version()
+        except Exception as e:
+            print(f"Ошибка проверки изменений БД: {e}")
+            return
+        if version != self._version:
+            self._version = version
+            self._debounce_timer.start()
+
+    def _fetch_changes(self):
+        self.worker.submit(self.db.get_changes_after, self._last_change_id, self.MAX_ROWS + 1,
+                           on_result=self._dispatch, key=self)
+
+    def _dispatch(self, rows):
+        if not rows and not self._reload_tables:
+            return
+        if rows:
+            self._last_change_id = rows[-1].id
+        if len(rows) > self.MAX_ROWS or self._reload_tables:
+            # Массовая запись (импорт, архивация): дочитываем журнал и
+            # перечитываем затронутые таблицы целиком
+            self._reload_tables.update(row.table_name for row in rows)
+            if len(rows) > self.MAX_ROWS:
+                self._fetch_changes()
+                return
+            for table in sorted(self._reload_tables):
+                self.changed.emit(DataChange(table, 'reload', ()))
+            self._reload_tables.clear()
+            return
+
+        # Порядок первых появлений сохраняется: вставка продажи раньше обновления товара
+        grouped = {}
+        for row in rows:
+            if row.origin == self.db.origin:
+                # Свои изменения уже применены по уведомлениям DatabaseManager
+                continue
+            ids = grouped.setdefault((row.table_name, row.action), [])
+            if row.row_id not in ids:
+                ids.append(row.row_id)
+        for (table, action), ids in grouped.items():
+            self.changed.emit(DataChange(table, action, tuple(ids)))
@@ -0,0 +1,131 @@
+import itertools
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class _TaskSignals(QObject):
+    """Сигналы задачи: результат возвращается в поток интерфейса"""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+
+
+class _Task(QRunnable):
+    """Задача пула: вызов функции БД"""
+
+    def __init__(self, request_id, fn, args, kwargs, signals, profiler=None):
+        super().__init__()
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = signals
+        self.profiler = profiler
+
+    def run(self):
+        try:
+            if self.profiler is not None:
+                result = self.profiler.runcall(self.fn, *self.args, **self.kwargs)
+            else:
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, e)
+        else:
+            self.signals.finished.emit(self.request_id, result)
+
+
+class DbWorker(QObject):
+    """Выполнение обращений к БД вне потока интерфейса.
+
+    Запросы выполняются по очереди в одном фоновом потоке (SQLite допускает
+    одного писателя, а порядок "записать - перечитать" сохраняется), а
+    результаты приходят в поток интерфейса через сигналы. Запросы с
+    одинаковым ключом, поступившие во время выполнения предыдущего,
+    схлопываются: выполняется только последний из них.
+    """
+
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _TaskSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._ids = itertools.count(1)
+        self._callbacks = {}
+        self._keys_in_flight = {}
+        self._coalesced = {}
+        # cProfile.Profile для задач фонового потока (см. ui.perf_hud)
+        self.profiler = None
+
+    def submit(self, fn, *args, on_result=None, on_error=None, key=None, **kwargs):
+        """Поставить вызов fn(*args, **kwargs) в очередь.
+
+        on_result(result) и on_error(exception) вызываются в потоке интерфейса.
+        """
+        if key is not None and key in self._keys_in_flight:
+            # Повторный запрос - выполним один раз после текущего
+            self._coalesced[key] = (fn, args, kwargs, on_result, on_error)
+            return
+        self._start(fn, args, kwargs, on_result, on_error, key)
+
+    def _start(self, fn, args, kwargs, on_result, on_error, key):
+        was_busy = self.is_busy()
+        request_id = next(self._ids)
+        self._callbacks[request_id] = (on_result, on_error, key)
+        if key is not None:
+            self._keys_in_flight[key] = request_id
+        self._pool.start(_Task(request_id, fn, args, kwargs, self._signals, self.profiler))
+        if not was_busy:
+            self.busy_changed.emit(True)
+
+    def _complete(self, request_id):
+        on_result, on_error, key = self._callbacks.pop(request_id)
+        if key is not None:
+            self._keys_in_flight.pop(key, None)
+            pending = self._coalesced.pop(key, None)
+            if pending is not None:
+                self._start(*pending, key)
+        return on_result, on_error
+
+    def _on_finished(self, request_id, result):
+        on_result, _ = self._complete(request_id)
+        try:
+            if on_result is not None:
+                on_result(result)
+        finally:
+            if not self.is_busy():
+                self.busy_changed.emit(False)
+
+    def _on_failed(self, request_id, error):
+        _, on_error = self._complete(request_id)
+        try:
+            if on_error is not None:
+                on_error(error)
+            else:
+                print(f"Ошибка фонового запроса к БД: {error}")
+        finally:
+            if not self.is_busy():
+                self.busy_changed.emit(False)
+
+    def is_busy(self):
+        """Есть ли невыполненные запросы"""
+        return bool(self._callbacks)
+
+    def wait_idle(self, msecs=-1):
+        """Дождаться завершения фоновых запросов (при выходе)"""
+        return self._pool.waitForDone(msecs)
+
+
+class DbChangeRelay(QObject):
+    """Передача уведомлений DatabaseManager (DataChange) в поток интерфейса.
+
+    Экземпляр регистрируется как слушатель БД; запись выполняется в фоновом
+    потоке, а сигнал changed доставляется получателям в потоке интерфейса.
+    """
+
+    changed = pyqtSignal(object)
+
+    def __call__(self, change):
+        self.changed.emit(change)
@@ -1,9 +1,10 @@
-import sys
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from datetime import datetime
 
+from ui.pickers import LookupPicker
+
 
 class ModernMainWindow(QMainWindow):
     def __init__(self):
@@ -57,12 +58,12 @@ class ModernMainWindow(QMainWindow):
                 background-color: white;
                 font-weight: bold;
             }
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #ddd;
                 gridline-color: #eee;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 4px;
             }
             QHeaderView::section {
@@ -202,22 +203,18 @@ class ModernMainWindow(QMainWindow):
 
         form_panel.setLayout(form_layout)
 
-        # Таблица товаров
-        self.products_table = QTableWidget()
-        self.products_table.setColumnCount(7)
-        self.products_table.setHorizontalHeaderLabels([
-            "ID", "Название", "Категория", "Цена", "Количество",
-            "Минимум", "Статус"
-        ])
-        self.products_table.setSortingEnabled(True)
+        # Таблица товаров (модель с подгрузкой задается приложением)
+        self.products_filter_input = self.create_filter_input()
+        self.products_table = self.create_table_view()
         
         # Разрешаем выбор строк
-        self.products_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.products_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.products_table.setSelectionBehavior(QTableView.SelectRows)
+        self.products_table.setSelectionMode(QTableView.SingleSelection)
 
         # Сборка вкладки
         layout.addWidget(control_panel)
         layout.addWidget(form_panel)
+        layout.addWidget(self.products_filter_input)
         layout.addWidget(self.products_table)
         tab.setLayout(layout)
 
@@ -233,7 +230,7 @@ class ModernMainWindow(QMainWindow):
         sales_layout = QGridLayout()
 
         sales_layout.addWidget(QLabel("Товар:"), 0, 0)
-        self.sale_product_combo = QComboBox()
+        self.sale_product_combo = LookupPicker()
         sales_layout.addWidget(self.sale_product_combo, 0, 1)
 
         sales_layout.addWidget(QLabel("Количество:"), 1, 0)
@@ -241,12 +238,35 @@ class ModernMainWindow(QMainWindow):
         self.sale_quantity_spin.setRange(1, 1000)
         sales_layout.addWidget(self.sale_quantity_spin, 1, 1)
 
+        self.add_to_basket_btn = QPushButton("➕ В чек")
+        sales_layout.addWidget(self.add_to_basket_btn, 1, 2)
+
         sales_layout.addWidget(QLabel("Клиент:"), 2, 0)
-        self.sale_customer_combo = QComboBox()
-        sales_layout.addWidget(self.sale_customer_combo, 2, 1)
+        self.sale_customer_combo = LookupPicker(none_text="Без клиента")
+        sales_layout.addWidget(self.sale_customer_combo, 2, 1, 1, 2)
+
+        # Корзина: строки будущего чека
+        self.basket_table = QTableWidget(0, 4)
+        self.basket_table.setHorizontalHeaderLabels(["Товар", "Количество", "Цена", "Сумма"])
+        self.basket_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.basket_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.basket_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.basket_table.verticalHeader().setVisible(False)
+        self.basket_table.setMaximumHeight(160)
+        sales_layout.addWidget(self.basket_table, 3, 0, 1, 3)
+
+        basket_buttons = QHBoxLayout()
+        self.remove_basket_line_btn = QPushButton("➖ Удалить строку")
+        basket_buttons.addWidget(self.remove_basket_line_btn)
+        self.clear_basket_btn = QPushButton("🗑️ Очистить чек")
+        basket_buttons.addWidget(self.clear_basket_btn)
+        basket_buttons.addStretch()
+        self.basket_total_label = QLabel("Итого: 0.00 ₽")
+        basket_buttons.addWidget(self.basket_total_label)
+        sales_layout.addLayout(basket_buttons, 4, 0, 1, 3)
 
         self.process_sale_btn = QPushButton("💳 Оформить продажу")
-        sales_layout.addWidget(self.process_sale_btn, 3, 0, 1, 2)
+        sales_layout.addWidget(self.process_sale_btn, 5, 0, 1, 3)
 
         sales_control.setLayout(sales_layout)
 
@@ -254,15 +274,13 @@ class ModernMainWindow(QMainWindow):
         history_header = QHBoxLayout()
         history_header.addWidget(QLabel("<b>История продаж:</b>"))
         history_header.addStretch()
+        self.sales_filter_input = self.create_filter_input()
+        history_header.addWidget(self.sales_filter_input)
         self.refresh_sales_history_btn = QPushButton("🔄 Обновить")
         history_header.addWidget(self.refresh_sales_history_btn)
 
         # История продаж
-        self.sales_history_table = QTableWidget()
-        self.sales_history_table.setColumnCount(6)
-        self.sales_history_table.setHorizontalHeaderLabels([
-            "ID", "Дата", "Товар", "Количество", "Сумма", "Клиент"
-        ])
+        self.sales_history_table = self.create_table_view()
 
         layout.addWidget(sales_control)
         layout.addLayout(history_header)
@@ -271,6 +289,21 @@ class ModernMainWindow(QMainWindow):
         tab.setLayout(layout)
         return tab
 
+    def show_basket(self, lines, totals):
+        """Показать строки корзины и итог (суммы - с учетом акций и скидки)"""
+        self.basket_table.setRowCount(len(lines))
+        for row, (line, total) in enumerate(zip(lines, totals)):
+            product = line['product']
+            values = [product.name, str(line['quantity']), f"{product.price:.2f} ₽", f"{total:.2f} ₽"]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.basket_table.setItem(row, column, item)
+        self.basket_total_label.setText(f"Итого: {sum(totals):.2f} ₽")
+        self.process_sale_btn.setText(f"💳 Оформить чек ({len(lines)} поз.)" if lines
+                                      else "💳 Оформить продажу")
+
     def create_supply_tab(self):
         """Вкладка поставок"""
         tab = QWidget()
@@ -285,7 +318,7 @@ class ModernMainWindow(QMainWindow):
         form_layout.addWidget(self.supplier_input, 0, 1)
 
         form_layout.addWidget(QLabel("Товар:"), 1, 0)
-        self.supply_product_combo = QComboBox()
+        self.supply_product_combo = LookupPicker()
         form_layout.addWidget(self.supply_product_combo, 1, 1)
 
         form_layout.addWidget(QLabel("Количество:"), 2, 0)
@@ -309,15 +342,13 @@ class ModernMainWindow(QMainWindow):
         history_header = QHBoxLayout()
         history_header.addWidget(QLabel("<b>История поставок:</b>"))
         history_header.addStretch()
+        self.supplies_filter_input = self.create_filter_input()
+        history_header.addWidget(self.supplies_filter_input)
         self.refresh_supplies_history_btn = QPushButton("🔄 Обновить")
         history_header.addWidget(self.refresh_supplies_history_btn)
 
         # История поставок
-        self.supplies_table = QTableWidget()
-        self.supplies_table.setColumnCount(6)
-        self.supplies_table.setHorizontalHeaderLabels([
-            "ID", "Дата", "Поставщик", "Товар", "Количество", "Стоимость"
-        ])
+        self.supplies_table = self.create_table_view()
 
         layout.addWidget(supply_form)
         layout.addLayout(history_header)
@@ -359,19 +390,38 @@ class ModernMainWindow(QMainWindow):
         customer_form.setLayout(form_layout)
 
         # Таблица клиентов
-        self.customers_table = QTableWidget()
-        self.customers_table.setColumnCount(5)
-        self.customers_table.setHorizontalHeaderLabels([
-            "ID", "Имя", "Телефон", "Email", "Скидка"
-        ])
+        customers_header = QHBoxLayout()
+        customers_header.addWidget(QLabel("<b>Список клиентов:</b>"))
+        customers_header.addStretch()
+        self.customers_filter_input = self.create_filter_input()
+        customers_header.addWidget(self.customers_filter_input)
+        self.customers_table = self.create_table_view()
 
         layout.addWidget(customer_form)
-        layout.addWidget(QLabel("<b>Список клиентов:</b>"))
+        layout.addLayout(customers_header)
         layout.addWidget(self.customers_table)
 
         tab.setLayout(layout)
         return tab
 
+    def create_table_view(self):
+        """Таблица на основе модели (данные подгружаются по мере прокрутки)"""
+        view = QTableView()
+        view.setSortingEnabled(True)
+        view.setAlternatingRowColors(True)
+        view.verticalHeader().setVisible(False)
+        view.horizontalHeader().setStretchLastSection(True)
+        view.setEditTriggers(QTableView.NoEditTriggers)
+        return view
+
+    def create_filter_input(self):
+        """Поле фильтра таблицы"""
+        filter_input = QLineEdit()
+        filter_input.setPlaceholderText("🔍 Поиск...")
+        filter_input.setClearButtonEnabled(True)
+        filter_input.setMaximumWidth(300)
+        return filter_input
+
     def create_reports_tab(self):
         """Вкладка отчетов"""
         tab = QWidget()
@@ -401,11 +451,13 @@ class ModernMainWindow(QMainWindow):
         self.total_profit_label = QLabel("Прибыль: ₽0")
         self.total_products_label = QLabel("Товаров на складе: 0")
         self.low_stock_label = QLabel("Товаров с низким запасом: 0")
+        self.out_of_stock_label = QLabel("Нет в наличии: 0")
 
         stats_layout.addWidget(self.total_sales_label, 0, 0)
         stats_layout.addWidget(self.total_profit_label, 0, 1)
         stats_layout.addWidget(self.total_products_label, 1, 0)
         stats_layout.addWidget(self.low_stock_label, 1, 1)
+        stats_layout.addWidget(self.out_of_stock_label, 2, 1)
 
         stats_panel.setLayout(stats_layout)
 
@@ -435,8 +487,44 @@ class ModernMainWindow(QMainWindow):
         self.timer.timeout.connect(self.update_time)
         self.timer.start(1000)
 
+        # Индикатор фоновых запросов к БД
+        self.busy_indicator = QProgressBar()
+        self.busy_indicator.setRange(0, 0)
+        self.busy_indicator.setMaximumWidth(120)
+        self.busy_indicator.setMaximumHeight(14)
+        self.busy_indicator.hide()
+        self.status_bar.addPermanentWidget(self.busy_indicator)
+
+        # Операции в локальном журнале, еще не записанные в БД
+        self.journal_label = QLabel()
+        self.journal_label.hide()
+        self.status_bar.addPermanentWidget(self.journal_label)
+
+        # Панель производительности (ui.perf_hud), по умолчанию скрыта
+        self.perf_label = QLabel()
+        self.perf_label.hide()
+        self.status_bar.addPermanentWidget(self.perf_label)
+
         self.status_bar.addPermanentWidget(self.time_label)
 
+    def set_busy(self, busy):
+        """Показать/скрыть индикатор работы с БД"""
+        self.busy_indicator.setVisible(busy)
+        self.status_bar.showMessage("Загрузка..." if busy else "Готово")
+
+    def set_journal_pending(self, count):
+        """Показать число операций, ожидающих записи в БД"""
+        self.journal_label.setText(f"📒 В журнале: {count}")
+        self.journal_label.setVisible(count > 0)
+
+    def set_perf_text(self, text):
+        """Текст панели производительности"""
+        self.perf_label.setText(text)
+
+    def set_perf_visible(self, visible):
+        """Показать/скрыть панель производительности"""
+        self.perf_label.setVisible(visible)
+
     def update_time(self):
         """Обновление времени в статус-баре"""
         current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
@@ -0,0 +1,169 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+from datetime import datetime
+
+from PyQt5.QtCore import QObject, QEvent, QTimer
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtWidgets import QShortcut
+
+# STORE_PERF_HUD=1 показывает панель производительности при запуске
+PERF_HUD_ENV = 'STORE_PERF_HUD'
+# Каталог дампов профилировщика
+PROFILES_PATH = 'profiles'
+# Действие считается завершенным, если фоновые запросы не выполнялись столько мс
+SETTLE_MS = 300
+
+
+def process_memory():
+    """Резидентная память процесса в байтах (None, если узнать нельзя)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PerfHud(QObject):
+    """Панель производительности в статус-баре.
+
+    Действием считается нажатие мыши или клавиши вместе со всеми запросами к
+    БД, которые оно вызвало: действие завершается, когда DbWorker простаивает
+    SETTLE_MS. Для последнего действия показываются полное время, время в БД,
+    число запросов и доля попаданий в кэш скомпилированных запросов (по данным
+    perf.instrumentation, если она включена) и память процесса.
+
+    Ctrl+Shift+H - показать/скрыть панель, Ctrl+Shift+P - записать профиль
+    cProfile следующего действия (поток интерфейса и фоновый поток БД) в
+    каталог profiles.
+    """
+
+    def __init__(self, app, main_window, worker, instrumentation, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+        self.worker = worker
+        self.instrumentation = instrumentation
+        self._action = None
+        self._armed = False
+        self._profilers = None
+
+        self._settle_timer = QTimer(self)
+        self._settle_timer.setSingleShot(True)
+        self._settle_timer.setInterval(SETTLE_MS)
+        self._settle_timer.timeout.connect(self._finish_action)
+        worker.busy_changed.connect(self._on_busy_changed)
+
+        QShortcut(QKeySequence("Ctrl+Shift+H"), main_window, self.toggle)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), main_window, self.arm_profiler)
+        app.installEventFilter(self)
+
+        main_window.set_perf_visible(bool(os.environ.get(PERF_HUD_ENV)))
+        main_window.set_perf_text(self._idle_text())
+
+    def toggle(self):
+        """Показать/скрыть панель"""
+        self.main_window.set_perf_visible(not self.main_window.perf_label.isVisible())
+
+    def arm_profiler(self):
+        """Профилировать следующее действие"""
+        self._armed = True
+        self.main_window.status_bar.showMessage("Профилирование следующего действия...", 5000)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.MouseButtonPress or \
+                (event.type() == QEvent.KeyPress and not event.isAutoRepeat()):
+            # Одно нажатие приходит окну и родительским виджетам - учитываем первое
+            key = (event.type(), event.timestamp())
+            if self._action is None or self._action['event'] != key:
+                self._start_action(key)
+        return False
+
+    def _start_action(self, key):
+        if self._action is not None:
+            self._finish_action()
+        self._action = {
+            'event': key,
+            'started': time.perf_counter(),
+            'ended': None,
+            'totals': self.instrumentation.totals() if self.instrumentation.enabled else None,
+        }
+        if self._armed:
+            self._armed = False
+            self._profilers = (cProfile.Profile(), cProfile.Profile())
+            self.worker.profiler = self._profilers[1]
+            self._profilers[0].enable()
+        # Обработчик нажатия выполнится до этого таймера; если он поставил
+        # запросы в DbWorker, завершение отложится до их выполнения
+        QTimer.singleShot(0, self._on_event_handled)
+
+    def _on_event_handled(self):
+        if self._action is not None and not self.worker.is_busy():
+            self._action['ended'] = time.perf_counter()
+            self._settle_timer.start()
+
+    def _on_busy_changed(self, busy):
+        if self._action is None:
+            return
+        if busy:
+            self._settle_timer.stop()
+        else:
+            self._action['ended'] = time.perf_counter()
+            self._settle_timer.start()
+
+    def _finish_action(self):
+        action, self._action = self._action, None
+        self._settle_timer.stop()
+        if action is None:
+            return
+        ended = action['ended'] or time.perf_counter()
+        if self._profilers is not None:
+            self._dump_profile()
+        parts = [f"⏱ {(ended - action['started']) * 1000:.0f} мс"]
+        if action['totals'] is not None:
+            before, after = action['totals'], self.instrumentation.totals()
+            queries = after['queries'] - before['queries']
+            parts.append(f"БД {(after['db_time'] - before['db_time']) * 1000:.0f} мс, {queries} запр.")
+            hits = after['cache_hits'] - before['cache_hits']
+            lookups = hits + after['cache_misses'] - before['cache_misses']
+            parts.append(f"кэш {hits * 100 / lookups:.0f}%" if lookups else "кэш -")
+        parts.append(self._memory_text())
+        self.main_window.set_perf_text(" | ".join(parts))
+
+    def _dump_profile(self):
+        gui_profiler, worker_profiler = self._profilers
+        self._profilers = None
+        gui_profiler.disable()
+        self.worker.profiler = None
+        try:
+            stats = pstats.Stats(gui_profiler)
+            try:
+                stats.add(worker_profiler)
+            except TypeError:
+                # Фоновых запросов не было - профиль потока БД пуст
+                pass
+            os.makedirs(PROFILES_PATH, exist_ok=True)
+            path = os.path.join(PROFILES_PATH, datetime.now().strftime("action-%Y%m%d-%H%M%S"))
+            stats.dump_stats(path + '.prof')
+            text = io.StringIO()
+            pstats.Stats(path + '.prof', stream=text).sort_stats('cumulative').print_stats(40)
+            with open(path + '.txt', 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+        except (OSError, TypeError) as e:
+            self.main_window.status_bar.showMessage(f"Ошибка сохранения профиля: {e}", 5000)
+            return
+        self.main_window.status_bar.showMessage(f"Профиль действия сохранен в {path}.prof", 10000)
+
+    def _idle_text(self):
+        return f"⏱ - | {self._memory_text()}"
+
+    @staticmethod
+    def _memory_text():
+        memory = process_memory()
+        return f"ОЗУ {memory / 1024 / 1024:.0f} МБ" if memory is not None else "ОЗУ -"
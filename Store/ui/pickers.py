@@ -0,0 +1,119 @@
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QComboBox, QCompleter
+
+
+class LookupPicker(QComboBox):
+    """Комбобокс с поиском по мере ввода.
+
+    Вместо полного списка в комбобоксе держатся только лучшие совпадения
+    (limit строк): при вводе текста с задержкой выполняется запрос
+    search(text, limit) через DbWorker, и список заменяется результатами.
+    API выбора прежний: currentIndex()/itemData(), а также current_id().
+    """
+
+    SEARCH_DELAY_MS = 200
+    LIMIT = 50
+
+    def __init__(self, none_text=None, parent=None):
+        super().__init__(parent)
+        # Пункт "ничего не выбрано" (например, "Без клиента") всегда первый
+        self._none_text = none_text
+        self._search = None
+        self._display = None
+        self._worker = None
+        self._query = ""
+        # Строки показанных записей по ID
+        self._rows = {}
+
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.NoInsert)
+        self.setMaxVisibleItems(15)
+
+        # Список уже отфильтрован в БД - комплитер ищет по подстроке среди совпадений
+        completer = QCompleter(self.model(), self)
+        completer.setCompletionMode(QCompleter.PopupCompletion)
+        completer.setFilterMode(Qt.MatchContains)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.setCompleter(completer)
+
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self._search_timer.timeout.connect(self.reload)
+        self.lineEdit().textEdited.connect(self._on_text_edited)
+
+    def set_source(self, search, display, worker=None):
+        """Задать поиск search(text, limit) -> строки и текст строки display(row)"""
+        self._search = search
+        self._display = display
+        self._worker = worker
+
+    def _on_text_edited(self, text):
+        self._query = text.strip()
+        self._search_timer.start()
+
+    def reload(self):
+        """Перечитать совпадения для текущего текста"""
+        self._search_timer.stop()
+        if self._search is None:
+            return
+        if self._worker is None:
+            self._fill(self._search(self._query, self.LIMIT))
+        else:
+            self._worker.submit(self._search, self._query, self.LIMIT,
+                                on_result=self._fill, key=self)
+
+    def _fill(self, rows):
+        typing = self.lineEdit().hasFocus() and bool(self._query)
+        text = self.lineEdit().text()
+        cursor = self.lineEdit().cursorPosition()
+
+        self.blockSignals(True)
+        self.clear()
+        if self._none_text is not None:
+            self.addItem(self._none_text, None)
+        self._rows = {row.id: row for row in rows}
+        for row in rows:
+            self.addItem(self._display(row), row.id)
+        if typing:
+            # Сохраняем вводимый текст - выбор делается из всплывающего списка
+            self.setCurrentIndex(-1)
+            self.lineEdit().setText(text)
+            self.lineEdit().setCursorPosition(cursor)
+        self.blockSignals(False)
+
+        if typing and rows:
+            self.completer().setCompletionPrefix(text)
+            self.completer().complete()
+
+    def has_selection(self):
+        """Выбрана ли запись из списка (а не просто введен текст)"""
+        index = self.currentIndex()
+        return index >= 0 and self.itemText(index) == self.currentText()
+
+    def current_id(self):
+        """ID выбранной записи или None"""
+        if not self.has_selection():
+            return None
+        return self.itemData(self.currentIndex())
+
+    def current_row(self):
+        """Строка выбранной записи (как её вернул search) или None"""
+        return self._rows.get(self.current_id())
+
+    def patch_items(self, ids, texts, rows=None):
+        """Обновить тексты показанных записей; отсутствующие в texts удалить.
+
+        rows - новые строки записей по ID (для current_row).
+        """
+        for item_id in ids:
+            index = self.findData(item_id)
+            if index < 0:
+                continue
+            if item_id in texts:
+                self.setItemText(index, texts[item_id])
+                if rows and item_id in rows:
+                    self._rows[item_id] = rows[item_id]
+            else:
+                self.removeItem(index)
+                self._rows.pop(item_id, None)
@@ -0,0 +1,324 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer, pyqtSignal
+
+
+class TableColumn:
+    """Колонка ленивой таблицы: заголовок, ключ сортировки в SQL и форматирование"""
+
+    def __init__(self, header, sort_key, display, align=None):
+        self.header = header
+        self.sort_key = sort_key
+        self.display = display
+        self.align = align
+
+
+def product_status(quantity, min_stock):
+    """Статус товара по остатку"""
+    if quantity == 0:
+        return "❌ Нет в наличии"
+    elif quantity < min_stock:
+        return "⚠️ Низкий запас"
+    return "✅ В наличии"
+
+
+_RIGHT = Qt.AlignRight | Qt.AlignVCenter
+
+PRODUCT_COLUMNS = [
+    TableColumn("ID", 'id', lambda r: str(r.id)),
+    TableColumn("Название", 'name', lambda r: r.name),
+    TableColumn("Категория", 'category', lambda r: r.category.value),
+    TableColumn("Цена", 'price', lambda r: f"{r.price:.2f} ₽", _RIGHT),
+    TableColumn("Количество", 'quantity', lambda r: str(r.quantity), _RIGHT),
+    TableColumn("Минимум", 'min_stock', lambda r: str(r.min_stock), _RIGHT),
+    TableColumn("Статус", 'status', lambda r: product_status(r.quantity, r.min_stock)),
+]
+
+SALE_COLUMNS = [
+    TableColumn("ID", 'id', lambda r: str(r.id)),
+    TableColumn("Дата", 'date', lambda r: r.date.strftime("%d.%m.%Y %H:%M")),
+    TableColumn("Товар", 'product', lambda r: r.product_name or f"Товар ID:{r.product_id}"),
+    TableColumn("Количество", 'quantity', lambda r: str(r.quantity), _RIGHT),
+    TableColumn("Сумма", 'total', lambda r: f"{r.total:.2f} ₽", _RIGHT),
+    TableColumn("Клиент", 'customer', lambda r: (
+        "Без клиента" if r.customer_id is None
+        else r.customer_name or f"Клиент ID:{r.customer_id}"
+    )),
+    TableColumn("Чек", 'receipt', lambda r: f"№{r.receipt_id}" if r.receipt_id else ""),
+]
+
+SUPPLY_COLUMNS = [
+    TableColumn("ID", 'id', lambda r: str(r.id)),
+    TableColumn("Дата", 'date', lambda r: r.date.strftime("%d.%m.%Y %H:%M")),
+    TableColumn("Поставщик", 'supplier', lambda r: r.supplier),
+    TableColumn("Товар", 'product', lambda r: r.product_name or f"Товар ID:{r.product_id}"),
+    TableColumn("Количество", 'quantity', lambda r: str(r.quantity), _RIGHT),
+    TableColumn("Стоимость", 'cost', lambda r: f"{r.cost:.2f} ₽", _RIGHT),
+]
+
+CUSTOMER_COLUMNS = [
+    TableColumn("ID", 'id', lambda r: str(r.id)),
+    TableColumn("Имя", 'name', lambda r: r.name),
+    TableColumn("Телефон", 'phone', lambda r: r.phone),
+    TableColumn("Email", 'email', lambda r: r.email or ""),
+    TableColumn("Скидка", 'discount', lambda r: f"{r.discount}%", _RIGHT),
+]
+
+
+class LazyTableModel(QAbstractTableModel):
+    """Модель таблицы с постраничной подгрузкой из БД.
+
+    Представление запрашивает следующую страницу через canFetchMore/fetchMore
+    по мере прокрутки. Сортировка и фильтр выполняются в SQL: при их смене
+    модель сбрасывается и загружает первую страницу заново. Если задан
+    worker (DbWorker), все страницы читаются в фоновом потоке.
+
+    После записи в БД apply_change() точечно обновляет загруженные строки
+    (fetch_rows(ids, search) читает их по ID) вместо полной перезагрузки.
+    """
+
+    PAGE_SIZE = 200
+    FILTER_DELAY_MS = 250
+
+    # Первая страница загружена
+    refreshed = pyqtSignal()
+
+    # Ключи сортировки, по которым новые записи оказываются в конце списка
+    APPEND_ORDER = ('id', 'date')
+
+    def __init__(self, columns, fetch_page, count_rows, order_by='id', descending=False,
+                 worker=None, fetch_rows=None, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self._worker = worker
+        self._fetch_page = fetch_page
+        self._count_rows = count_rows
+        self._fetch_rows = fetch_rows
+        self._rows = []
+        self._total = 0
+        self._order_by = order_by
+        self._descending = descending
+        self._filter = ""
+        # Сортировка и фильтр загруженных строк (order_by, descending, search)
+        self._query = (order_by, descending, None)
+        # Следующая страница уже запрошена у worker
+        self._fetching = False
+        # Номер загрузки первой страницы: страницы, запрошенные до сброса модели, отбрасываются
+        self._generation = 0
+
+        # Фильтр применяется с задержкой, чтобы не запрашивать БД на каждую букву
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(self.FILTER_DELAY_MS)
+        self._filter_timer.timeout.connect(self.refresh)
+
+    # --- QAbstractTableModel ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = self.columns[index.column()]
+        if role == Qt.DisplayRole:
+            return column.display(self._rows[index.row()])
+        if role == Qt.TextAlignmentRole and column.align is not None:
+            return column.align
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section].header
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._fetching and len(self._rows) < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._fetching:
+            return
+        if self._worker is None:
+            self._append_page(self._load(len(self._rows), *self._query))
+            return
+        self._fetching = True
+        generation = self._generation
+        self._worker.submit(self._load, len(self._rows), *self._query,
+                            on_result=lambda rows: self._on_page(generation, rows),
+                            on_error=lambda error: self._on_page_error(generation, error),
+                            key=(self, 'page'))
+
+    def _on_page(self, generation, rows):
+        if generation != self._generation:
+            # Модель сброшена, пока страница читалась
+            return
+        self._fetching = False
+        # Строки, уже добавленные точечными обновлениями (apply_change), не дублируем
+        loaded = {row.id for row in self._rows}
+        fresh = [row for row in rows if row.id not in loaded]
+        if rows and not fresh:
+            return
+        self._append_page(fresh)
+
+    def _on_page_error(self, generation, error):
+        if generation == self._generation:
+            self._fetching = False
+        print(f"Ошибка загрузки страницы таблицы: {error}")
+
+    def _append_page(self, rows):
+        if not rows:
+            # Строки удалены другим терминалом - больше подгружать нечего
+            self._total = len(self._rows)
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._order_by = self.columns[column].sort_key
+        self._descending = order == Qt.DescendingOrder
+        self.refresh()
+
+    # --- Загрузка ---
+
+    def _load(self, offset, order_by, descending, search):
+        """Страница строк с offset (может выполняться в фоне)"""
+        return self._fetch_page(
+            offset=offset,
+            limit=self.PAGE_SIZE,
+            order_by=order_by,
+            descending=descending,
+            search=search
+        )
+
+    def _query_first_page(self, order_by, descending, search):
+        """Количество строк и первая страница (может выполняться в фоне)"""
+        total = self._count_rows(search=search)
+        rows = self._fetch_page(
+            offset=0, limit=self.PAGE_SIZE, order_by=order_by,
+            descending=descending, search=search
+        ) if total else []
+        return total, rows, (order_by, descending, search)
+
+    def _apply_first_page(self, result):
+        self._generation += 1
+        self._fetching = False
+        self.beginResetModel()
+        self._total, self._rows, self._query = result
+        self.endResetModel()
+        self.refreshed.emit()
+
+    def refresh(self):
+        """Перечитать первую страницу с текущими сортировкой и фильтром"""
+        self._filter_timer.stop()
+        args = (self._order_by, self._descending, self._filter or None)
+        if self._worker is None:
+            self._apply_first_page(self._query_first_page(*args))
+        else:
+            self._worker.submit(self._query_first_page, *args,
+                                on_result=self._apply_first_page, key=self)
+
+    # --- Точечные обновления ---
+
+    def _run(self, fn, *args, on_result):
+        if self._worker is None:
+            on_result(fn(*args))
+        else:
+            self._worker.submit(fn, *args, on_result=on_result)
+
+    def _row_position(self, row_id):
+        for position, row in enumerate(self._rows):
+            if row.id == row_id:
+                return position
+        return None
+
+    def apply_change(self, change):
+        """Применить изменение строк (database.db_manager.DataChange)"""
+        if self._fetch_rows is None or change.action == 'reload':
+            self.refresh()
+            return
+        if change.action == 'delete':
+            self._remove_rows(change.ids)
+        elif change.action == 'update':
+            loaded = [row_id for row_id in change.ids if self._row_position(row_id) is not None]
+            if loaded:
+                self._run(self._fetch_rows, loaded, self._filter or None,
+                          on_result=lambda rows: self._update_rows(loaded, rows))
+        elif change.action == 'insert':
+            if self._order_by not in self.APPEND_ORDER:
+                # Место новой строки определяется сортировкой - проще перечитать
+                self.refresh()
+                return
+            self._run(self._fetch_rows, list(change.ids), self._filter or None,
+                      on_result=self._insert_rows)
+
+    def _remove_rows(self, ids):
+        removed = False
+        for row_id in ids:
+            position = self._row_position(row_id)
+            if position is None:
+                continue
+            self.beginRemoveRows(QModelIndex(), position, position)
+            del self._rows[position]
+            self.endRemoveRows()
+            self._total -= 1
+            removed = True
+        if not removed and len(self._rows) < self._total:
+            # Строка была на незагруженной странице - смещения страниц сдвинулись
+            self.refresh()
+
+    def _update_rows(self, ids, rows):
+        fresh = {row.id: row for row in rows}
+        for row_id in ids:
+            position = self._row_position(row_id)
+            if position is None:
+                continue
+            if row_id not in fresh:
+                # Строка больше не подходит под фильтр
+                self._remove_rows((row_id,))
+                continue
+            self._rows[position] = fresh[row_id]
+            self.dataChanged.emit(self.index(position, 0),
+                                  self.index(position, len(self.columns) - 1))
+
+    def _insert_rows(self, rows):
+        rows = [row for row in rows if self._row_position(row.id) is None]
+        if not rows:
+            return
+        all_loaded = len(self._rows) >= self._total
+        self._total += len(rows)
+        rows.sort(key=lambda row: getattr(row, self._order_by), reverse=self._descending)
+        if self._descending:
+            position = 0
+        elif all_loaded:
+            position = len(self._rows)
+        else:
+            # Новые записи в конце - попадут в модель при прокрутке (fetchMore)
+            return
+        self.beginInsertRows(QModelIndex(), position, position + len(rows) - 1)
+        self._rows[position:position] = rows
+        self.endInsertRows()
+
+    def set_filter(self, text):
+        """Задать текст фильтра (применяется с задержкой)"""
+        self._filter = text.strip()
+        self._filter_timer.start()
+
+    def sort_column(self):
+        """Номер колонки текущей сортировки"""
+        for position, column in enumerate(self.columns):
+            if column.sort_key == self._order_by:
+                return position
+        return 0
+
+    def sort_order(self):
+        return Qt.DescendingOrder if self._descending else Qt.AscendingOrder
+
+    def row_id(self, row):
+        """ID записи в строке"""
+        return self._rows[row].id
+
+    def total_count(self):
+        """Количество записей с учетом фильтра"""
+        return self._total